@@ -0,0 +1,685 @@
+"""動画解析のメインループ（状態遷移）
+"""
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Callable, TextIO
+
+from constants import Constants as C
+from analyze_video import AnalyzeVideo
+from analyzed_video_data import AnalyzedVideoData, MatchResult
+from analyzed_statistics import AnalyzedStatistics
+from checkpoint import AnalysisCheckpoint
+from event_sink import EventSink
+from prescan import PreScan
+from sample_scheduler import SampleScheduler
+
+
+def init_analysis(analyze: AnalyzeVideo, file_path: str):
+    """解析開始前に処理データ・統計情報を初期化する
+
+    Args:
+        analyze (AnalyzeVideo): file_open() 済みの動画解析クラス
+        file_path (str): 動画ファイルのパス
+
+    Returns:
+        AnalyzedVideoData: 処理データ
+        AnalyzedStatistics: 処理結果統計情報
+    """
+    # 処理データクラス初期化
+    video_data = AnalyzedVideoData()
+    video_data.totalframes = analyze.get_totalframes()
+    video_data.set_fps( analyze.get_fps() )
+
+    # 統計情報クラス初期化
+    astats = AnalyzedStatistics()
+    astats.file_name   = os.path.basename(file_path)
+    astats.totalframes = analyze.get_totalframes()
+    astats.fps         = analyze.get_fps()
+    astats.starttime   = datetime.now()
+
+    return video_data, astats
+
+
+class AnalyzeRunner:
+    """動画解析のメインループ（状態遷移）を実行するクラス
+
+    GUI 版・CLI 版のどちらからも同じ処理を使えるように、ウィンドウ操作には依存しない。
+    キャンセル判定やプログレスバーの更新は on_progress コールバックで行う。
+
+    Attributes:
+        analyze (AnalyzeVideo): 動画解析クラス
+        video_data (AnalyzedVideoData): 処理データ
+        astats (AnalyzedStatistics): 処理結果統計情報
+        out (TextIO): コンソール出力先（None なら出力しない）
+        on_progress (Callable[[AnalyzedVideoData], bool]): 進捗通知。False を返すとキャンセル
+        progress_interval (float): 進捗表示の最短間隔（秒）。0 なら進捗率が変わる度に表示
+        snap_keyframes (bool): 優先度の低い画面（その他・試合中）では、近くのキーフレームを解析するか
+        refine (bool): 全ての画面を粗い間隔で解析し、キャラクター選択画面の終了・試合開始・試合終了の
+                       フレームを二分探索で求めるか
+        prefetch (int): デコード用スレッドで先読みするフレーム数の上限（0 なら先読みしない）
+        prescan (PreScan): 事前走査。run() の最初に動画全体を粗い間隔で走査し、変化の無い区間では
+                           判定結果を使い回す（事前走査しなければ None）
+        scheduler (SampleScheduler): 次に解析するフレームまでの間隔を決める。predict が有効なら、
+                                     学習した継続時間から間隔を延ばす
+        checkpoint (AnalysisCheckpoint): 途中経過の保存先（None なら保存しない）
+        checkpoint_interval (float): 途中経過を保存する間隔（動画時間の秒）
+        on_match (Callable[[MatchResult], None]): 試合が決着する度に呼ぶ関数（None なら呼ばない）
+        events (EventSink): 検出したイベントの出力先（None なら出力しない）
+    """
+
+    # キーフレームに寄せてよい状態（skips のキー）。その他画面、試合中
+    SNAP_SKIP_KEYS = (0, 4)
+
+    # 状態（skips のキー）ごとの、間隔を延ばしてよい画面。延ばした先もこの画面なら状態が続いているとみなす
+    PREDICT_SCREENS = {
+        0: (C.STAT.SCRN_OTHERS,),
+        2: (C.STAT.SCRN_OTHERS, C.STAT.SCRN_BLACKOUT, C.STAT.SCRN_MATCHVALID),
+        4: (C.STAT.SCRN_MATCHINVALID, C.STAT.SCRN_MATCHVALID),
+        5: (C.STAT.SCRN_BLACKOUT,),
+    }
+
+
+    def __init__(self, analyze: AnalyzeVideo, video_data: AnalyzedVideoData, astats: AnalyzedStatistics,
+                 out: TextIO = sys.stdout, on_progress: Callable[[AnalyzedVideoData], bool] = None,
+                 progress_interval: float = 0.0, snap_keyframes: bool = False, refine: bool = False,
+                 prefetch: int = 0, checkpoint: AnalysisCheckpoint = None,
+                 checkpoint_interval: float = C.CHECKPOINT.INTERVAL,
+                 on_match: Callable[[MatchResult], None] = None, events: EventSink = None,
+                 prescan: bool = False, predict: bool = False):
+        """コンストラクタ
+        """
+        self.analyze = analyze
+        self.video_data = video_data
+        self.astats = astats
+        self.out = out
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.snap_keyframes = snap_keyframes
+        self.refine = refine
+        self.checkpoint = checkpoint
+        self.checkpoint_interval = checkpoint_interval
+        self.on_match = on_match
+        self.events = events
+        self.prescan = PreScan(video_data.fps) if prescan else None
+        self.scheduler = SampleScheduler(video_data.fps, refine, predict)
+
+        # 途中経過は動画時間で一定間隔ごとに保存する
+        self._checkpoint_intvl = max(1, int(video_data.fps * checkpoint_interval))
+        self._checkpoint_fno = video_data.frame_no
+        if checkpoint is not None and checkpoint.get_frame_no() is None:
+            checkpoint.capture(video_data, astats)
+
+        # 最後にイベントを出力した獲得フラッグ数
+        self._last_flags = None
+
+        # 直前に解析したフレーム番号と画面（二分探索の範囲）
+        self._prev_fno = None
+        self._prev_screen = None
+
+        # refine が有効なら、キャラクター選択画面・残り１フラッグも粗い間隔にする
+        video_data.skip = self.scheduler.skips[video_data.skip_key]
+
+        if prefetch > 0:
+            # 以降のフレームの読み込みはデコード用スレッドで行う（file_close() で終了）
+            analyze.start_prefetch(prefetch)
+
+        self._progress_time = 0.0
+        self._is_tty = bool(out is not None and hasattr(out, 'isatty') and out.isatty())
+
+
+    def _print(self, text: str = '') -> None:
+        """コンソールに1行出力する
+
+        Args:
+            text (str): 出力する文字列
+        """
+        if self.out is not None:
+            print(text, file=self.out)
+
+
+    def _write(self, text: str) -> None:
+        """コンソールに改行なしで出力する
+
+        Args:
+            text (str): 出力する文字列
+        """
+        if self.out is not None:
+            self.out.write(text)
+            self.out.flush()
+
+
+    def _emit(self, event: str, frame_no: int, **fields) -> None:
+        """イベントを出力する（events が無ければ何もしない）
+
+        Args:
+            event (str): イベント名
+            frame_no (int): イベントのフレーム番号
+            **fields: イベントごとの項目
+        """
+        if self.events is not None:
+            self.events.emit(event, frame_no, **fields)
+
+
+    def _show_progress(self, progress_pct_prev: float) -> None:
+        """コンソールに進捗を出力する
+
+        Args:
+            progress_pct_prev (float): 前回の進捗率
+        """
+        video_data = self.video_data
+        # 総フレーム数が不明（書き込み中の動画）なら、進捗率は変わらないので間隔だけで判定する
+        if video_data.totalframes > 0 and video_data.progress.pct <= progress_pct_prev:
+            return
+
+        if self.progress_interval > 0:
+            now = time.monotonic()
+            if now - self._progress_time < self.progress_interval:
+                return
+            self._progress_time = now
+
+        if self._is_tty or self.progress_interval <= 0:
+            self._write(f'\r{video_data.progress.txt}{video_data.stat_text}')
+        else:
+            # 端末以外（ログファイルなど）には1行ずつ出力する
+            self._print(f'{video_data.progress.txt}{video_data.stat_text}')
+
+
+    def next_frame(self):
+        """次に解析するフレーム番号を返す
+
+        現在のフレーム番号より大きい、スキップ間隔の倍数のうち最小のもの。
+        scheduler が間隔を延ばした場合は、その倍数だけ先のもの。
+        snap_keyframes が有効で優先度の低い画面の場合は、近くにキーフレームがあればそれを返す
+
+        Returns:
+            int: フレーム番号
+            int: スキップ間隔の倍数（1 なら延ばしていない）
+        """
+        video_data = self.video_data
+        skip = video_data.skip
+        jump = self.scheduler.plan(video_data.frame_no)
+        frame_no = (video_data.frame_no // skip + jump) * skip
+
+        if self.snap_keyframes and video_data.skip_key in self.SNAP_SKIP_KEYS:
+            # キーフレームはシーク後すぐにデコードできるので安い
+            frame_no = self.analyze.snap_to_keyframe(frame_no, int(skip * C.PROC_SPD.SNAP_KEYFRAME),
+                                                     video_data.frame_no + 1)
+
+        return frame_no, jump
+
+
+    def step(self) -> bool:
+        """次のフレームに移動して1フレーム分解析する
+
+        Returns:
+            bool: 解析できればTrue、動画の終端に達したかキャンセルされたらFalse
+        """
+        video_data = self.video_data
+        frame_no, jump = self.next_frame()
+
+        # 指定したフレーム番号に飛ぶ。次も同じ間隔で解析する予定として先読みさせる
+        ret = self.analyze.set_frame(frame_no, video_data.skip * jump)
+        if jump > 1:
+            hit = ret and self.is_same_state()
+            self.scheduler.confirm(jump, hit)
+            if not hit:
+                # 予測が外れた（飛ばしたフレームで状態が変わった可能性がある）ので、
+                # 飛ばしたフレームから基本の間隔で解析し直す
+                frame_no, _ = self.next_frame()
+                ret = self.analyze.set_frame(frame_no, video_data.skip)
+        if not ret:
+            return False
+
+        progress_pct_prev = video_data.progress.pct
+        video_data.set_progress(frame_no)
+
+        # キャンセル判定、プログレスバーの更新
+        if self.on_progress is not None and not self.on_progress(video_data):
+            # キャンセルフラグ
+            video_data.is_cancel = True
+            return False
+
+        # コンソール出力
+        self._show_progress(progress_pct_prev)
+        if self.events is not None:
+            self.events.flush_if_due()
+
+        self.process_frame(frame_no)
+
+        if self.checkpoint is not None:
+            self.checkpoint.capture(video_data, self.astats)
+            if frame_no - self._checkpoint_fno >= self._checkpoint_intvl:
+                self.checkpoint.save()
+                self._checkpoint_fno = frame_no
+
+        return True
+
+
+    def run(self, stop_fno: int = None) -> bool:
+        """メインループ
+
+        動画の終端に達するか、キャンセルされるまで解析を続ける。
+        checkpoint があれば、キャンセル・中断時は途中経過を保存し、終端まで解析したら削除する
+
+        Args:
+            stop_fno (int): このフレーム番号以降を解析したら終了する（None なら動画の終端まで）
+
+        Returns:
+            bool: 動画の終端に達したかキャンセルされたらFalse、stop_fno で終了したらTrue
+        """
+        stopped = False
+        try:
+            # 事前走査がキャンセルされたら、解析しない
+            if self.prescan is None or self.prescan.done or self.run_prescan():
+                while self.step():
+                    if stop_fno is not None and self.video_data.frame_no >= stop_fno:
+                        stopped = True
+                        break
+        except BaseException:
+            # 中断（Ctrl+C）・例外の場合も、解析を終えたフレームまでの途中経過を保存する
+            if self.checkpoint is not None:
+                self.checkpoint.save()
+            raise
+
+        if self.checkpoint is not None:
+            if self.video_data.is_cancel:
+                self.checkpoint.save()
+            elif not stopped:
+                # 動画の終端まで解析したので、途中経過は不要
+                self.checkpoint.remove()
+
+        # 判定結果の再利用回数・計算回数を統計情報に反映する
+        self.astats.cnt_feature_hit  = self.analyze.feature_counter.hit
+        self.astats.cnt_feature_miss = self.analyze.feature_counter.miss
+        self.astats.cnt_decoded      = self.analyze.feature_counter.decoded
+        self.astats.cnt_name_buffer  = self.analyze.cnt_name_buffer
+        self.astats.cnt_name_seek    = self.analyze.cnt_name_seek
+        self.astats.prefetch_stats   = self.analyze.prefetch_stats
+        self.astats.stage_stats      = self.analyze.stage_stats
+        self.astats.roi_cache_stats  = self.analyze.frame_cache.stats
+        self.astats.cascade_stats    = self.analyze.screen_cascade.stats
+        if self.scheduler.predict:
+            self.astats.scheduler_stats = self.scheduler.stats
+        if self.prescan is not None:
+            self.astats.prescan_stats = self.prescan.stats
+        if self.analyze.feature_store is not None:
+            self.astats.cnt_cache_replay = self.analyze.feature_store.cnt_replay
+        return stopped
+
+
+    def run_prescan(self) -> bool:
+        """事前走査を行い、以降の解析で変化の無い区間の判定結果を使い回す
+
+        Returns:
+            bool: 最後まで走査したらTrue、キャンセルされたらFalse
+        """
+        video_data = self.video_data
+        stat_text, frame_no = video_data.stat_text, video_data.frame_no
+        video_data.stat_text = '事前走査　　　　　　'
+
+        def on_sample(fno: int) -> bool:
+            progress_pct_prev = video_data.progress.pct
+            video_data.set_progress(fno)
+            if self.on_progress is not None and not self.on_progress(video_data):
+                video_data.is_cancel = True
+                return False
+            self._show_progress(progress_pct_prev)
+            return True
+
+        completed = self.prescan.run(self.analyze, on_sample)
+        video_data.stat_text = stat_text
+        video_data.set_progress(frame_no)
+        if not completed:
+            return False
+
+        stats = self.prescan.stats
+        self._write('\r                                          \r')
+        self._print(f'事前走査：{stats.cnt_sample} フレーム（{stats.elapsed:.1f} 秒）')
+        self.analyze.prescan = self.prescan
+        return True
+
+
+    def process_frame(self, frame_no: int) -> None:
+        """現在のフレームのステータスを判定し、状態遷移させる
+
+        Args:
+            frame_no (int): 現在のフレーム番号（AnalyzeVideo.set_frame() 済みであること）
+        """
+        analyze = self.analyze
+        video_data = self.video_data
+        video_data.frame_no = frame_no
+
+        # 現在のステータス（どの画面か）を取得
+        screen = analyze.get_screen()
+
+        if self.refine and self._prev_screen is not None:
+            # 直前のフレームとの間で終わった画面を処理する
+            self.refine_prev_screen(frame_no, screen)
+
+        if screen == C.STAT.SCRN_CHARASELECT:
+            # キャラクターセレクト画面
+            # キャラクターセレクト画面である間は、「キャラ決定時のフレーム番号」を（現在のフレーム番号）で更新し続ける
+            video_data.mdata.fno_eofcharasel = frame_no
+            video_data.mstat = C.STAT.MSTAT_CHARASELECT
+            # 試合開始時にキャラクター名を取得するため、フレームに戻らずに済むよう残しておく
+            analyze.keep_charanames()
+
+        elif screen == C.STAT.SCRN_MATCHINVALID:
+            # 対戦画面・試合開始後（両者とも0フラッグ）
+            if video_data.mstat in ( C.STAT.MSTAT_CHARASELECT, C.STAT.MSTAT_MATFINISHED ):
+                # キャラクター選択画面 → ～ → 対戦画面・試合開始後　に遷移直後（新規試合）　または
+                # 試合終了　　　　　　 → ～ → 対戦画面・試合開始後　に遷移直後（リマッチ）
+                self.start_match(self.find_transition(
+                    frame_no, lambda: analyze.get_screen() == C.STAT.SCRN_MATCHINVALID))
+
+        elif screen == C.STAT.SCRN_MATCHVALID:
+            # 対戦画面・試合成立後（1フラッグ以上取得）
+            if self.events is not None:
+                self.emit_flag_score(frame_no)
+
+            if video_data.mstat <  C.STAT.MSTAT_LASTONEFLAG:
+                # 直前の状態が残り1フラッグになる前だった場合
+                # 残り1フラッグかをチェック
+                if analyze.is_lastoneflag(video_data.mdata.max_flags):
+                    video_data.mstat = C.STAT.MSTAT_LASTONEFLAG
+
+            if video_data.mstat == C.STAT.MSTAT_LASTONEFLAG:
+                # 今の状態が残り1フラッグである場合
+                # 試合終了かをチェック
+                tmp_finished = analyze.is_matchfinished(video_data.mdata.max_flags)
+                if tmp_finished != C.IMG_MATCH.WIN_N:
+                    # 試合終了時の処理
+                    self.end_match(tmp_finished, self.find_transition(
+                        frame_no, lambda: analyze.is_matchfinished(video_data.mdata.max_flags) != C.IMG_MATCH.WIN_N))
+                    video_data.mstat = C.STAT.MSTAT_MATFINISHED
+
+        video_data.skip_key, video_data.stat_text = self.get_nextstatus(screen)
+        video_data.skip = self.scheduler.skips[video_data.skip_key]
+        self.observe_state(frame_no, screen)
+
+        self._prev_fno = frame_no
+        self._prev_screen = screen
+
+
+    def observe_state(self, frame_no: int, screen: str) -> None:
+        """解析したフレームの状態を scheduler に記録する（試合中は獲得フラッグ数も）
+
+        Args:
+            frame_no (int): 現在のフレーム番号
+            screen (str): 現在のフレームの画面
+        """
+        video_data = self.video_data
+        key = video_data.skip_key
+        max_flags = video_data.mdata.max_flags
+        flags = None
+        if self.scheduler.predict and key in (3, 4):
+            if screen == C.STAT.SCRN_MATCHVALID:
+                flags = self.analyze.get_flags(max_flags, C.IMG_MATCH.WIN_N)
+            elif screen == C.STAT.SCRN_MATCHINVALID:
+                flags = (0, 0)
+        self.scheduler.observe(frame_no, key, screen in self.PREDICT_SCREENS.get(key, ()), flags, max_flags)
+
+
+    def is_same_state(self) -> bool:
+        """scheduler が間隔を延ばした先の現在のフレームが、直前に解析したフレームと同じ状態かを判定
+
+        同じ状態なら、飛ばしたフレームを解析しても状態遷移しなかったとみなす。
+        試合中は、残り１フラッグになっていてもよいが、決着していないこと、次の試合でないこと
+        （獲得フラッグ数が減っていないこと）を確かめる。
+
+        Returns:
+            bool: 同じ状態ならTrue
+        """
+        analyze = self.analyze
+        video_data = self.video_data
+        key = video_data.skip_key
+        screen = analyze.get_screen()
+        if screen not in self.PREDICT_SCREENS.get(key, ()):
+            return False
+
+        if key == 4:
+            if screen == C.STAT.SCRN_MATCHINVALID:
+                return not self.scheduler.flag_total
+            max_flags = video_data.mdata.max_flags
+            if analyze.is_matchfinished(max_flags) != C.IMG_MATCH.WIN_N:
+                return False
+            return sum(analyze.get_flags(max_flags, C.IMG_MATCH.WIN_N)) >= (self.scheduler.flag_total or 0)
+
+        if key == 2 and screen == C.STAT.SCRN_MATCHVALID:
+            # 決着後の対戦画面が続いていること（次の試合の対戦画面でないこと）
+            return self._prev_screen == C.STAT.SCRN_MATCHVALID
+
+        return True
+
+
+    def emit_flag_score(self, frame_no: int) -> None:
+        """獲得フラッグ数が変わっていれば、イベントを出力する
+
+        Args:
+            frame_no (int): 現在のフレーム番号
+        """
+        max_flags = self.video_data.mdata.max_flags
+        flags = self.analyze.get_flags(max_flags, C.IMG_MATCH.WIN_N)
+        if flags != self._last_flags:
+            self._last_flags = flags
+            self._emit('flag_score', frame_no, flags_L=flags[0], flags_R=flags[1], max_flags=max_flags)
+
+
+    def bisect(self, lo: int, hi: int, pred: Callable[[], bool]) -> int:
+        """lo と hi の間で、pred() が初めて真になるフレーム番号を二分探索する
+
+        lo では pred() が偽、hi では真で、その間で1回だけ切り替わるものとする。
+        探索後の現在のフレームは不定なので、呼び出し元で戻すこと。
+
+        Args:
+            lo (int): pred() が偽のフレーム番号
+            hi (int): pred() が真のフレーム番号
+            pred (Callable[[], bool]): 現在のフレームを判定する関数
+
+        Returns:
+            int: pred() が真になる最初のフレーム番号（lo より大きく hi 以下）
+        """
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if not self.analyze.set_frame(mid):
+                break
+            self.astats.cnt_refine += 1
+
+            if pred():
+                hi = mid
+            else:
+                lo = mid
+
+        return hi
+
+
+    def find_transition(self, frame_no: int, pred: Callable[[], bool]) -> int:
+        """直前に解析したフレームと現在のフレームの間で、pred() が初めて真になるフレーム番号を取得
+
+        refine が無効な場合や、直前のフレームが無い場合は、現在のフレーム番号を返す
+
+        Args:
+            frame_no (int): 現在のフレーム番号（pred() が真であること）
+            pred (Callable[[], bool]): 現在のフレームを判定する関数
+
+        Returns:
+            int: フレーム番号
+        """
+        if not self.refine or self._prev_fno is None:
+            return frame_no
+
+        found = self.bisect(self._prev_fno, frame_no, pred)
+        # 現在のフレームに戻す
+        self.analyze.set_frame(frame_no)
+        return found
+
+
+    def refine_prev_screen(self, frame_no: int, screen: str) -> None:
+        """直前に解析したフレームと現在のフレームの間で終わった画面を処理する（refine が有効な場合）
+
+        キャラクター選択画面が終わったら、キャラ決定時のフレーム番号を最後のキャラクター選択画面にする。
+        試合中の対戦画面（試合成立後）が終わったら、最後の対戦画面で試合終了を判定する。
+
+        Args:
+            frame_no (int): 現在のフレーム番号
+            screen (str): 現在のフレームの画面
+        """
+        analyze = self.analyze
+        video_data = self.video_data
+        mdata = video_data.mdata
+        prev_fno = self._prev_fno
+
+        if self._prev_screen == C.STAT.SCRN_CHARASELECT and screen != C.STAT.SCRN_CHARASELECT:
+            # キャラクター選択画面 → それ以外
+            fno_end = self.bisect(prev_fno, frame_no, lambda: analyze.get_screen() != C.STAT.SCRN_CHARASELECT)
+            mdata.fno_eofcharasel = fno_end - 1
+            analyze.set_frame(frame_no)
+
+        elif (self._prev_screen == C.STAT.SCRN_MATCHVALID and screen != C.STAT.SCRN_MATCHVALID
+              and video_data.mstat in (C.STAT.MSTAT_MATSTARTED, C.STAT.MSTAT_LASTONEFLAG)):
+            # 対戦画面・試合成立後 → それ以外（試合終了の判定前に対戦画面が終わった）
+            fno_end = self.bisect(prev_fno, frame_no, lambda: analyze.get_screen() != C.STAT.SCRN_MATCHVALID)
+            fno_last = fno_end - 1
+            if fno_last > prev_fno and analyze.set_frame(fno_last):
+                # 最後の対戦画面で、process_frame() と同じく試合終了を判定する
+                if video_data.mstat < C.STAT.MSTAT_LASTONEFLAG and analyze.is_lastoneflag(mdata.max_flags):
+                    video_data.mstat = C.STAT.MSTAT_LASTONEFLAG
+
+                if video_data.mstat == C.STAT.MSTAT_LASTONEFLAG:
+                    tmp_finished = analyze.is_matchfinished(mdata.max_flags)
+                    if tmp_finished != C.IMG_MATCH.WIN_N:
+                        fno_finished = self.bisect(
+                            prev_fno, fno_last,
+                            lambda: analyze.is_matchfinished(mdata.max_flags) != C.IMG_MATCH.WIN_N)
+                        # 獲得フラッグ数は最後の対戦画面で数える
+                        analyze.set_frame(fno_last)
+                        self.end_match(tmp_finished, fno_finished)
+                        video_data.mstat = C.STAT.MSTAT_MATFINISHED
+
+            analyze.set_frame(frame_no)
+
+
+    def start_match(self, frame_no: int) -> None:
+        """試合開始時の処理
+
+        Args:
+            frame_no (int): 試合開始を検出したフレーム番号
+        """
+        analyze = self.analyze
+        video_data = self.video_data
+
+        if   video_data.mstat == C.STAT.MSTAT_CHARASELECT:
+            # キャラクター選択画面 → ～ → 対戦画面・試合開始後　に遷移直後（新規試合）
+            # キャラ決定時のフレーム番号でキャラクタ名（左右）を取得
+            # 画面切り替わり直前はキャラクタ名を判定しづらくなっているため、（キャラ決定時のフレーム番号 - 0.25秒）で判定する。
+            if video_data.mdata.fno_eofcharasel is None:
+                # 区間並列解析で、区間内にキャラクター選択画面が無かった場合はキャラクタ名を不明のままにする
+                video_data.mdata.name_L = video_data.mdata.name_R = None
+            else:
+                fno_temp = video_data.mdata.fno_eofcharasel - int(video_data.fps * C.PROC_SPD.INTVL_CHARASELECT)
+                video_data.mdata.name_L, video_data.mdata.name_R, maxval_L, maxval_R = analyze.get_charanames(fno_temp)
+                self._emit('charaselect_end', video_data.mdata.fno_eofcharasel,
+                           name_L=video_data.mdata.name_L, name_R=video_data.mdata.name_R,
+                           conf_L=round(float(maxval_L), 4), conf_R=round(float(maxval_R), 4))
+            # 最大フラッグ数を取得
+            video_data.mdata.max_flags = analyze.get_maxflags()
+            self._print(f'\r{video_data.progress.txt}試合開始　　　　　　')
+            event = 'match_start'
+        elif video_data.mstat == C.STAT.MSTAT_MATFINISHED:
+            # 試合終了　　　　　　 → ～ → 対戦画面・試合開始後　に遷移直後（リマッチ）
+            # キャラクタ名・最大フラッグ数は前の試合のものを引き継ぐ
+            self._print(f'\r{video_data.progress.txt}リマッチ　　　　　　')
+            event = 'rematch'
+
+        # 3秒前のフレーム番号を「試合開始時のフレーム番号」として保存
+        video_data.mdata.fno_startmatch = frame_no - int(video_data.fps * 3)
+        # この時点では試合が中止される可能性があるが、コンソールには仮の試合番号で表示する
+        ts_text  = video_data.ts_format(video_data.mdata.fno_startmatch)
+        match_no = video_data.mdata.match_no + 1
+        name_l   = video_data.mdata.name_L
+        name_r   = video_data.mdata.name_R
+        timestamp = f'{ts_text} M{(match_no):02d}: Player1 - {name_l} vs Player2 - {name_r}'
+        self._print(timestamp)
+        self._emit(event, video_data.mdata.fno_startmatch, match_no=match_no, fno_detected=frame_no,
+                   name_L=name_l, name_R=name_r, max_flags=video_data.mdata.max_flags)
+        self._last_flags = None
+
+        video_data.mstat = C.STAT.MSTAT_MATSTARTED
+        if analyze.is_lastoneflag(video_data.mdata.max_flags):
+            video_data.mstat = C.STAT.MSTAT_LASTONEFLAG
+
+
+    def end_match(self, win: int, frame_no: int = None) -> None:
+        """試合終了時の処理
+
+        獲得フラッグ数は現在のフレームで数える
+
+        Args:
+            win (int): 左右どちらが勝利したか
+            frame_no (int): 決着したフレーム番号（None なら現在のフレーム番号）
+        """
+        video_data = self.video_data
+        if frame_no is None:
+            frame_no = video_data.frame_no
+
+        flags_L, flags_R = self.analyze.get_flags(video_data.mdata.max_flags, win)
+        #print(f'Flags: {flags_L}:{flags_R} / {max_flags}')
+
+        if max( flags_L, flags_R ) == video_data.mdata.max_flags:
+            # 左右の獲得フラッグ数が最大フラッグ数に達していれば試合決着とする（達していない場合、試合中止とみなす）
+            result = MatchResult(frame_no, video_data.mdata, flags_L, flags_R)
+            winnerstr = video_data.add_match(result)
+            if self.events is not None:
+                self.events.emit_match(result, video_data.mdata.match_no)
+            if self.on_match is not None:
+                self.on_match(result)
+            #################'\r進捗:100.00%(0:00:00) キャラクター選択画面\r')
+            self._write('\r                                          \r')
+            self._print(winnerstr)
+            self._print(f'{video_data.progress.txt}試合終了　　　　　　\n')
+        else:
+            self._emit('match_abort', frame_no, flags_L=flags_L, flags_R=flags_R,
+                       max_flags=video_data.mdata.max_flags)
+
+
+    def get_nextstatus(self, screen: str):
+        """次ループのスキップ間隔、ステータス文字列を返す
+
+        Args:
+            screen (str): 現在の画面
+
+        Returns:
+            int: スキップ間隔（フレーム）の連想配列 skips のキー
+            str: ステータス文字列
+        """
+        video_data = self.video_data
+        astats = self.astats
+
+        if   screen == C.STAT.SCRN_CHARASELECT:
+            stat_text = 'キャラクター選択画面'
+            skip_key = 1
+            astats.cnt_charaselect   += 1
+        elif video_data.mstat == C.STAT.MSTAT_MATFINISHED:
+            stat_text = '試合終了後　　　　　'
+            skip_key = 2
+            astats.cnt_matchfinished += 1
+        elif video_data.mstat == C.STAT.MSTAT_LASTONEFLAG:
+            stat_text = '残り１フラッグ　　　'
+            skip_key = 3
+            astats.cnt_lastoneflag   += 1
+        elif video_data.mstat == C.STAT.MSTAT_MATSTARTED:
+            stat_text = '試合中　　　　　　　'
+            skip_key = 4
+            astats.cnt_matstarted    += 1
+        elif screen == C.STAT.SCRN_BLACKOUT:
+            stat_text = '暗転画面　　　　　　'
+            skip_key = 5
+            astats.cnt_blackout      += 1
+        else:
+            stat_text = 'その他　　　　　　　'
+            skip_key = 0
+            astats.cnt_other         += 1
+
+        return skip_key, stat_text
@@ -1,35 +1,92 @@
+import time
 import cv2
 import numpy as np
-from collections import OrderedDict
+from collections import deque
 
 from constants import Constants as C
 from char_names import CharNames
+from color_lut import get_flag_lut
+from name_matcher import NameMatcher
 from match_template import MatchTemplate
+from frame_source import FrameSource, CvFrameSource
+from roi_extractor import RoiExtractor, get_roi
+from frame_features import FrameFeatures, FeatureCounter
+from frame_prefetcher import FramePrefetcher
+from feature_store import FeatureStore, get_version
+from roi_cache import RoiCache
+from screen_cascade import DirectMatcher, ScreenCascade
+from stage_stats import StageStats
 
 
 class AnalyzeVideo:
     """動画ファイルを解析するクラス
     Attributes:
-        capture (cv2.VideoCapture): 動画ファイルのキャプチャオブジェクト
+        source (FrameSource): 動画フレームの供給元
         fps (float): 動画のフレームレート
         totalframes (int): 動画の総フレーム数
-        frame (numpy.ndarray): 現在のフレーム情報
+        features (FrameFeatures): 現在のフレームから切り出した範囲と、判定結果
+        feature_counter (FeatureCounter): 判定結果の再利用回数・計算回数（file_open() で0に戻す）
+        frame_cache (RoiCache): 解析したフレームの切り出した範囲と判定結果（LRU、バイト数の上限付き）
+        prefetcher (FramePrefetcher): フレームの先読み（start_prefetch() で開始、file_close() で終了）
+        prefetch_stats (PrefetchStats): 最後に開始した先読みの統計情報（先読みしていなければ None）
+        cache_dir (str): 判定結果の保存先ディレクトリ（None なら保存しない）
+        cache_readonly (bool): True なら保存済みの判定結果を使うだけで保存しない
+        feature_store (FeatureStore): 開いている動画の保存済みの判定結果（保存しない場合は None）
+        stage_stats (StageStats): 処理段階ごとの時間・回数（file_open() で新しくする）
+        prescan (PreScan): 事前走査の結果。変化の無い区間では判定結果を使い回す（事前走査しなければ None）
+        name_buffer (deque[FrameFeatures]): キャラクター選択画面で解析した直近のフレーム（キャラクター名の取得用）
+        cnt_name_buffer (int): キャラクター名を name_buffer から取得した回数
+        cnt_name_seek (int): キャラクター名をフレームに戻って取得した回数
+        flag_lut (ColorLut): フラッグの色（白・赤・それ以外）の分類表（get_flag_lut()）
+        charaselect_matcher (DirectMatcher): キャラクター選択画面の照合の事前判定（照合の値を直接計算する）
+        screen_cascade (ScreenCascade): 事前判定するかの判断と、その統計情報（file_open() で新しくする）
         frame_no (int): 現在のフレーム番号
     """
 
 
 #    def __init__(self, video_data: AnalyzedVideoData):
-    def __init__(self):
+    def __init__(self, source: FrameSource = None, cache_dir: str = None, cache_readonly: bool = False,
+                 roi_cache_bytes: int = C.PROC_SPD.ROI_CACHE_BYTES):
         """コンストラクタ
+
+        Args:
+            source (FrameSource): 動画フレームの供給元。省略時は CvFrameSource
+            cache_dir (str): 判定結果の保存先ディレクトリ（None なら保存しない）
+            cache_readonly (bool): True なら保存済みの判定結果を使うだけで保存しない（並列解析のワーカー用）
+            roi_cache_bytes (int): 解析したフレームの切り出した範囲と判定結果をメモリに残すバイト数の上限
         """
-        self.capture = None
+        self.source = source if source is not None else CvFrameSource()
         self.fps = 0.0
         self.totalframes = 0
-        self.frame = None
+        self.features = None
+        self.feature_counter = FeatureCounter()
+        self.roi_extractor = None
+        self.prefetcher = None
+        self.prefetch_stats = None
+        self.cache_dir = cache_dir
+        self.cache_readonly = cache_readonly
+        self.feature_store = None
+        self.stage_stats = StageStats()
+        self.prescan = None
+        self.name_buffer = deque(maxlen=C.CHAR.NAME_BUFFER)
+        self.cnt_name_buffer = 0
+        self.cnt_name_seek = 0
+        self._flag_cols = self._get_flag_cols()
+        self.flag_lut = get_flag_lut()
+        # フラッグの帯の画素のうち、各フラッグの範囲の画素の位置と、その画素が何番目のフラッグか
+        strip_width = C.IMG_MATCH.AREA_FLAGS_L[2] + C.IMG_MATCH.AREA_FLAGS_R[2]
+        rows = np.arange(C.IMG_MATCH.AREA_FLAG_YWH[2])[:, np.newaxis, np.newaxis, np.newaxis]
+        self._flag_pixels = (rows * strip_width + self._flag_cols).ravel()
+        self._flag_groups = np.broadcast_to(np.arange(2 * C.IMG_MATCH.MAX_FLAGS).reshape(2, C.IMG_MATCH.MAX_FLAGS, 1),
+                                            (len(rows),) + self._flag_cols.shape).ravel()
         self.frame_no = 0
-        self.frame_cache = OrderedDict()
+        self.frame_cache = RoiCache(roi_cache_bytes)
         self.charanames = CharNames()
         self.matchtemplate = MatchTemplate()
+        area = C.IMG_MATCH.AREA_CHARASELECT
+        self.charaselect_matcher = DirectMatcher(self._to_charaselect_color(self.matchtemplate.img_charaselect),
+                                                 (area[3], area[2]))
+        self.screen_cascade = ScreenCascade(self.stage_stats)
 
 
     def file_open(self, file: str) -> bool:
@@ -40,29 +97,105 @@ class AnalyzeVideo:
         Returns:
             bool: 動画ファイルならTrue、そうでなければFalse
         """
-        self.capture = cv2.VideoCapture(file)
-        if not self.capture.isOpened():
+        # 前に開いた動画のフレームが残らないようにする
+        self.stop_prefetch()
+        self.prefetch_stats = None
+        self.frame_cache.clear()
+        self.features = None
+        self.feature_counter.reset()
+        self.feature_store = None
+        self.prescan = None
+        self.name_buffer.clear()
+        self.cnt_name_buffer = 0
+        self.cnt_name_seek = 0
+
+        # 処理段階ごとの時間・回数は、FrameSource と FrameFeatures が記録する
+        self.stage_stats = StageStats()
+        self.source.stats = self.stage_stats
+        self.feature_counter.stages = self.stage_stats
+        self.screen_cascade = ScreenCascade(self.stage_stats)
+
+        if not self.source.open(file):
             return False
 
         # 動画のフレーム数を取得
-        self.totalframes = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.totalframes = self.source.get_totalframes()
 
         # 動画のフレームレートを取得
-        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.fps = self.source.get_fps()
+
+        # 動画の解像度に合わせて、切り出す範囲を決める
+        self.roi_extractor = RoiExtractor(self.source.get_frame_size())
 
-        # フレーム数が1以下のもの（静止画像など）はエラーとする
-        if self.totalframes <= 1:
+        # フレーム数が1以下のもの（静止画像など）はエラーとする（書き込み中の動画はフレーム数が不明）
+        if self.totalframes <= 1 and not self.source.is_live():
             return False
 
+        if self.cache_dir is not None:
+            # 前回までの判定結果を読み込む
+            self.feature_store = FeatureStore(self.cache_dir, file, self.get_feature_versions(),
+                                              self.cache_readonly)
+
         return True
 
 
     def file_close(self):
         """動画ファイルを閉じる
         """
-        if self.capture is not None:
-            self.capture.release()
-            self.capture = None
+        self.stop_prefetch()
+        self.source.close()
+        if self.feature_store is not None:
+            self.feature_store.save()
+
+
+    def get_feature_versions(self) -> dict:
+        """判定結果の種類ごとのバージョン文字列を取得する（FeatureStore）
+
+        テンプレート画像や判定に使う定数、フレームの縮小方法（FrameSource.get_scaling()）が変わると、
+        バージョン文字列も変わる
+
+        Returns:
+            dict: 判定結果の種類をキーとする連想配列
+        """
+        roi = (C.IMG_MATCH.BASE_RESOLUTION, C.IMG_MATCH.ROI_AREAS, self.source.get_scaling())
+
+        def names_version(area, charnames):
+            images = [part for charadata in charnames for part in (charadata['filename'], charadata['image'])]
+            return get_version(roi, area, C.CHAR.EARLY_EXIT, *images)
+
+        return {
+            'flagstates': get_version(roi, C.IMG_MATCH.AREA_FLAG_XL, C.IMG_MATCH.AREA_FLAG_XR,
+                                      C.IMG_MATCH.AREA_FLAG_YWH, C.IMG_MATCH.AREA_FLAG_SPC,
+                                      C.IMG_MATCH.HSV_RANGES_WH, C.IMG_MATCH.HSV_RANGES_RD),
+            'blackout_mean': get_version(roi, C.IMG_MATCH.AREA_CHKBLACKOUT),
+            'charaselect_maxval': get_version(roi, C.IMG_MATCH.AREA_CHARASELECT, C.MATCH_TEMPLATE.CHARASEL_COLOR,
+                                              self.matchtemplate.img_charaselect),
+            'charaname_L': names_version(C.IMG_MATCH.AREA_CHARNAME_L, self.charanames.charnames_L),
+            'charaname_R': names_version(C.IMG_MATCH.AREA_CHARNAME_R, self.charanames.charnames_R),
+        }
+
+
+    def start_prefetch(self, depth: int) -> None:
+        """デコード用スレッドでのフレームの先読みを開始する（file_open() 後に呼ぶ）
+
+        開始後は、フレームの読み込みは全てデコード用スレッドで行う
+
+        Args:
+            depth (int): 先読みするフレーム数の上限
+        """
+        self.stop_prefetch()
+        self.prefetch_stats = None
+        if depth > 0:
+            self.prefetcher = FramePrefetcher(self.source, self._extract_rois, depth)
+            self.prefetch_stats = self.prefetcher.stats
+
+
+    def stop_prefetch(self) -> None:
+        """フレームの先読みを終了する（統計情報は prefetch_stats に残る）
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
 
 
     def get_fps(self) -> float:
@@ -72,7 +205,7 @@ class AnalyzeVideo:
             float: 動画のフレームレート
         """
 #        return self.fps
-        return self.capture.get(cv2.CAP_PROP_FPS)
+        return self.source.get_fps()
 
 
     def get_totalframes(self) -> int:
@@ -82,78 +215,194 @@ class AnalyzeVideo:
             int: 動画のフレーム数
         """
 #        return self.totalframes
-        return int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        return self.source.get_totalframes()
 
 
 # ここから フレーム移動関連
-    def _update_cache(self, frame_no, frame):
-        """フレームのデータをキャッシュに保存
+    def _update_cache(self, frame_no, features):
+        """フレームから切り出した範囲と判定結果をキャッシュに保存
 
         Args:
             frame_no (int): フレーム番号
-            frame (numpy.ndarray): フレーム
+            features (FrameFeatures): フレームから切り出した範囲と判定結果
+
+        """
+        # 上限を超えたら、最も長く使っていないフレームから捨てる
+        self.frame_cache.put(frame_no, features)
+
+
+    def _extract_rois(self, frame) -> dict:
+        """フレームから照合に使う範囲を切り出す
+
+        Args:
+            frame (numpy.ndarray): 元の解像度のフレーム
+
+        Returns:
+            dict: 切り出した範囲（RoiExtractor.extract()）
+        """
+        # フレーム全体は縮小せず、照合に使う範囲だけを解像度 640×360（16:9） 基準の大きさで切り出す
+        frame_size = (frame.shape[1], frame.shape[0])
+        if self.roi_extractor is None or self.roi_extractor.frame_size != frame_size:
+            # 動画の情報と実際のフレームの大きさが異なる場合に備える
+            self.roi_extractor = RoiExtractor(frame_size)
+
+        start = time.perf_counter()
+        rois = self.roi_extractor.extract(frame)
+        self.stage_stats.add('resize', time.perf_counter() - start)
+        return rois
+
+
+    def _read_rois(self, target_fno: int, next_skip: int = None):
+        """指定したフレーム番号のフレームを読み込み、照合に使う範囲を切り出す
+
+        Args:
+            target_fno (int): フレーム番号
+            next_skip (int): この後 next_skip 間隔のフレームを解析する予定なら、その間隔（先読みに使う）
+
+        Returns:
+            bool: 読み込めればTrue
+            dict: 切り出した範囲（読み込めなければ None）
+        """
+        self.feature_counter.decoded += 1
+        if self.prefetcher is not None:
+            # デコード用スレッドで読み込み・切り出し済みのものを受け取る
+            return self.prefetcher.read(target_fno, next_skip)
+
+        # 近距離なら読み進め、遠距離なら直接移動する（FrameSource に任せる）
+        ret, frame = self.source.read(target_fno, next_skip)
+        return ret, (self._extract_rois(frame) if ret else None)
+
+
+    def _load_rois(self, target_fno: int) -> dict:
+        """保存済みの判定結果から作ったフレームで、判定に範囲が必要になった時に読み込む
+
+        Args:
+            target_fno (int): フレーム番号
 
+        Returns:
+            dict: 切り出した範囲
         """
-        self.frame_cache[frame_no] = frame
-        if len(self.frame_cache) > C.PROC_SPD.FRAME_CACHE_SIZE:
-            self.frame_cache.popitem(last=False)  # FIFOで削除
+        ret, rois = self._read_rois(target_fno)
+        if not ret:
+            raise OSError(f'cannot read frame {target_fno}')
+        return rois
 
 
-    def set_frame(self, target_fno: int) -> bool:
+    def set_frame(self, target_fno: int, next_skip: int = None) -> bool:
         """動画内の指定したフレーム番号に飛ぶ（高速化）
 
         Args:
             target_fno (int): フレーム番号
+            next_skip (int): この後 next_skip 間隔のフレームを解析する予定なら、その間隔（先読みに使う）
 
         Returns:
             bool: 指定したフレームに飛べればTrue、そうでなければFalse
         """
         # キャッシュにあれば即利用
-        if target_fno in self.frame_cache:
-            self.frame = self.frame_cache[target_fno]
+        features = self.frame_cache.get(target_fno)
+        if features is not None:
+            # 判定結果もそのまま再利用する
+            self.features = features
             self.frame_no = target_fno
             return True
 
-        # 現在位置取得
-        current_fno = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
-        delta = target_fno - current_fno
+        store = self.feature_store
+        on_compute = store.put if store is not None else None
+
+        # 保存済みの判定結果があれば、フレームは必要になるまで読み込まない
+        values = store.get(target_fno) if store is not None else None
+        if self.prescan is not None:
+            # 事前走査で変化の無かった区間なら、区間の最初のフレームの判定結果を使う（保存済みのものを優先）
+            shared = self.prescan.get_values(target_fno)
+            if shared:
+                values = {**shared, **values} if values is not None else shared
+        if values is not None:
+            features = FrameFeatures(target_fno, None, self.feature_counter, values,
+                                     load_rois=lambda: self._load_rois(target_fno), on_compute=on_compute)
+            self.features = features
+            self.frame_no = target_fno
+            self._update_cache(target_fno, features)
+            return True
 
-        if 0 < delta <= C.PROC_SPD.MAX_SEQUENTIAL_READ:
-            # 近距離なら read() で進める
-            for _ in range(delta):
-                ret, _ = self.capture.read()
-            ret, frame = self.capture.read()
-        else:
-            # 遠距離なら直接 set() する
-            self.capture.set(cv2.CAP_PROP_POS_FRAMES, target_fno)
-            ret, frame = self.capture.read()
+        ret, rois = self._read_rois(target_fno, next_skip)
 
         if ret:
-            # 解像度 640×360（16:9） に揃える
-            frame_resized = cv2.resize(frame, C.IMG_MATCH.BASE_RESOLUTION[2:])
-            self.frame = frame_resized
+            features = FrameFeatures(target_fno, rois, self.feature_counter, on_compute=on_compute)
+            self.features = features
             self.frame_no = target_fno
-            self._update_cache(target_fno, frame_resized)
+            self._update_cache(target_fno, features)
 
         return ret
 
+
+    def snap_to_keyframe(self, fno: int, max_dist: int, min_fno: int = 0) -> int:
+        """指定したフレーム番号に近いキーフレームのフレーム番号を返す（FrameSource.snap_to_keyframe()）
+
+        Args:
+            fno (int): フレーム番号
+            max_dist (int): fno からの最大距離（フレーム）
+            min_fno (int): これより小さいフレーム番号は返さない
+
+        Returns:
+            int: フレーム番号
+        """
+        return self.source.snap_to_keyframe(fno, max_dist, min_fno)
+
+
+    def get_feature(self, features: FrameFeatures, key: str):
+        """現在のフレーム以外のフレームの判定結果を取得する（事前走査の区間の最初のフレーム、name_buffer のフレーム）
+
+        Args:
+            features (FrameFeatures): フレームから切り出した範囲と判定結果
+            key (str): 判定結果の種類（'flagstates'、'blackout_mean'、'charaselect_maxval'、'charaname_L'、'charaname_R'）
+
+        Returns:
+            object: 判定結果
+        """
+        calcs = {
+            'flagstates':         self._calc_flagstates,
+            'blackout_mean':      self._calc_blackout_mean,
+            'charaselect_maxval': self._calc_charaselect_maxval,
+            'charaname_L':        lambda: self._calc_charaname(True,  self.charanames.matcher_L),
+            'charaname_R':        lambda: self._calc_charaname(False, self.charanames.matcher_R),
+        }
+        # 判定は現在のフレームに対して行うので、一時的に切り替える
+        current = self.features
+        self.features = features
+        try:
+            return features.get(key, calcs[key])
+        finally:
+            self.features = current
+
 # ここまで フレーム移動関連
 
 # ここから 画像照合関連
-    def get_maxval(self, image, area=C.IMG_MATCH.BASE_RESOLUTION, color=cv2.IMREAD_COLOR) -> float:
+    def get_roi(self, area):
+        """現在のフレームから、指定した範囲の画像を取得
+
+        Args:
+            area (tuple): 範囲（ (x, y, w, h) 左上の座標,幅,高さ）。C.IMG_MATCH.ROI_AREAS のいずれかに含まれること
+
+        Returns:
+            numpy.ndarray: 指定した範囲の画像
+        """
+        return get_roi(self.features.rois, area)
+
+
+    def get_maxval(self, image, area, color=cv2.IMREAD_COLOR) -> float:
         """現在のフレーム内で、指定した範囲の、指定した画像とマッチした度合（信頼度最大値）を取得
 
         Args:
             image (ndarray): 画像（cv2.imread()で読み込んだオブジェクト）
             area (tuple): 範囲（ (x, y, w, h) 左上の座標,幅,高さ）。フレーム全体の大きさは(640×360)とする
+                          C.IMG_MATCH.ROI_AREAS のいずれかに含まれる範囲に限る
                           cv2.matchTemplate の性質上、image よりも少し大きめに指定するとよい
             color (int): 0(cv2.IMREAD_GRAYSCALE):グレースケール、1(cv2.IMREAD_COLOR):カラー
 
         Returns:
             float: 信頼度最大値
         """
-        x, y, w, h = area
-        frame = self.frame[y:y+h, x:x+w]
+        frame = self.get_roi(area)
 
         if color == cv2.IMREAD_GRAYSCALE:
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
@@ -166,12 +415,13 @@ class AnalyzeVideo:
         return max_val
 
 
-    def is_matchimage(self, image, area=C.IMG_MATCH.BASE_RESOLUTION, color=cv2.IMREAD_COLOR, threshold=0.7) -> bool:
+    def is_matchimage(self, image, area, color=cv2.IMREAD_COLOR, threshold=0.7) -> bool:
         """現在のフレーム内で、指定した範囲が、指定した画像とマッチするかを判定
 
         Args:
             image (ndarray): 画像（cv2.imread()で読み込んだオブジェクト）
             area (tuple): 範囲（ (x, y, w, h) 左上の座標,幅,高さ）。フレーム全体の大きさは(640×360)とする
+                          C.IMG_MATCH.ROI_AREAS のいずれかに含まれる範囲に限る
                           cv2.matchTemplate の性質上、image よりも少し大きめに指定するとよい
             color (int): 0(cv2.IMREAD_GRAYSCALE):グレースケール、1(cv2.IMREAD_COLOR):カラー
             threshold (float): 閾値
@@ -221,24 +471,93 @@ class AnalyzeVideo:
 
         Args:
             area (tuple): 範囲（ (x, y, w, h) 左上の座標,幅,高さ）。フレーム全体の大きさは(640×360)とする
+                          C.IMG_MATCH.ROI_AREAS のいずれかに含まれる範囲に限る
 
         Returns:
             int: 2 赤、 1 白、 0 それ以外
         """
-        x, y, w, h = area
-        frame_hsv = cv2.cvtColor(self.frame[y:y+h, x:x+w], cv2.COLOR_BGR2HSV)
+        # HSV に変換せず、色の分類表を引いて数える
+        pixels = self.get_roi(area).reshape(-1, 3)
+        if len(pixels) == 0:
+            return C.IMG_MATCH.FLAGCOLOR_NO
+        counts = self.flag_lut.count(pixels, np.zeros(len(pixels), dtype=np.intp), 1)[0]
 
-        match_ratio_wh = self.get_color_match_ratio(frame_hsv, C.IMG_MATCH.HSV_RANGES_WH)
+        match_ratio_wh = counts[C.IMG_MATCH.FLAGCOLOR_WH] / len(pixels)
         if match_ratio_wh > 0.7:
             return C.IMG_MATCH.FLAGCOLOR_WH
 
-        match_ratio_rd = self.get_color_match_ratio(frame_hsv, C.IMG_MATCH.HSV_RANGES_RD)
+        match_ratio_rd = counts[C.IMG_MATCH.FLAGCOLOR_RD] / len(pixels)
         if match_ratio_rd > 0.7:
             return C.IMG_MATCH.FLAGCOLOR_RD
 
         return C.IMG_MATCH.FLAGCOLOR_NO
 
 
+    def _get_flag_cols(self):
+        """フラッグ左右の帯（AREA_FLAGS_L、AREA_FLAGS_R を横に並べたもの）での、各フラッグの X 座標を取得
+
+        Returns:
+            numpy.ndarray: [左右, 1～7番目, 幅] の X 座標
+        """
+        w = C.IMG_MATCH.AREA_FLAG_YWH[1]
+        x_L = C.IMG_MATCH.AREA_FLAGS_L[0]
+        x_R = C.IMG_MATCH.AREA_FLAGS_R[0]
+        offset_R = C.IMG_MATCH.AREA_FLAGS_L[2]
+
+        n = np.arange(C.IMG_MATCH.MAX_FLAGS)
+        cols_L = (C.IMG_MATCH.AREA_FLAG_XL - x_L) + (C.IMG_MATCH.AREA_FLAG_SPC * n)
+        cols_R = (C.IMG_MATCH.AREA_FLAG_XR - x_R) - (C.IMG_MATCH.AREA_FLAG_SPC * n) + offset_R
+
+        return np.stack((cols_L, cols_R))[:, :, np.newaxis] + np.arange(w)
+
+
+    def get_flagstates(self):
+        """現在のフレーム内の、左右 1～7番目すべてのフラッグの色を取得
+
+        左右の帯から全フラッグの範囲の画素を取り出し、色の分類表で白・赤の割合を一度に計算する。
+        結果はフレームごとに1回だけ計算する。
+
+        Returns:
+            numpy.ndarray: [左右（0 左、1 右）, 1～7番目] の色（2 赤、 1 白、 0 それ以外）
+        """
+        return self.features.get('flagstates', self._calc_flagstates)
+
+
+    def _calc_flagstates(self):
+        """現在のフレーム内の、左右 1～7番目すべてのフラッグの色を計算する（get_flagstates()）
+
+        Returns:
+            numpy.ndarray: [左右（0 左、1 右）, 1～7番目] の色（2 赤、 1 白、 0 それ以外）
+        """
+        strip = np.concatenate((self.get_roi(C.IMG_MATCH.AREA_FLAGS_L),
+                                self.get_roi(C.IMG_MATCH.AREA_FLAGS_R)), axis=1)
+        return self.classify_flag_strip(strip)
+
+
+    def classify_flag_strip(self, strip):
+        """フラッグの帯の画像から、左右 1～7番目すべてのフラッグの色を判定する
+
+        Args:
+            strip (numpy.ndarray): AREA_FLAGS_L、AREA_FLAGS_R を横に並べた画像（BGR）
+
+        Returns:
+            numpy.ndarray: [左右（0 左、1 右）, 1～7番目] の色（2 赤、 1 白、 0 それ以外）
+        """
+        pixels = strip.reshape(-1, 3).take(self._flag_pixels, axis=0)
+
+        # [左右 × 1～7番目, 分類] の画素数から、フラッグごとに色範囲にマッチしたピクセルの割合を求める
+        # （白と赤の色範囲は重ならないので、画素ごとに1つに分類しても割合は変わらない）
+        n_flags = 2 * C.IMG_MATCH.MAX_FLAGS
+        counts = self.flag_lut.count(pixels, self._flag_groups, n_flags) / (len(pixels) // n_flags)
+        match_ratio_wh = counts[:, C.IMG_MATCH.FLAGCOLOR_WH].reshape(2, C.IMG_MATCH.MAX_FLAGS)
+        match_ratio_rd = counts[:, C.IMG_MATCH.FLAGCOLOR_RD].reshape(2, C.IMG_MATCH.MAX_FLAGS)
+
+        # 白の判定を優先する（is_red_or_white() と同じ）
+        return np.where(match_ratio_wh > 0.7, C.IMG_MATCH.FLAGCOLOR_WH,
+                        np.where(match_ratio_rd > 0.7, C.IMG_MATCH.FLAGCOLOR_RD,
+                                 C.IMG_MATCH.FLAGCOLOR_NO))
+
+
     def get_flagcolor(self, left: bool, n: int) -> int:
         """現在のフレーム内で、指定した位置のフラッグの色を返す
 
@@ -252,13 +571,7 @@ class AnalyzeVideo:
         if (n < 1) or (n > C.IMG_MATCH.MAX_FLAGS):
             return C.IMG_MATCH.FLAGCOLOR_NO
 
-        if left:
-            x = C.IMG_MATCH.AREA_FLAG_XL + (C.IMG_MATCH.AREA_FLAG_SPC * (n-1))
-        else:
-            x = C.IMG_MATCH.AREA_FLAG_XR - (C.IMG_MATCH.AREA_FLAG_SPC * (n-1))
-
-        area = (x, ) + C.IMG_MATCH.AREA_FLAG_YWH
-        return self.is_red_or_white(area)
+        return int(self.get_flagstates()[0 if left else 1, n-1])
 
 
     def get_maxflags(self) -> int:
@@ -267,18 +580,13 @@ class AnalyzeVideo:
         Returns:
             int: 最大フラッグ数
         """
+        # 左右どちらかでもフラッグではないと判定した位置を探す
+        is_noflag = (self.get_flagstates() == C.IMG_MATCH.FLAGCOLOR_NO).any(axis=0)
+        if is_noflag.any():
+            # i+1番目のエリアでフラッグではないと判定した場合、i を max_flags として返す
+            return int(is_noflag.argmax())
 
-        # 左右のフラッグ位置を順にチェック
-        for i in range( C.IMG_MATCH.MAX_FLAGS ):
-            k = i + 1
-            flagcolor_L = self.get_flagcolor(True,  k)
-            flagcolor_R = self.get_flagcolor(False, k)
-
-            if ( flagcolor_L == C.IMG_MATCH.FLAGCOLOR_NO ) or ( flagcolor_R == C.IMG_MATCH.FLAGCOLOR_NO ):
-                # i+1番目のエリアの左右どちらかでもフラッグではないと判定した場合、i を max_flags として返す
-                return i
-
-        # ループを全て抜けた場合、最大フラッグ数を7とする
+        # 全てフラッグの場合、最大フラッグ数を7とする
         return C.IMG_MATCH.MAX_FLAGS
 
 
@@ -344,34 +652,22 @@ class AnalyzeVideo:
             int: 左プレイヤー獲得フラッグ数
             int: 右プレイヤー獲得フラッグ数
         """
-        flags_L = 0
-        flags_R = 0
+        flagstates = self.get_flagstates()[:, :max_flags]
+
+        def count_red(states):
+            # 1番目から連続して赤のフラッグ数（赤でないフラッグ以降は増えない）
+            is_notred = states != C.IMG_MATCH.FLAGCOLOR_RD
+            return int(is_notred.argmax()) if is_notred.any() else len(states)
 
         # 左側のフラッグ数をカウント
         if win != C.IMG_MATCH.WIN_L:
-            for i in range(max_flags):
-                flagcolor_L = self.get_flagcolor(True,  i+1)
-
-                if flagcolor_L == C.IMG_MATCH.FLAGCOLOR_RD:
-                    # i+1 番目のフラッグが赤ならば、獲得フラッグ数を +1 する
-                    flags_L += 1
-                else:
-                    # i+1 番目のフラッグが赤でないならば、これ以上 flags_L が増えることはないためループを抜ける
-                    break;
+            flags_L = count_red(flagstates[0])
         else:
             flags_L = max_flags
 
         # 右側のフラッグ数をカウント
         if win != C.IMG_MATCH.WIN_R:
-            for i in range(max_flags):
-                flagcolor_R = self.get_flagcolor(False, i+1)
-
-                if flagcolor_R == C.IMG_MATCH.FLAGCOLOR_RD:
-                    # i+1 番目のフラッグが赤ならば、獲得フラッグ数を +1 する
-                    flags_R += 1
-                else:
-                    # i+1 番目のフラッグが赤でないならば、これ以上 flags_R が増えることはないためループを抜ける
-                    break;
+            flags_R = count_red(flagstates[1])
         else:
             flags_R = max_flags
 
@@ -409,7 +705,49 @@ class AnalyzeVideo:
         Returns:
             bool: キャラクター選択画面ならばTrue
         """
-        return self.is_matchimage(self.matchtemplate.img_charaselect, C.IMG_MATCH.AREA_CHARASELECT, C.MATCH_TEMPLATE.CHARASEL_COLOR)
+        max_val = self.features.get('charaselect_maxval', self._calc_charaselect_maxval)
+        # 信頼度最大値（max_val）が 0.7 より大きければマッチしたとみなす（is_matchimage() と同じ）
+        return max_val > C.IMG_MATCH.CHARASEL_THRESHOLD
+
+
+    def _to_charaselect_color(self, image):
+        """画像を、キャラクター選択画面の照合に使う色（C.MATCH_TEMPLATE.CHARASEL_COLOR）にする（get_maxval() と同じ）
+
+        Args:
+            image (numpy.ndarray): BGR の画像
+
+        Returns:
+            numpy.ndarray: 照合に使う画像
+        """
+        if C.MATCH_TEMPLATE.CHARASEL_COLOR == cv2.IMREAD_GRAYSCALE and len(image.shape) > 2:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image
+
+
+    def _calc_charaselect_maxval(self) -> float:
+        """キャラクター選択画面の画像と照合した信頼度最大値を計算する（is_charaselect()）
+
+        事前判定（screen_cascade が判断）の値が閾値から C.CASCADE.GATE_MARGIN より離れていれば、照合を省いて
+        事前判定の値を返す（閾値との比較の結果は、照合した場合と同じ）
+
+        Returns:
+            float: 信頼度最大値
+        """
+        roi = self.get_roi(C.IMG_MATCH.AREA_CHARASELECT)
+        if self.screen_cascade.use_gate():
+            start = time.perf_counter()
+            max_val = self.charaselect_matcher.match(self._to_charaselect_color(roi))
+            self.stage_stats.add('charaselect_gate', time.perf_counter() - start)
+            resolved = max_val is not None and abs(max_val - C.IMG_MATCH.CHARASEL_THRESHOLD) > C.CASCADE.GATE_MARGIN
+            self.screen_cascade.record_gate(resolved)
+            if resolved:
+                return max_val
+
+        start = time.perf_counter()
+        max_val = self.get_maxval(self.matchtemplate.img_charaselect, C.IMG_MATCH.AREA_CHARASELECT,
+                                  C.MATCH_TEMPLATE.CHARASEL_COLOR)
+        self.stage_stats.add('charaselect_match', time.perf_counter() - start)
+        return max_val
 
 
     def is_blackout(self) -> bool:
@@ -418,19 +756,40 @@ class AnalyzeVideo:
         Returns:
             bool: 暗転していればTrue
         """
-        x, y, w, h = C.IMG_MATCH.AREA_CHKBLACKOUT
-        frame_gray = cv2.cvtColor(self.frame[y:y+h, x:x+w], cv2.COLOR_BGR2GRAY)
         # 指定範囲の平均輝度を取得
-        mean_brightness = cv2.mean(frame_gray)[0]
+        mean_brightness = self.features.get('blackout_mean', self._calc_blackout_mean)
         if mean_brightness < 0.1:
             return True
 
         return False
 
 
+    def _calc_blackout_mean(self) -> float:
+        """暗転判定の範囲の平均輝度を計算する（is_blackout()）
+
+        Returns:
+            float: 平均輝度
+        """
+        frame_gray = cv2.cvtColor(self.get_roi(C.IMG_MATCH.AREA_CHKBLACKOUT), cv2.COLOR_BGR2GRAY)
+        return cv2.mean(frame_gray)[0]
+
+
     def get_screen(self) -> str:
         """現在のフレームのステータス（どの画面か）を取得
 
+        判定の順序・結果は変えずに、キャラクター選択画面の照合の前に事前判定する（screen_cascade）
+
+        Returns:
+            str: ステータス文字列
+        """
+        screen = self._get_screen()
+        self.screen_cascade.record_screen(screen)
+        return screen
+
+
+    def _get_screen(self) -> str:
+        """現在のフレームのステータス（どの画面か）を判定する（get_screen()）
+
         Returns:
             str: ステータス文字列
         """
@@ -444,8 +803,7 @@ class AnalyzeVideo:
             #対戦画面・試合成立後
             return C.STAT.SCRN_MATCHVALID
 
-        #if self.is_charaselect():
-        if self.is_matchimage(self.matchtemplate.img_charaselect, C.IMG_MATCH.AREA_CHARASELECT, C.MATCH_TEMPLATE.CHARASEL_COLOR):
+        if self.is_charaselect():
             #キャラクター選択画面
             return C.STAT.SCRN_CHARASELECT
 
@@ -455,62 +813,30 @@ class AnalyzeVideo:
 
         return C.STAT.SCRN_OTHERS
 
+# ここまで 画面ステータス関連
 
-    def get_screen2(self, prev_status: str) -> str:
-        """現在のフレームのステータス（どの画面か）を取得
+# ここから キャラクタ名関連
+    def get_charaname(self, left: bool, matcher: NameMatcher):
+        """現在のフレーム内で表示されているキャラクター名（片方）を取得
 
         Args:
-            prev_status (str): 直前のステータス
+            left (bool): 左（True）、右（False）
+            matcher (NameMatcher): キャラクター名画像の一括照合（CharNames.matcher_L、matcher_R）
 
         Returns:
-            str: ステータス文字列
+            str: キャラクター名文字列
+            float: 信頼度最大値
         """
-        # is_duringmatch の遅延実行とキャッシュ
-        _ret_duringmatch = None
-        def ret_duringmatch():
-            nonlocal _ret_duringmatch
-            if _ret_duringmatch is None:
-                _ret_duringmatch = self.is_duringmatch()
-            return _ret_duringmatch
-
-        # 判定関数マッピング（すべて遅延評価）
-        check_map = {
-            C.STAT.SCRN_MATCHVALID:   lambda: ret_duringmatch() == C.STAT.STATNO_MATCHVALID,
-            C.STAT.SCRN_MATCHINVALID: lambda: ret_duringmatch() == C.STAT.STATNO_MATCHINVALID,
-            C.STAT.SCRN_CHARASELECT:  lambda: self.is_charaselect(),
-            C.STAT.SCRN_BLACKOUT:     lambda: self.is_blackout()
-        }
+        return self.features.get('charaname_L' if left else 'charaname_R',
+                                 lambda: self._calc_charaname(left, matcher))
 
-        # 判定順の初期値（柔軟に順番を決める）
-        default_order = [
-            C.STAT.SCRN_MATCHVALID,
-            C.STAT.SCRN_MATCHINVALID,
-            C.STAT.SCRN_CHARASELECT,
-            C.STAT.SCRN_BLACKOUT
-        ]
-
-        if prev_status in default_order:
-            # prev_status を先頭に移動（優先判定）
-            ordered_statuses = [prev_status] + [s for s in default_order if s != prev_status]
-        else:
-            ordered_statuses = default_order
-
-        # 順に評価し、最初にマッチしたものを返す
-        for status in ordered_statuses:
-            if check_map[status]():
-                return status
-
-        return C.STAT.SCRN_OTHERS
-
-# ここまで 画面ステータス関連
 
-# ここから キャラクタ名関連
-    def get_charaname(self, left: bool, charnames):
-        """現在のフレーム内で表示されているキャラクター名（片方）を取得
+    def _calc_charaname(self, left: bool, matcher: NameMatcher):
+        """現在のフレーム内で表示されているキャラクター名（片方）を照合する（get_charaname()）
 
         Args:
             left (bool): 左（True）、右（False）
-            charnames (CharNames): キャラクター名およびキャラクター名画像のリスト
+            matcher (NameMatcher): キャラクター名画像の一括照合
 
         Returns:
             str: キャラクター名文字列
@@ -522,27 +848,65 @@ class AnalyzeVideo:
         else:
             area = C.IMG_MATCH.AREA_CHARNAME_R
 
-        name = C.CHAR.NOMATCH
-        max_temp = 0.0
-
-        matched_characters = []
-
-        # 信頼度最大値（max_val）が 0.6 より大きいもののうち、最大のものを返す
-        for charadata in charnames:
-            max_val = self.get_maxval(charadata['image'], area, C.CHAR.COLOR)
-            if max_val > max_temp:
-                max_temp = max_val
-                name = charadata['charname']
+        # 全キャラクター名画像のうち、信頼度最大値（max_val）が最大のもの
+        name, max_temp = matcher.match(self.get_roi(area))
 
+        # 信頼度最大値が 0.6 より大きければ、そのキャラクター名を返す
         if max_temp > 0.6:
             return  name, max_temp
 
         return C.CHAR.NOMATCH, max_temp
 
 
+    def keep_charanames(self) -> None:
+        """現在のフレーム（キャラクター選択画面）を、キャラクター名の取得用に name_buffer に残す
+
+        試合開始時に get_charanames() でフレームに戻って読み込み直さずに済むよう、
+        直近 C.CHAR.NAME_BUFFER フレーム分の切り出した範囲と判定結果を残す
+        """
+        if not self.name_buffer or self.name_buffer[-1].frame_no != self.features.frame_no:
+            self.name_buffer.append(self.features)
+
+
+    def _vote_charanames(self, samples: list):
+        """name_buffer のフレームのキャラクター名を、信頼度の合計で多数決する
+
+        Args:
+            samples (list[FrameFeatures]): キャラクター名を取得するフレームと、その前のフレーム（最後が取得するフレーム）
+
+        Returns:
+            str: キャラクター名文字列（左）
+            str: キャラクター名文字列（右）
+            float: 信頼度最大値（左）
+            float: 信頼度最大値（右）
+        """
+        names, maxvals = [], []
+        for key in ('charaname_L', 'charaname_R'):
+            votes = {}
+            best = {}
+            for features in samples:
+                name, max_val = self.get_feature(features, key)
+                if name != C.CHAR.NOMATCH:
+                    votes[name] = votes.get(name, 0.0) + max_val
+                best[name] = max(best.get(name, max_val), max_val)
+
+            # どのフレームでも照合できなければ、取得するフレームの結果（nomatch）とする
+            target_name, target_val = self.get_feature(samples[-1], key)
+            name = max(votes, key=votes.get) if votes else target_name
+            names.append(name)
+            maxvals.append(target_val if name == target_name else best[name])
+
+        return names[0], names[1], maxvals[0], maxvals[1]
+
+
     def get_charanames(self, fno_eofcharasel):
         """指定したフレーム番号で表示されているキャラクター名（左右）を取得
 
+        指定したフレームと、その前 C.CHAR.NAME_VOTE_SPAN 秒のキャラクター選択画面の解析間隔
+        （C.PROC_SPD.INTVL_CHARASELECT）ごとのフレームのうち、キャラクター選択画面のフレームで多数決する。
+        多数決するフレームは動画だけで決まる（解析の経過によらない）ので、区間並列解析・途中経過からの再開でも
+        逐次解析と同じ結果になる。name_buffer に残したフレームは読み込まずに使い、無いフレームだけ読み込む。
+
         Args:
             fno_eofmatch (int): キャラクター名を取得するフレーム番号
 
@@ -552,16 +916,37 @@ class AnalyzeVideo:
             float: 信頼度最大値（左）
             float: 信頼度最大値（右）
         """
+        step = max(1, int(self.fps * C.PROC_SPD.INTVL_CHARASELECT))
+        span = int(self.fps * C.CHAR.NAME_VOTE_SPAN)
+        buffered = {features.frame_no: features for features in self.name_buffer}
+
         # 元のフレーム番号を退避
         fno_temp = self.frame_no
-        ret = self.set_frame(fno_eofcharasel)
-
-        name_L, maxval_L = self.get_charaname(True,  self.charanames.charnames_L)
-        name_R, maxval_R = self.get_charaname(False, self.charanames.charnames_R)
+        samples = []
+        seeked = False
+        for fno in range(fno_eofcharasel - span // step * step, fno_eofcharasel + 1, step):
+            features = buffered.get(fno)
+            if features is None:
+                seeked = True
+                if not self.set_frame(fno):
+                    continue
+                # 取得するフレーム以外は、キャラクター選択画面の場合だけ使う（name_buffer に残すフレームと同じ）
+                if fno != fno_eofcharasel and self._get_screen() != C.STAT.SCRN_CHARASELECT:
+                    continue
+                features = self.features
+            samples.append(features)
+
+        if seeked:
+            # 元のフレーム番号に戻す
+            self.set_frame(fno_temp)
+            self.cnt_name_seek += 1
+        else:
+            self.cnt_name_buffer += 1
 
-        # 元のフレーム番号に戻す
-        ret = self.set_frame(fno_temp)
-        return name_L, name_R, maxval_L, maxval_R
+        if not samples or samples[-1].frame_no != fno_eofcharasel:
+            # 取得するフレームを読み込めなかった
+            return C.CHAR.NOMATCH, C.CHAR.NOMATCH, 0.0, 0.0
+        return self._vote_charanames(samples)
 
 # ここまで キャラクタ名関連
 
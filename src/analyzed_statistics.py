@@ -1,7 +1,15 @@
 """処理結果統計情報格納クラス
 """
+import dataclasses
+import json
 import os
 from constants import Constants as C
+from frame_prefetcher import PrefetchStats
+from prescan import PRESCAN_KEYS, PreScanStats
+from roi_cache import RoiCacheStats
+from screen_cascade import CascadeStats
+from sample_scheduler import SchedulerStats
+from stage_stats import StageStats, pad_text
 
 class AnalyzedStatistics:
     """処理結果統計情報格納クラス
@@ -21,6 +29,43 @@ class AnalyzedStatistics:
         self.cnt_matchfinished: int = 0
         self.cnt_other: int         = 0
 
+        # 判定結果（FrameFeatures）の再利用回数・計算回数
+        self.cnt_feature_hit: int  = 0
+        self.cnt_feature_miss: int = 0
+        self.cnt_decoded: int      = 0
+
+        # キャラクター名を、キャラクター選択画面で残したフレームから取得した回数と、フレームに戻って取得した回数
+        self.cnt_name_buffer: int = 0
+        self.cnt_name_seek: int   = 0
+
+        # 切り出した範囲のキャッシュ（AnalyzeVideo.frame_cache）の統計情報
+        self.roi_cache_stats: RoiCacheStats = None
+
+        # 保存済みの判定結果を使ったフレーム数（保存しない場合は None）
+        self.cnt_cache_replay: int = None
+
+        # 途中経過から再開した場合、再開したフレーム番号（再開していなければ None）と、それまでの解析フレーム数
+        self.resume_fno: int = None
+        self.resume_cnt: int = 0
+
+        # 画面の切り替わりを二分探索するために解析したフレーム数
+        self.cnt_refine: int = 0
+
+        # フレームの先読みの統計情報（先読みしていなければ None）
+        self.prefetch_stats: PrefetchStats = None
+
+        # 処理段階ごとの時間・回数（計測していなければ None）
+        self.stage_stats: StageStats = None
+
+        # 事前走査の統計情報（事前走査していなければ None）
+        self.prescan_stats: PreScanStats = None
+
+        # 解析間隔の予測の統計情報（予測していなければ None）
+        self.scheduler_stats: SchedulerStats = None
+
+        # 画面判定の事前判定の統計情報
+        self.cascade_stats: CascadeStats = None
+
 
     def ts_format(self, time_in_seconds: int) -> str:
         """秒数から h:mm:ss の書式の文字列を返す
@@ -52,14 +97,12 @@ class AnalyzedStatistics:
         return self.ts_format(total_seconds)
 
 
-    def get_result(self) -> str:
-        total_seconds = 0
-        if self.fps > 0:
-            total_seconds = int( self.totalframes / self.fps )
-
-        elapsedtime   = self.endtime - self.starttime
-        elaps_seconds = int(elapsedtime.total_seconds())
+    def get_cnt_total(self) -> int:
+        """解析したフレーム数の合計を返す
 
+        Returns:
+            int: 解析したフレーム数
+        """
         cnt_total  = 0
         cnt_total += self.cnt_charaselect
         cnt_total += self.cnt_blackout
@@ -68,37 +111,253 @@ class AnalyzedStatistics:
         cnt_total += self.cnt_matchfinished
         cnt_total += self.cnt_other
 
+        return cnt_total
+
+
+    def get_speed(self):
+        """処理速度（1秒あたりのフレーム数）を返す
+
+        Returns:
+            float: 動画換算の処理速度（総フレーム数 / 所要時間）
+            float: 解析したフレームの処理速度（解析フレーム数 / 所要時間）
+        """
+        elaps_seconds = (self.endtime - self.starttime).total_seconds()
+        if elaps_seconds <= 0:
+            return 0.0, 0.0
+
+        # 途中経過から再開した場合は、今回解析した範囲の速度
+        totalframes = self.totalframes - (self.resume_fno or 0)
+        return totalframes / elaps_seconds, (self.get_cnt_total() - self.resume_cnt) / elaps_seconds
+
+
+    def get_result(self) -> str:
+        total_seconds = 0
+        if self.fps > 0:
+            total_seconds = int( self.totalframes / self.fps )
+
+        elapsedtime   = self.endtime - self.starttime
+        elaps_seconds = int(elapsedtime.total_seconds())
+
+        cnt_total = self.get_cnt_total()
+        fps_video, fps_sample = self.get_speed()
+
+        # 0除算防止
+        pct_base = max(cnt_total, 1)
+
         stats_text  = f'処理対象ファイル：{self.file_name}\n\n'
 
         stats_text += f'処理開始：{self.starttime.strftime("%Y-%m-%d %H:%M:%S")}\n'
         stats_text += f'処理終了：{self.endtime.strftime("%Y-%m-%d %H:%M:%S")}\n'
         ########################：YYYY-mm-dd HH:MM:SS
-        stats_text += f'所要時間：            {self.ts_format(elaps_seconds)} ({(elaps_seconds / total_seconds * 100):5.1f}%)\n'
-        stats_text += f'動画時間：            {self.ts_format(total_seconds)} / {self.fps}fps\n\n'
+        stats_text += f'所要時間：            {self.ts_format(elaps_seconds)} ({(elaps_seconds / max(total_seconds, 1) * 100):5.1f}%)\n'
+        stats_text += f'動画時間：            {self.ts_format(total_seconds)} / {self.fps}fps\n'
+        if self.resume_fno is not None:
+            resume_seconds = int(self.resume_fno / self.fps) if self.fps > 0 else 0
+            stats_text += f'再開位置：            {self.ts_format(resume_seconds)} （途中経過から再開）\n'
+        stats_text += f'処理速度：{fps_video:12.1f} フレーム/秒（動画換算）\n'
+        stats_text += f'解析速度：{fps_sample:12.1f} フレーム/秒（解析フレーム）\n\n'
 
         stats_text +=  '処理結果統計\n'
-        stats_text += f'キャラ選択：{self.cnt_charaselect  :7d} ({(self.cnt_charaselect   / cnt_total * 100):5.1f}%)\n'
-        stats_text += f'暗転画面　：{self.cnt_blackout     :7d} ({(self.cnt_blackout      / cnt_total * 100):5.1f}%)\n'
-        stats_text += f'試合中　　：{self.cnt_matstarted   :7d} ({(self.cnt_matstarted    / cnt_total * 100):5.1f}%)\n'
-        stats_text += f'残１フラグ：{self.cnt_lastoneflag  :7d} ({(self.cnt_lastoneflag   / cnt_total * 100):5.1f}%)\n'
-        stats_text += f'試合終了後：{self.cnt_matchfinished:7d} ({(self.cnt_matchfinished / cnt_total * 100):5.1f}%)\n'
-        stats_text += f'その他　　：{self.cnt_other        :7d} ({(self.cnt_other         / cnt_total * 100):5.1f}%)\n'
+        stats_text += f'キャラ選択：{self.cnt_charaselect  :7d} ({(self.cnt_charaselect   / pct_base * 100):5.1f}%)\n'
+        stats_text += f'暗転画面　：{self.cnt_blackout     :7d} ({(self.cnt_blackout      / pct_base * 100):5.1f}%)\n'
+        stats_text += f'試合中　　：{self.cnt_matstarted   :7d} ({(self.cnt_matstarted    / pct_base * 100):5.1f}%)\n'
+        stats_text += f'残１フラグ：{self.cnt_lastoneflag  :7d} ({(self.cnt_lastoneflag   / pct_base * 100):5.1f}%)\n'
+        stats_text += f'試合終了後：{self.cnt_matchfinished:7d} ({(self.cnt_matchfinished / pct_base * 100):5.1f}%)\n'
+        stats_text += f'その他　　：{self.cnt_other        :7d} ({(self.cnt_other         / pct_base * 100):5.1f}%)\n'
         ################　　　　　：1234567 (100.0%)
         stats_text +=  '----------------------------\n'
         stats_text += f'計　　　　：{cnt_total        :7d} (100.0%)\n'
-        stats_text += f'処理フレーム/総フレーム：{cnt_total:d}/{self.totalframes:d} ({(cnt_total / self.totalframes * 100):.1f}%)'
+        stats_text += f'処理フレーム/総フレーム：{cnt_total:d}/{self.totalframes:d} ({(cnt_total / max(self.totalframes, 1) * 100):.1f}%)\n'
+        if self.cnt_refine > 0:
+            stats_text += f'切り替わりの探索：{self.cnt_refine:d} フレーム\n'
+        stats_text += '\n'
+
+        cnt_feature = max(self.cnt_feature_hit + self.cnt_feature_miss, 1)
+        stats_text +=  '判定結果の再利用\n'
+        stats_text += f'再利用　　：{self.cnt_feature_hit :7d} ({(self.cnt_feature_hit  / cnt_feature * 100):5.1f}%)\n'
+        stats_text += f'計算　　　：{self.cnt_feature_miss:7d} ({(self.cnt_feature_miss / cnt_feature * 100):5.1f}%)\n'
+        stats_text += f'デコード　：{self.cnt_decoded     :7d} フレーム\n'
+        stats_text += f'キャラ名　：{self.cnt_name_buffer :7d} 回（選択画面から） / {self.cnt_name_seek:d} 回（読み込み）'
+        if self.roi_cache_stats is not None:
+            cache = self.roi_cache_stats
+            stats_text += (f'\nキャッシュ：{cache.hits:7d} 回（{cache.get_hit_rate() * 100:.1f}%） / '
+                           f'最大 {cache.peak_bytes / 1024:.0f} KB（上限 {cache.budget / 1024:.0f} KB、破棄 {cache.cnt_evict:d} フレーム）')
+        if self.cnt_cache_replay is not None:
+            stats_text += f'\n保存済み　：{self.cnt_cache_replay:7d} フレーム'
+
+        if self.prefetch_stats is not None:
+            prefetch = self.prefetch_stats
+            stats_text += '\n\nフレームの先読み\n'
+            stats_text += f'キュー　　：上限 {prefetch.depth:d} / 平均 {prefetch.get_avg_queued():.1f} フレーム\n'
+            stats_text += f'待ち時間　：解析側 {prefetch.stall_consumer:.1f} 秒 / デコード側 {prefetch.stall_producer:.1f} 秒\n'
+            stats_text += f'予定変更　：{prefetch.cnt_replan:d} 回（破棄 {prefetch.cnt_discard:d} フレーム）'
+
+        if self.prescan_stats is not None:
+            prescan = self.prescan_stats
+            total = max(self.totalframes, 1)
+            stats_text += '\n\n事前走査\n'
+            stats_text += f'走査　　　：{prescan.cnt_sample:7d} フレーム（{prescan.interval:d} フレーム間隔、{prescan.elapsed:.1f} 秒）\n'
+            stats_text += '変化なし　：' + '、'.join(f'{StageStats.get_label(key).rstrip()} {prescan.quiet_frames[key] / total * 100:.1f}%'
+                                               for key in PRESCAN_KEYS) + '\n'
+            stats_text += f'使い回し　：{prescan.cnt_shared:7d} フレーム'
+
+        if self.scheduler_stats is not None:
+            scheduler = self.scheduler_stats
+            stats_text += '\n\n解析間隔の予測\n'
+            stats_text += f'延長　　　：{scheduler.cnt_jump:7d} 回（省いたフレーム {scheduler.cnt_skipped:d}）\n'
+            stats_text += (f'的中率　　：予測 {scheduler.get_predicted_rate() * 100:.1f}% / 実績 {scheduler.get_hit_rate() * 100:.1f}%'
+                           f'（外れ {scheduler.cnt_jump - scheduler.cnt_hit:d} 回）')
+
+        if self.cascade_stats is not None and self.cascade_stats.transitions:
+            stats_text += '\n\n' + self.cascade_stats.get_result()
+
+        if self.stage_stats is not None:
+            stats_text += '\n\n' + self.stage_stats.get_result()
+            # 解析に使ったフレーム数と、実際にデコードしたフレーム数（読み進めで読み捨てた分を含む）
+            stats_text += f'\nフレーム数：解析 {self.get_cnt_total() + self.cnt_refine:d}'
+            stats_text += f' / 読み込み {self.cnt_decoded:d} / デコード {self.stage_stats.cnt_grab:d}'
 
         return stats_text
 
 
-    def write_stats(self, stats_text: str) -> None:
+    def to_dict(self) -> dict:
+        """統計情報を JSON に書き込める形式に変換する
+
+        Returns:
+            dict: 統計情報
+        """
+        fps_video, fps_sample = self.get_speed()
+        return {
+            'version': C.STATS_JSON_VERSION,
+            'file_name': self.file_name,
+            'fps': self.fps,
+            'totalframes': self.totalframes,
+            'starttime': self.starttime.isoformat(timespec='seconds'),
+            'endtime': self.endtime.isoformat(timespec='seconds'),
+            'elapsed': round((self.endtime - self.starttime).total_seconds(), 3),
+            'speed_video': round(fps_video, 1),
+            'speed_sample': round(fps_sample, 1),
+            'resume_fno': self.resume_fno,
+            'counts': {
+                'charaselect':   self.cnt_charaselect,
+                'blackout':      self.cnt_blackout,
+                'matstarted':    self.cnt_matstarted,
+                'lastoneflag':   self.cnt_lastoneflag,
+                'matchfinished': self.cnt_matchfinished,
+                'other':         self.cnt_other,
+                'total':         self.get_cnt_total(),
+                'refine':        self.cnt_refine,
+            },
+            'features': {
+                'hit':          self.cnt_feature_hit,
+                'miss':         self.cnt_feature_miss,
+                'decoded':      self.cnt_decoded,
+                'cache_replay': self.cnt_cache_replay,
+                'name_buffer':  self.cnt_name_buffer,
+                'name_seek':    self.cnt_name_seek,
+            },
+            'roi_cache': dataclasses.asdict(self.roi_cache_stats) if self.roi_cache_stats is not None else None,
+            'prefetch': dataclasses.asdict(self.prefetch_stats) if self.prefetch_stats is not None else None,
+            'prescan': dataclasses.asdict(self.prescan_stats) if self.prescan_stats is not None else None,
+            'scheduler': dataclasses.asdict(self.scheduler_stats) if self.scheduler_stats is not None else None,
+            'cascade': dataclasses.asdict(self.cascade_stats) if self.cascade_stats is not None else None,
+            'stages': self.stage_stats.to_dict() if self.stage_stats is not None else None,
+        }
+
+
+    def get_comparison(self, prev: dict) -> str:
+        """前回の統計情報（to_dict() の形式）と比較した文字列を返す
+
+        Args:
+            prev (dict): 前回の統計情報
+
+        Returns:
+            str: 前回 → 今回 の差分
+        """
+        cur = self.to_dict()
+
+        def line(label, prev_value, cur_value, unit=''):
+            if prev_value > 0:
+                diff = f'{(cur_value - prev_value) / prev_value * 100:+6.1f}%'
+            else:
+                diff = '     -'
+            return f'{pad_text(label, 14)}{prev_value:10.2f} → {cur_value:10.2f} ({diff}){unit}\n'
+
+        text  = f'前回との比較（{prev["starttime"]} {prev["file_name"]}）\n'
+        text += line('所要時間', prev['elapsed'], cur['elapsed'], ' 秒')
+        text += line('処理速度', prev['speed_video'], cur['speed_video'], ' フレーム/秒')
+        text += line('解析速度', prev['speed_sample'], cur['speed_sample'], ' フレーム/秒')
+        text += line('解析', prev['counts']['total'], cur['counts']['total'], ' フレーム')
+        text += line('読み込み', prev['features']['decoded'], cur['features']['decoded'], ' フレーム')
+
+        prev_stages = StageStats.from_dict(prev['stages']) if prev.get('stages') else StageStats()
+        cur_stages = self.stage_stats if self.stage_stats is not None else StageStats()
+        text += line('デコード数', prev_stages.cnt_grab, cur_stages.cnt_grab, ' フレーム')
+        text += line('シーク回数', prev_stages.cnt_seek, cur_stages.cnt_seek, ' 回')
+        # 処理段階ごとの時間（秒）
+        for stage in cur_stages.get_stages() + [s for s in prev_stages.get_stages() if s not in cur_stages.counts]:
+            if stage not in prev_stages.counts and stage not in cur_stages.counts:
+                continue
+            text += line(StageStats.get_label(stage), prev_stages.times.get(stage, 0.0), cur_stages.times.get(stage, 0.0), ' 秒')
+
+        return text.rstrip('\n')
+
+
+    def write_json(self, json_file: str) -> None:
+        """統計情報を JSON でファイルに書き込む
+
+        Args:
+            json_file (str): 出力ファイルのパス
+        """
+        with open(json_file, 'w', encoding=C.OUTPUT_ENCODING) as file:
+            json.dump(self.to_dict(), file, ensure_ascii=False, indent=1)
+
+
+    @staticmethod
+    def load_json(json_file: str) -> dict:
+        """write_json() で書き込んだ統計情報を読み込む
+
+        Args:
+            json_file (str): ファイルのパス
+
+        Returns:
+            dict: 統計情報（無い、または読み込めなければ None）
+        """
+        try:
+            with open(json_file, encoding=C.OUTPUT_ENCODING) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if data.get('version') != C.STATS_JSON_VERSION:
+            return None
+        return data
+
+
+    @staticmethod
+    def get_json_path(statis_file: str) -> str:
+        """統計情報ファイル（statistics.txt）に対応する JSON ファイルのパス
+
+        Args:
+            statis_file (str): 統計情報ファイルのパス
+
+        Returns:
+            str: JSON ファイルのパス
+        """
+        return os.path.splitext(statis_file)[0] + '.json'
+
+
+    def write_stats(self, stats_text: str, statis_file: str = None) -> None:
         """解析結果統計情報をファイルに書き込む
 
         Args:
             stats_text (str): 解析結果統計情報の文字列
+            statis_file (str): 出力ファイルのパス。省略時はカレントディレクトリの（日付）statistics.txt
+                               拡張子を .json にしたファイルにも、同じ内容を JSON で書き込む
         """
-        prefix = self.endtime.strftime('%Y%m%d')
-        statis_file = prefix + C.STATIS_FILE
+        if statis_file is None:
+            prefix = self.endtime.strftime('%Y%m%d')
+            statis_file = prefix + C.STATIS_FILE
 
         # 出力ファイルが既に存在しているなら削除
         if os.path.exists(statis_file):
@@ -107,3 +366,6 @@ class AnalyzedStatistics:
         with open(statis_file, 'w', encoding=C.OUTPUT_ENCODING) as file:
             file.write(f'{stats_text}\n')
 
+        # 同じ内容を JSON でも書き込む
+        self.write_json(self.get_json_path(statis_file))
+
@@ -1,6 +1,7 @@
 """処理データ
 """
 from constants import Constants as C
+from sample_scheduler import get_base_skips
 
 class AnalyzedVideoData:
     """処理データクラス
@@ -9,7 +10,11 @@ class AnalyzedVideoData:
         totalframes (int): 動画の総フレーム数
         is_cancel (bool): キャンセルボタンが押されたかどうか
         timestamps_text (list[str]): タイムスタンプ文字列のリスト
-        skips (dict[int, int]): スキップ間隔（フレーム）の連想配列
+        matches (list[MatchResult]): 決着した試合の結果のリスト
+        frame_no (int): 最後に解析したフレーム番号
+        skip (int): 現在のスキップ間隔（フレーム）
+        skip_key (int): 現在の状態（SampleScheduler.skips のキー）
+        stat_text (str): 現在のステータス文字列
 
         mstat (int): 試合進行状況ステータス
         mdata (MatchData): 現在の試合のデータ
@@ -20,7 +25,11 @@ class AnalyzedVideoData:
         self.totalframes: int = 0
         self.is_cancel: bool = False
         self.timestamps_text: list[str] = ['Timestamps:\n', '0:00:00 Settings\n']
-        self.skips: dict[int, int] = None
+        self.matches: list[MatchResult] = []
+        self.frame_no: int = 0
+        self.skip: int = 0
+        self.skip_key: int = 1
+        self.stat_text: str = 'その他　　　　　　　'
 
         self.mstat = C.STAT.MSTAT_CHARASELECT
         self.mdata = MatchData()
@@ -28,20 +37,12 @@ class AnalyzedVideoData:
 
 
     def set_fps(self, fps: float) -> None:
-        """fps をセットするとともにスキップ間隔（フレーム）の連想配列を生成
+        """fps をセットするとともに最初のスキップ間隔（フレーム）をセット
         Args:
             fps (float): 動画のフレームレート
         """
         self.fps = fps
-
-        self.skips = {
-            1: int( fps * C.PROC_SPD.INTVL_CHARASELECT ),
-            2: int( fps * C.PROC_SPD.INTVL_MATCHFINISHED ),
-            3: int( fps * C.PROC_SPD.INTVL_LASTONEFLAG ),
-            4: int( fps * C.PROC_SPD.INTVL_MATCHSTARTED ),
-            5: int( fps * C.PROC_SPD.INTVL_BLACKOUT ),
-            0: int( fps * C.PROC_SPD.INTVL_OTHERS )
-        }
+        self.skip = get_base_skips(fps)[self.skip_key]
 
 
     def ts_format(self, frame_no: int) -> str:
@@ -63,6 +64,32 @@ class AnalyzedVideoData:
         return f'{h:d}:{m:02d}:{s:02d}'
 
 
+    def add_match(self, result: 'MatchResult') -> str:
+        """決着した試合を記録し、タイムスタンプ文字列を追加する
+
+        Args:
+            result (MatchResult): 試合の結果
+
+        Returns:
+            str: 勝敗の文字列（例: 'Player1 win by 3:1'）
+        """
+        self.mdata.match_no += 1
+        self.matches.append(result)
+
+        # フォーマットされた文字列を作成
+        ts_text  = self.ts_format(result.fno_startmatch)
+        match_no = self.mdata.match_no
+        name_l   = result.name_L
+        name_r   = result.name_R
+        timestamp = f'{ts_text} M{match_no:02d}: Player1 - {name_l} vs Player2 - {name_r}'
+        self.timestamps_text.append(timestamp + '\n')
+
+        winnerstr = result.get_winner_text()
+        self.timestamps_text.append(winnerstr + '\n')
+
+        return winnerstr
+
+
     def set_progress(self, frame_no: int) -> None:
         """フレーム番号から進捗状況の値をセット
         Args:
@@ -78,6 +105,9 @@ class AnalyzedVideoData:
         self.progress.bar   = int(progress * C.BAR.MAX)
         self.progress.pct   = round( (progress * 100), 1 )
         self.progress.txt   = f'進捗:{self.progress.pct:5.1f}%({ts_text}) '
+        if self.totalframes <= 0:
+            # 書き込み中の動画は総フレーム数が不明なので、解析した位置だけを表示する
+            self.progress.txt = f'解析中:({ts_text}) '
 
 
 class MatchData:
@@ -101,6 +131,49 @@ class MatchData:
         self.max_flags: int       = 0
 
 
+class MatchResult:
+    """決着した試合の結果
+    Attributes:
+        frame_no (int): 決着を検出したフレーム番号
+        fno_startmatch (int): 試合開始時のフレーム番号
+        name_L (str): キャラクター名（左）
+        name_R (str): キャラクター名（右）
+        flags_L (int): 左プレイヤー獲得フラッグ数
+        flags_R (int): 右プレイヤー獲得フラッグ数
+    """
+    def __init__(self, frame_no: int, mdata: MatchData, flags_L: int, flags_R: int):
+        """コンストラクタ
+
+        Args:
+            frame_no (int): 決着を検出したフレーム番号
+            mdata (MatchData): 現在の試合のデータ
+            flags_L (int): 左プレイヤー獲得フラッグ数
+            flags_R (int): 右プレイヤー獲得フラッグ数
+        """
+        self.frame_no: int       = frame_no
+        self.fno_startmatch: int = mdata.fno_startmatch
+        self.name_L: str         = mdata.name_L
+        self.name_R: str         = mdata.name_R
+        self.flags_L: int        = flags_L
+        self.flags_R: int        = flags_R
+
+
+    def get_winner_text(self) -> str:
+        """勝敗の文字列を返す
+
+        Returns:
+            str: 勝敗の文字列（例: 'Player1 win by 3:1'）
+        """
+        if   self.flags_L == self.flags_R:
+            winner = 'Draw'
+        elif self.flags_L >  self.flags_R:
+            winner = 'Player1 win'
+        else:
+            winner = 'Player2 win'
+
+        return "{} by {}:{}".format(winner, self.flags_L, self.flags_R)
+
+
 class AnalyzedVideoProgress:
     """処理データ進捗状況クラス
     Attributes:
@@ -0,0 +1,323 @@
+"""複数の動画ファイルの一括解析（ワーカープロセス・フォルダ監視）
+"""
+import glob
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+import cv2
+
+from constants import Constants as C
+
+
+@dataclass
+class FileResult:
+    """動画ファイル1件の解析結果
+
+    Attributes:
+        file_path (str): 動画ファイルのパス
+        ok (bool): 解析が完了したか
+        message (str): 失敗した場合の理由
+        cnt_matches (int): 決着した試合数
+        video_seconds (float): 動画時間（秒）
+        elapsed (float): 所要時間（秒）
+        timestamps_file (str): タイムスタンプ出力ファイルのパス
+        stats_file (str): 統計情報出力ファイルのパス
+    """
+    file_path: str
+    ok: bool = False
+    message: str = ''
+    cnt_matches: int = 0
+    video_seconds: float = 0.0
+    elapsed: float = 0.0
+    timestamps_file: str = None
+    stats_file: str = None
+
+
+def expand_videos(patterns: list) -> list:
+    """動画ファイルのパスのリストを、ワイルドカードを展開したリストにする
+
+    Windows のシェルはワイルドカードを展開しないため、ここで展開する。
+
+    Args:
+        patterns (list[str]): 動画ファイルのパスまたはワイルドカード（*.mp4 など）
+
+    Returns:
+        list[str]: 動画ファイルのパスのリスト（重複は除く。マッチしないワイルドカードはそのまま残す）
+    """
+    videos = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else []
+        for path in matched or [pattern]:
+            if path not in videos:
+                videos.append(path)
+    return videos
+
+
+class VideoWatcher:
+    """フォルダを監視し、書き込みが終わった動画ファイルを見つけるクラス
+
+    前回の確認時から大きさ・更新日時が変わっていない動画ファイルを、書き込みが終わったものとみなす。
+
+    Attributes:
+        directory (str): 監視するフォルダ
+        seen (set[str]): 見つけた動画ファイルのパス
+    """
+
+
+    def __init__(self, directory: str):
+        """コンストラクタ
+
+        Args:
+            directory (str): 監視するフォルダ
+        """
+        self.directory = directory
+        self.seen = set()
+        self._prev = {}
+
+
+    def poll(self) -> list:
+        """フォルダを確認し、新しく書き込みが終わった動画ファイルを返す
+
+        Returns:
+            list[str]: 動画ファイルのパスのリスト（名前順）
+        """
+        current = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or os.path.splitext(entry.name)[1].lower() not in C.BATCH.EXTENSIONS:
+                continue
+            if entry.path in self.seen:
+                continue
+            stat = entry.stat()
+            current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        ready = sorted(path for path, state in current.items()
+                       if state[0] > 0 and self._prev.get(path) == state)
+        self.seen.update(ready)
+        self._prev = current
+        return ready
+
+
+# ワーカープロセスの動画解析クラス（_init_worker() で1度だけ作る）
+_worker_analyze = None
+
+
+def _init_worker(cv_threads: int, create_analyze: Callable) -> None:
+    """ワーカープロセスの初期化
+
+    Args:
+        cv_threads (int): ワーカー1つあたりの OpenCV のスレッド数
+        create_analyze (Callable[[], AnalyzeVideo]): 動画解析クラスを作る関数
+    """
+    global _worker_analyze
+    cv2.setNumThreads(cv_threads)
+    # テンプレート画像はワーカーごとに1度だけ読み込み、以降の動画で使い回す
+    _worker_analyze = create_analyze()
+
+
+def _run_analyze_file(analyze_file: Callable, analyze, file_path: str) -> FileResult:
+    """動画ファイル1件を解析する（例外が発生した場合は、失敗した結果を返して次の動画ファイルに進む）
+
+    Args:
+        analyze_file (Callable[[AnalyzeVideo, str], FileResult]): 動画ファイル1件を解析する関数
+        analyze (AnalyzeVideo): 動画解析クラス
+        file_path (str): 動画ファイルのパス
+
+    Returns:
+        FileResult: 解析結果
+    """
+    try:
+        return analyze_file(analyze, file_path)
+    except Exception as e:
+        # 次の動画ファイルで使い回すので、開いたままの動画ファイルを閉じる（閉じる際の例外は無視する）
+        try:
+            analyze.file_close()
+        except Exception:
+            pass
+        return FileResult(file_path, message=f'例外が発生しました。: {e}')
+
+
+def _run_in_worker(analyze_file: Callable, file_path: str) -> FileResult:
+    """ワーカープロセスで動画ファイル1件を解析する
+
+    Args:
+        analyze_file (Callable[[AnalyzeVideo, str], FileResult]): 動画ファイル1件を解析する関数
+        file_path (str): 動画ファイルのパス
+
+    Returns:
+        FileResult: 解析結果
+    """
+    return _run_analyze_file(analyze_file, _worker_analyze, file_path)
+
+
+class BatchRunner:
+    """動画ファイルを順に、またはワーカープロセスで並行して解析するクラス
+
+    workers が1なら、collect() を呼んだプロセスで1件ずつ解析する。
+    2以上なら、ワーカープロセスで並行して解析し、CPU コアをワーカー間で分け合う。
+
+    Attributes:
+        workers (int): ワーカープロセス数
+        cv_threads (int): ワーカー1つあたりの OpenCV のスレッド数
+        results (list[FileResult]): 解析が終わった動画ファイルの結果（終わった順）
+    """
+
+
+    def __init__(self, create_analyze: Callable, analyze_file: Callable, workers: int = 1):
+        """コンストラクタ
+
+        Args:
+            create_analyze (Callable[[], AnalyzeVideo]): 動画解析クラスを作る関数（ワーカーでも呼ぶので pickle できること）
+            analyze_file (Callable[[AnalyzeVideo, str], FileResult]): 動画ファイル1件を解析する関数（同上）
+            workers (int): ワーカープロセス数
+        """
+        self.workers = workers
+        self.cv_threads = get_worker_threads(workers)
+        self.results = []
+        self.starttime = datetime.now()
+        self._analyze_file = analyze_file
+        self._pending = deque()
+        self._futures = set()
+
+        if workers > 1:
+            self._analyze = None
+            self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker, initargs=(self.cv_threads, create_analyze))
+        else:
+            self._analyze = create_analyze()
+            self._executor = None
+
+
+    def submit(self, file_path: str) -> None:
+        """動画ファイルを解析の順番待ちに加える
+
+        Args:
+            file_path (str): 動画ファイルのパス
+        """
+        if self._executor is not None:
+            self._futures.add(self._executor.submit(_run_in_worker, self._analyze_file, file_path))
+        else:
+            self._pending.append(file_path)
+
+
+    def is_idle(self) -> bool:
+        """解析中・順番待ちの動画ファイルが無いかを返す
+
+        Returns:
+            bool: 無ければTrue
+        """
+        return not self._pending and not self._futures
+
+
+    def collect(self, timeout: float = None) -> list:
+        """解析が終わった動画ファイルの結果を受け取る
+
+        ワーカープロセスを使う場合は、1件以上終わるか timeout 秒経つまで待つ。
+        使わない場合は、順番待ちの先頭の1件を解析する。
+
+        Args:
+            timeout (float): 待つ最長時間（秒）。None なら1件終わるまで待つ
+
+        Returns:
+            list[FileResult]: 今回終わった動画ファイルの結果
+        """
+        if self._executor is None:
+            if not self._pending:
+                if timeout:
+                    time.sleep(timeout)
+                return []
+            file_path = self._pending.popleft()
+            results = [_run_analyze_file(self._analyze_file, self._analyze, file_path)]
+        else:
+            if not self._futures:
+                if timeout:
+                    time.sleep(timeout)
+                return []
+            done, self._futures = wait(self._futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            results = [future.result() for future in done]
+
+        self.results.extend(results)
+        return results
+
+
+    def close(self, cancel: bool = False) -> None:
+        """ワーカープロセスを終了する
+
+        Args:
+            cancel (bool): 順番待ちの動画ファイルを解析せずに終了するか
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=not cancel, cancel_futures=cancel)
+            self._executor = None
+
+
+    def get_summary(self) -> str:
+        """一括解析の結果の一覧を返す
+
+        Returns:
+            str: 動画ファイルごとの結果と合計
+        """
+        elapsed = (datetime.now() - self.starttime).total_seconds()
+        cnt_ok = sum(1 for result in self.results if result.ok)
+        video_seconds = sum(result.video_seconds for result in self.results if result.ok)
+
+        text  = f'一括解析：{self.starttime.strftime("%Y-%m-%d %H:%M:%S")} 開始、'
+        text += f'ワーカー {self.workers} / OpenCV スレッド {self.cv_threads}\n\n'
+        for result in self.results:
+            name = os.path.basename(result.file_path)
+            if result.ok:
+                speed = result.video_seconds / result.elapsed if result.elapsed > 0 else 0.0
+                text += (f'OK  {name}：試合 {result.cnt_matches} / 動画 {ts_format(result.video_seconds)}'
+                         f' / 所要 {ts_format(result.elapsed)}（{speed:.1f} 倍速）\n')
+                text += f'    {result.timestamps_file}\n'
+                text += f'    {result.stats_file}\n'
+            else:
+                text += f'NG  {name}：{result.message}\n'
+
+        text += '\n'
+        text += f'ファイル：{len(self.results)} 件（完了 {cnt_ok} 件、失敗 {len(self.results) - cnt_ok} 件）\n'
+        text += f'動画時間：{ts_format(video_seconds)}\n'
+        text += f'所要時間：{ts_format(elapsed)}'
+        if elapsed > 0:
+            text += f'（{video_seconds / elapsed:.1f} 倍速）'
+        return text
+
+
+    def write_summary(self, summary_file: str) -> None:
+        """一括解析の結果の一覧をファイルに書き込む
+
+        Args:
+            summary_file (str): 出力ファイルのパス
+        """
+        with open(summary_file, 'w', encoding=C.OUTPUT_ENCODING) as file:
+            file.write(f'{self.get_summary()}\n')
+
+
+def get_worker_threads(workers: int) -> int:
+    """ワーカー1つあたりの OpenCV のスレッド数（CPU コアをワーカー間で分け合う）
+
+    Args:
+        workers (int): ワーカープロセス数
+
+    Returns:
+        int: スレッド数（1以上）
+    """
+    return max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+
+def ts_format(seconds: float) -> str:
+    """秒数から h:mm:ss の書式の文字列を返す
+
+    Args:
+        seconds (float): 秒数
+
+    Returns:
+        str: h:mm:ss の書式の文字列
+    """
+    seconds = int(seconds)
+    return f'{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
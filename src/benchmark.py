@@ -0,0 +1,823 @@
+"""処理速度の計測ツール
+
+使用例:
+    python src/benchmark.py source video.mp4 --strides 15 30 180
+    python src/benchmark.py synth out/synth.mp4 --fps 60 --size 1920x1080 --matches 20
+    python src/benchmark.py analyze out/synth.mp4
+    python src/benchmark.py suite --fps 30 60 --sizes 640x360 1920x1080
+    python src/benchmark.py startup --repeat 5
+    python src/benchmark.py lut video.mp4 --stride 30
+    python src/benchmark.py cascade video.mp4 --stride 30
+    python src/benchmark.py parallel --charaselect 0.3
+"""
+import argparse
+import dataclasses
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from constants import Constants as C
+from color_lut import ColorLut, get_flag_lut
+from frame_source import BACKEND_CHOICES, CvFrameSource, create_frame_source
+from analyze_video import AnalyzeVideo
+from analyze_runner import AnalyzeRunner, init_analysis
+from frame_features import FrameFeatures
+from roi_extractor import get_roi
+from parallel_analyze import SerialWalker, analyze_segment, merge_segments
+from synth_video import (SyntheticVideo, SceneLengths, ExpectedMatch, DEFAULT_SCRIPT, parse_script, gen_script,
+                         check_matches)
+
+
+def bench_source(file: str, source_args: dict, stride: int, count: int, start_fno: int = 0) -> dict:
+    """FrameSource で一定間隔のフレームを読み込む速度を計測する
+
+    Args:
+        file (str): 動画ファイルのパス
+        source_args (dict): create_frame_source() の引数
+        stride (int): 読み込むフレームの間隔
+        count (int): 読み込むフレーム数
+        start_fno (int): 読み込みを開始するフレーム番号
+
+    Returns:
+        dict: 計測結果
+    """
+    source = create_frame_source(**source_args)
+    if not source.open(file):
+        raise OSError(f'cannot open: {file}')
+
+    totalframes = source.get_totalframes()
+    targets = [fno for fno in range(start_fno + stride, totalframes, stride)][:count]
+
+    cnt_read = 0
+    start = time.perf_counter()
+    for fno in targets:
+        ret, _ = source.read(fno, stride)
+        if not ret:
+            break
+        cnt_read += 1
+    elapsed = time.perf_counter() - start
+    source.close()
+
+    span = (targets[cnt_read-1] - start_fno) if cnt_read > 0 else 0
+    return {
+        'stride':      stride,
+        'count':       cnt_read,
+        'elapsed':     elapsed,
+        'samples_fps': cnt_read / elapsed if elapsed > 0 else 0.0,
+        'video_fps':   span / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def run_source(args: argparse.Namespace) -> None:
+    """source サブコマンド: 読み込み方法ごとの速度を表示する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+    """
+    print(f'{"strategy":8s} {"model":5s} {"threads":>7s} {"stride":>6s} {"count":>6s} {"elapsed":>8s} {"samples/s":>10s} {"frames/s":>10s}')
+    for strategy in args.strategies:
+        for calibrate in (False, True):
+            for threads in args.threads:
+                source_args = {
+                    'backend':        args.backend,
+                    'threads':        threads,
+                    'ffmpeg_options': args.ffmpeg_options,
+                    'strategy':       strategy,
+                    'calibrate':      calibrate,
+                }
+                for stride in args.strides:
+                    result = bench_source(args.video, source_args, stride, args.count, args.start)
+                    model = 'cost' if calibrate else 'fixed'
+                    print(f'{strategy:8s} {model:5s} {threads:7d} {stride:6d} {result["count"]:6d} {result["elapsed"]:8.3f}'
+                          f' {result["samples_fps"]:10.1f} {result["video_fps"]:10.1f}')
+
+    if not args.pipe:
+        return
+    if shutil.which('ffmpeg') is None:
+        print('ffmpeg が見つからないため、pipe は計測しません')
+        return
+    # ffmpeg のパイプ（デコード側で縮小・間引き）と比較する
+    for threads in args.threads:
+        source_args = {'backend': 'pipe', 'threads': threads}
+        for stride in args.strides:
+            result = bench_source(args.video, source_args, stride, args.count, args.start)
+            print(f'{"pipe":8s} {"-":5s} {threads:7d} {stride:6d} {result["count"]:6d} {result["elapsed"]:8.3f}'
+                  f' {result["samples_fps"]:10.1f} {result["video_fps"]:10.1f}')
+
+
+def get_expected_path(video: str) -> str:
+    """合成動画の期待する試合結果のファイルパス
+
+    Args:
+        video (str): 動画ファイルのパス
+
+    Returns:
+        str: 期待する試合結果（JSON）のパス
+    """
+    return os.path.splitext(video)[0] + '.expected.json'
+
+
+def parse_size(text: str) -> tuple:
+    """'幅x高さ' の文字列を解析する
+
+    Args:
+        text (str): 解像度の文字列（例: '1920x1080'）
+
+    Returns:
+        tuple: (幅, 高さ)
+    """
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def synth_video(path: str, fps: float, size: tuple, codec: str, gop: int, script: list) -> list:
+    """合成動画と、期待する試合結果のファイルを書き出す
+
+    Args:
+        path (str): 出力ファイルのパス
+        fps (float): フレームレート
+        size (tuple): 解像度 (幅, 高さ)
+        codec (str): FourCC
+        gop (int): キーフレームの間隔（0 ならエンコーダーの既定値）
+        script (list[ScriptMatch]): 台本
+
+    Returns:
+        list[ExpectedMatch]: 期待する試合結果
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    video = SyntheticVideo(fps, size, codec, gop)
+    expected = video.write(path, script)
+
+    with open(get_expected_path(path), 'w', encoding=C.OUTPUT_ENCODING) as f:
+        json.dump({'fps': fps, 'matches': [dataclasses.asdict(match) for match in expected]}, f, indent=1)
+    return expected
+
+
+def load_expected(video: str) -> list:
+    """合成動画の期待する試合結果を読み込む
+
+    Args:
+        video (str): 動画ファイルのパス
+
+    Returns:
+        list[ExpectedMatch]: 期待する試合結果（ファイルが無ければ None）
+    """
+    path = get_expected_path(video)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding=C.OUTPUT_ENCODING) as f:
+        data = json.load(f)
+    return [ExpectedMatch(**match) for match in data['matches']]
+
+
+def get_script(args: argparse.Namespace) -> list:
+    """コマンドライン引数から台本を取得する（--matches があればランダムに生成）
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        list[ScriptMatch]: 台本
+    """
+    if args.matches > 0:
+        return gen_script(args.matches, SyntheticVideo().names, args.seed)
+    return parse_script(args.script)
+
+
+def bench_analyze(file: str, source_args: dict) -> dict:
+    """AnalyzeRunner で動画全体を解析する速度を計測する
+
+    Args:
+        file (str): 動画ファイルのパス
+        source_args (dict): create_frame_source() の引数
+
+    Returns:
+        dict: 計測結果（matches は解析結果の試合のリスト）
+    """
+    analyze = AnalyzeVideo(create_frame_source(**source_args))
+    if not analyze.file_open(file):
+        analyze.file_close()
+        raise OSError(f'cannot open: {file}')
+    video_data, astats = init_analysis(analyze, file)
+
+    start = time.perf_counter()
+    try:
+        AnalyzeRunner(analyze, video_data, astats, out=None).run()
+    finally:
+        analyze.file_close()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'elapsed':     elapsed,
+        'totalframes': video_data.totalframes,
+        'fps':         video_data.fps,
+        'samples':     astats.get_cnt_total(),
+        'decoded':     astats.cnt_decoded,
+        'video_fps':   video_data.totalframes / elapsed if elapsed > 0 else 0.0,
+        'matches':     video_data.matches,
+    }
+
+
+def bench_stages(file: str, source_args: dict, stride: int, count: int) -> dict:
+    """AnalyzeVideo の処理段階ごとの時間を計測する
+
+    stride 間隔のフレームごとに、読み込み（シーク・デコード）、範囲の切り出し（縮小）、画面の判定、
+    キャラクター名の照合の時間を測る。別に、連続したフレームのデコード時間も測る。
+
+    Args:
+        file (str): 動画ファイルのパス
+        source_args (dict): create_frame_source() の引数
+        stride (int): 計測するフレームの間隔
+        count (int): 計測するフレーム数
+
+    Returns:
+        dict: 処理段階名をキー、(回数, 合計時間（秒）) を値とする連想配列
+    """
+    analyze = AnalyzeVideo(create_frame_source(**source_args))
+    if not analyze.file_open(file):
+        analyze.file_close()
+        raise OSError(f'cannot open: {file}')
+
+    stages = {name: [0, 0.0] for name in ('decode', 'read', 'resize', 'classify', 'name match')}
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        stages[name][0] += 1
+        stages[name][1] += time.perf_counter() - start
+        return result
+
+    try:
+        source = analyze.source
+        # 連続したフレームのデコード（1フレームあたりのデコード時間）
+        for fno in range(min(count, analyze.totalframes)):
+            ret, _ = timed('decode', source.read, fno)
+            if not ret:
+                break
+
+        for fno in list(range(stride, analyze.totalframes, stride))[:count]:
+            ret, frame = timed('read', source.read, fno)
+            if not ret:
+                break
+            rois = timed('resize', analyze.roi_extractor.extract, frame)
+
+            analyze.features = FrameFeatures(fno, rois)
+            timed('classify', analyze.get_screen)
+            timed('name match', lambda: (
+                analyze.charanames.matcher_L.match(get_roi(rois, C.IMG_MATCH.AREA_CHARNAME_L)),
+                analyze.charanames.matcher_R.match(get_roi(rois, C.IMG_MATCH.AREA_CHARNAME_R))))
+    finally:
+        analyze.file_close()
+
+    return {name: tuple(value) for name, value in stages.items()}
+
+
+def print_stages(stages: dict, stride: int) -> None:
+    """処理段階ごとの時間を表示する
+
+    Args:
+        stages (dict): bench_stages() の戻り値
+        stride (int): 計測したフレームの間隔
+    """
+    labels = {
+        'decode':     'デコード（連続）',
+        'read':       f'読み込み（{stride}間隔）',
+        'resize':     '切り出し・縮小',
+        'classify':   '画面の判定',
+        'name match': 'キャラクター名照合',
+    }
+    print(f'{"stage":12s} {"count":>6s} {"total[s]":>9s} {"ms/each":>8s} {"each/s":>9s}  内容')
+    for name, (count, total) in stages.items():
+        per = total / count * 1000 if count > 0 else 0.0
+        rate = count / total if total > 0 else 0.0
+        print(f'{name:12s} {count:6d} {total:9.3f} {per:8.3f} {rate:9.1f}  {labels[name]}')
+
+
+def run_synth(args: argparse.Namespace) -> None:
+    """synth サブコマンド: 合成動画を生成する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+    """
+    script = get_script(args)
+    start = time.perf_counter()
+    expected = synth_video(args.output, args.fps, parse_size(args.size), args.codec, args.gop, script)
+    print(f'{args.output}: {len(expected)} 試合、{time.perf_counter() - start:.1f} 秒で生成')
+    print(f'期待する試合結果: {get_expected_path(args.output)}')
+
+
+def run_analyze(args: argparse.Namespace) -> bool:
+    """analyze サブコマンド: 解析速度と処理段階ごとの時間を計測し、合成動画なら結果を検証する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        bool: 合成動画の解析結果が期待どおり（または検証しない）ならTrue
+    """
+    source_args = {'backend': args.backend, 'ffmpeg_options': args.ffmpeg_options}
+    result = bench_analyze(args.video, source_args)
+    print(f'動画: {args.video}（{result["totalframes"]} フレーム / {result["fps"]}fps）')
+    print(f'所要時間: {result["elapsed"]:.2f} 秒、処理速度 {result["video_fps"]:.1f} フレーム/秒（動画換算）、'
+          f'解析 {result["samples"]} フレーム、デコード {result["decoded"]} フレーム')
+
+    if args.stride > 0:
+        print()
+        print_stages(bench_stages(args.video, source_args, args.stride, args.count), args.stride)
+
+    expected = load_expected(args.video)
+    if expected is None:
+        return True
+
+    errors = check_matches(result['matches'], expected, result['fps'], args.tolerance)
+    print()
+    if errors:
+        print(f'検証: NG（{len(errors)} 件）')
+        for error in errors:
+            print(f'  {error}')
+        return False
+    print(f'検証: OK（{len(expected)} 試合）')
+    return True
+
+
+def run_suite(args: argparse.Namespace) -> bool:
+    """suite サブコマンド: 条件を変えた合成動画を生成し、解析速度と結果を一覧にする
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        bool: 全ての解析結果が期待どおりならTrue
+    """
+    script = get_script(args)
+    source_args = {'backend': args.backend, 'ffmpeg_options': args.ffmpeg_options}
+    ok = True
+
+    print(f'{"fps":>5s} {"size":>10s} {"gop":>4s} {"frames":>7s} {"elapsed":>8s} {"frames/s":>9s} {"samples":>8s} {"decoded":>8s}  result')
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        for fps in args.fps:
+            for size in args.sizes:
+                for gop in args.gops:
+                    path = os.path.join(work_dir, f'synth_{fps}_{size}_{gop}{args.ext}')
+                    expected = synth_video(path, fps, parse_size(size), args.codec, gop, script)
+                    result = bench_analyze(path, source_args)
+                    errors = check_matches(result['matches'], expected, result['fps'], args.tolerance)
+                    ok = ok and not errors
+                    print(f'{fps:5g} {size:>10s} {gop:4d} {result["totalframes"]:7d} {result["elapsed"]:8.2f}'
+                          f' {result["video_fps"]:9.1f} {result["samples"]:8d} {result["decoded"]:8d}'
+                          f'  {"OK" if not errors else "NG: " + "; ".join(errors)}')
+    return ok
+
+
+# 起動時間の計測で子プロセスに実行させるコード（解析の準備ができるまで）
+STARTUP_CODE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {src_dir!r})
+import template_pack
+if not {use_pack!r}:
+    template_pack.get_templates(pack_file=None)
+from analyze_video import AnalyzeVideo
+AnalyzeVideo()
+print(json.dumps({{'elapsed': time.perf_counter() - start, 'source': template_pack.load_info['source'],
+                  'template': template_pack.load_info['time']}}))
+"""
+
+
+def bench_startup(use_pack: bool) -> dict:
+    """新しいプロセスで、解析の準備ができる（AnalyzeVideo を作る）までの時間を計測する
+
+    Args:
+        use_pack (bool): テンプレート画像のパックを使うか（False なら画像ファイルから読み込む）
+
+    Returns:
+        dict: 計測結果（wall: プロセス起動からの時間、elapsed: モジュールの読み込みからの時間、
+              template: テンプレート画像の読み込み時間、source: 読み込み方法）
+    """
+    code = STARTUP_CODE.format(src_dir=os.path.dirname(os.path.abspath(__file__)), use_pack=use_pack)
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    wall = time.perf_counter() - start
+
+    result = json.loads(output.strip().splitlines()[-1])
+    result['wall'] = wall
+    return result
+
+
+def run_startup(args: argparse.Namespace) -> None:
+    """startup サブコマンド: テンプレート画像のパックの有無ごとの起動時間を表示する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+    """
+    print(f'{"source":8s} {"wall[s]":>8s} {"import[s]":>9s} {"template[ms]":>12s}')
+    for use_pack in (True, False):
+        results = [bench_startup(use_pack) for _ in range(args.repeat)]
+        # 最初の1回はファイルキャッシュの影響を受けるので、最小値を表示する
+        wall = min(result['wall'] for result in results)
+        elapsed = min(result['elapsed'] for result in results)
+        template = min(result['template'] for result in results)
+        print(f'{results[0]["source"]:8s} {wall:8.3f} {elapsed:9.3f} {template * 1000:12.1f}')
+
+
+def flagstates_hsv(strip, flag_cols):
+    """HSV に変換してフラッグの色を判定する（色の分類表を使わない、検証・比較用の判定）
+
+    Args:
+        strip (numpy.ndarray): AREA_FLAGS_L、AREA_FLAGS_R を横に並べた画像（BGR）
+        flag_cols (numpy.ndarray): 帯での各フラッグの X 座標（AnalyzeVideo._get_flag_cols()）
+
+    Returns:
+        numpy.ndarray: [左右（0 左、1 右）, 1～7番目] の色（2 赤、 1 白、 0 それ以外）
+    """
+    frame_hsv = cv2.cvtColor(strip, cv2.COLOR_BGR2HSV)
+
+    def match_ratio(hsv_ranges):
+        mask = np.zeros(frame_hsv.shape[:2], dtype=np.uint8)
+        for lower, upper in hsv_ranges:
+            mask |= cv2.inRange(frame_hsv, lower, upper)
+        cells = mask[:, flag_cols]
+        return np.count_nonzero(cells, axis=(0, 3)) / (cells.shape[0] * cells.shape[3])
+
+    match_ratio_wh = match_ratio(C.IMG_MATCH.HSV_RANGES_WH)
+    match_ratio_rd = match_ratio(C.IMG_MATCH.HSV_RANGES_RD)
+    return np.where(match_ratio_wh > 0.7, C.IMG_MATCH.FLAGCOLOR_WH,
+                    np.where(match_ratio_rd > 0.7, C.IMG_MATCH.FLAGCOLOR_RD,
+                             C.IMG_MATCH.FLAGCOLOR_NO))
+
+
+def verify_lut(lut: ColorLut, chunk: int = 1 << 20) -> dict:
+    """全ての BGR の色（2^24 色）で、色の分類表と HSV に変換した分類が一致するかを検証する
+
+    Args:
+        lut (ColorLut): 区画の分類をまだ求めていない分類表
+        chunk (int): 1度に分類する色の数
+
+    Returns:
+        dict: 検証結果（mismatch: 一致しなかった色の数、hsv・lut: 分類にかかった時間（秒、区画の分類を求める時間を含む））
+    """
+    result = {'mismatch': 0, 'hsv': 0.0, 'lut': 0.0}
+    for first in range(0, 1 << 24, chunk):
+        colors = np.arange(first, first + chunk, dtype=np.uint32)
+        pixels = np.stack((colors >> 16, (colors >> 8) & 0xff, colors & 0xff), axis=-1).astype(np.uint8)
+
+        start = time.perf_counter()
+        expected = lut.classify_hsv(pixels)
+        result['hsv'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = lut.classify(pixels)
+        result['lut'] += time.perf_counter() - start
+
+        result['mismatch'] += int(np.count_nonzero(expected != actual))
+    return result
+
+
+def load_flag_strips(file: str, stride: int, count: int) -> list:
+    """動画から一定間隔のフレームのフラッグの帯を読み込む
+
+    Args:
+        file (str): 動画ファイルのパス（None なら乱数の画像）
+        stride (int): 読み込むフレームの間隔
+        count (int): 読み込むフレーム数
+
+    Returns:
+        list[numpy.ndarray]: フラッグの帯（AREA_FLAGS_L、AREA_FLAGS_R を横に並べた画像）
+    """
+    height = C.IMG_MATCH.AREA_FLAGS_L[3]
+    width = C.IMG_MATCH.AREA_FLAGS_L[2] + C.IMG_MATCH.AREA_FLAGS_R[2]
+    if file is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+    analyze = AnalyzeVideo()
+    if not analyze.file_open(file):
+        analyze.file_close()
+        raise OSError(f'cannot open: {file}')
+    strips = []
+    try:
+        for fno in list(range(0, analyze.totalframes, stride))[:count]:
+            ret, frame = analyze.source.read(fno)
+            if not ret:
+                break
+            rois = analyze.roi_extractor.extract(frame)
+            strips.append(np.concatenate((get_roi(rois, C.IMG_MATCH.AREA_FLAGS_L),
+                                          get_roi(rois, C.IMG_MATCH.AREA_FLAGS_R)), axis=1))
+    finally:
+        analyze.file_close()
+    return strips
+
+
+def run_lut(args: argparse.Namespace) -> bool:
+    """lut サブコマンド: 色の分類表が HSV の判定と一致するかを検証し、フラッグの判定時間を比較する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        bool: 全て一致すればTrue
+    """
+    ok = True
+    if not args.no_all_colors:
+        lut = ColorLut(get_flag_lut().classes, C.IMG_MATCH.FLAGCOLOR_NO)
+        result = verify_lut(lut)
+        ok = result['mismatch'] == 0
+        print(f'全ての色: {"OK" if ok else "NG"}（不一致 {result["mismatch"]} 色）、'
+              f'HSV {result["hsv"]:.2f} 秒 / 分類表 {result["lut"]:.2f} 秒'
+              f'（区画 {lut.cnt_cells}、うち境界 {lut.cnt_mixed}）')
+
+    strips = load_flag_strips(args.video, args.stride, args.count)
+    analyze = AnalyzeVideo()
+    # 区画の分類を求める時間も見るため、新しい分類表で判定する
+    analyze.flag_lut = ColorLut(get_flag_lut().classes, C.IMG_MATCH.FLAGCOLOR_NO)
+
+    def timed(func):
+        start = time.perf_counter()
+        results = [func(strip) for strip in strips]
+        return results, (time.perf_counter() - start) / max(len(strips), 1) * 1e6
+
+    expected, us_hsv = timed(lambda strip: flagstates_hsv(strip, analyze._flag_cols))
+    actual, us_first = timed(analyze.classify_flag_strip)
+    _, us_lut = timed(analyze.classify_flag_strip)
+    mismatch = sum(1 for a, b in zip(expected, actual) if not np.array_equal(a, b))
+    ok = ok and mismatch == 0
+
+    print(f'フラッグ: {"OK" if mismatch == 0 else "NG"}（{len(strips)} フレーム、不一致 {mismatch}）')
+    print(f'{"path":10s} {"us/frame":>9s}')
+    print(f'{"hsv":10s} {us_hsv:9.1f}')
+    print(f'{"lut-first":10s} {us_first:9.1f}  （区画 {analyze.flag_lut.cnt_cells}、うち境界 {analyze.flag_lut.cnt_mixed}）')
+    print(f'{"lut":10s} {us_lut:9.1f}  （{us_hsv / us_lut if us_lut > 0 else 0.0:.2f} 倍）')
+    return ok
+
+
+def load_charaselect_rois(file: str, stride: int, count: int, template) -> list:
+    """動画から一定間隔のフレームのキャラクター選択画面の範囲を読み込む
+
+    Args:
+        file (str): 動画ファイルのパス（None なら乱数の画像と、テンプレート画像に雑音を加えた画像）
+        stride (int): 読み込むフレームの間隔
+        count (int): 読み込むフレーム数
+        template (numpy.ndarray): キャラクター選択画面の画像
+
+    Returns:
+        list[numpy.ndarray]: キャラクター選択画面の範囲（AREA_CHARASELECT）の画像
+    """
+    _, _, width, height = C.IMG_MATCH.AREA_CHARASELECT
+    if file is None:
+        rng = np.random.default_rng(0)
+        rois = []
+        for i in range(count):
+            if i % 2 == 0:
+                rois.append(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+                continue
+            noisy = template * rng.uniform(0.3, 1.5) + rng.normal(0, rng.uniform(5, 150), template.shape)
+            roi = np.zeros((height, width, 3), dtype=np.uint8)
+            roi[:template.shape[0], :template.shape[1]] = np.clip(noisy, 0, 255)
+            rois.append(roi)
+        return rois
+
+    analyze = AnalyzeVideo()
+    if not analyze.file_open(file):
+        analyze.file_close()
+        raise OSError(f'cannot open: {file}')
+    rois = []
+    try:
+        for fno in list(range(0, analyze.totalframes, stride))[:count]:
+            ret, frame = analyze.source.read(fno)
+            if not ret:
+                break
+            rois.append(get_roi(analyze.roi_extractor.extract(frame), C.IMG_MATCH.AREA_CHARASELECT).copy())
+    finally:
+        analyze.file_close()
+    return rois
+
+
+def run_cascade(args: argparse.Namespace) -> bool:
+    """cascade サブコマンド: キャラクター選択画面の事前判定が照合と同じ結果になるかを検証し、時間を比較する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        bool: 事前判定で結果が決まったフレームが、全て照合と同じ結果ならTrue
+    """
+    analyze = AnalyzeVideo()
+    template = analyze.matchtemplate.img_charaselect
+    rois = [analyze._to_charaselect_color(roi)
+            for roi in load_charaselect_rois(args.video, args.stride, args.count, template)]
+    template = analyze._to_charaselect_color(template)
+    matcher = analyze.charaselect_matcher
+    threshold = C.IMG_MATCH.CHARASEL_THRESHOLD
+
+    def timed(func):
+        start = time.perf_counter()
+        results = [func(roi) for roi in rois]
+        return results, (time.perf_counter() - start) / max(len(rois), 1) * 1e6
+
+    expected, us_match = timed(lambda roi: cv2.minMaxLoc(cv2.matchTemplate(roi, template, cv2.TM_CCOEFF_NORMED))[1])
+    actual, us_direct = timed(matcher.match)
+    resolved = [(a, b) for a, b in zip(expected, actual)
+                if b is not None and abs(b - threshold) > C.CASCADE.GATE_MARGIN]
+    mismatch = sum(1 for a, b in resolved if (a > threshold) != (b > threshold))
+    max_error = max((abs(a - b) for a, b in zip(expected, actual) if b is not None), default=0.0)
+    positive = sum(1 for a in expected if a > threshold)
+
+    print(f'キャラ選択: {"OK" if mismatch == 0 else "NG"}（{len(rois)} フレーム、うちキャラ選択 {positive}、'
+          f'事前判定で決定 {len(resolved)}、不一致 {mismatch}、最大誤差 {max_error:.2e}）')
+    print(f'{"path":10s} {"us/frame":>9s}')
+    print(f'{"match":10s} {us_match:9.1f}')
+    print(f'{"direct":10s} {us_direct:9.1f}  （{us_match / us_direct if us_direct > 0 else 0.0:.2f} 倍）')
+    return mismatch == 0
+
+
+def get_match_keys(matches: list) -> list:
+    """試合結果を比較できる形にする
+
+    Args:
+        matches (list[MatchResult]): 試合結果のリスト
+
+    Returns:
+        list[tuple]: (決着, 試合開始, 左の名前, 右の名前, 左のフラッグ数, 右のフラッグ数) のリスト
+    """
+    return [(m.frame_no, m.fno_startmatch, m.name_L, m.name_R, m.flags_L, m.flags_R) for m in matches]
+
+
+def run_parallel(args: argparse.Namespace) -> bool:
+    """parallel サブコマンド: 区間の開始位置を変えて区間並列解析し、逐次解析と同じ結果になるかを検証する
+
+    キャラクター決定後のキャラクター選択画面を短くした（キャラクター名の多数決の範囲内で名前が変わる）
+    合成動画を作り、2つ目の区間の開始位置をキャラクター選択画面の終わりの前後で動かす。
+    区間の解析はワーカープロセスを使わずに、このプロセスで行う。
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        bool: 全ての開始位置で逐次解析と同じ結果ならTrue
+    """
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        path = os.path.join(work_dir, f'parallel{args.ext}')
+        video = SyntheticVideo(args.fps, parse_size(args.size), args.codec,
+                               lengths=SceneLengths(charaselect=args.charaselect))
+        video.write(path, get_script(args))
+
+        serial = analyze_segment(path, 0, None)
+        truth = get_match_keys(serial.matches)
+        # キャラクター選択画面が終わった後の、キャラ決定時のフレーム番号
+        fno_ends = sorted({state.fno_eofcharasel for state in serial.records
+                           if state.fno_eofcharasel is not None and state.mstat != C.STAT.MSTAT_CHARASELECT})
+        overlap = int(args.fps * args.overlap)
+        reach = int(args.fps * (C.CHAR.NAME_VOTE_SPAN + 2 * C.PROC_SPD.INTVL_CHARASELECT))
+        print(f'逐次解析: {len(truth)} 試合、キャラクター選択画面の終わり {fno_ends}')
+
+        def walker_factory():
+            analyze = AnalyzeVideo()
+            analyze.file_open(path)
+            work_data, work_stats = init_analysis(analyze, path)
+            return SerialWalker(analyze, work_data, work_stats)
+
+        ng = 0
+        cnt = 0
+        for fno_end in fno_ends:
+            for start_fno in range(max(1, fno_end - reach), fno_end + 1, args.stride):
+                segments = [analyze_segment(path, 0, start_fno + overlap), analyze_segment(path, start_fno, None)]
+                _, matches, cnt_serial = merge_segments(segments, walker_factory)
+                cnt += 1
+                if get_match_keys(matches) != truth:
+                    ng += 1
+                    print(f'  NG: 区間の開始 {start_fno}（キャラクター選択画面の終わり {fno_end}、逐次解析 {cnt_serial}）')
+                    for exp, res in zip(truth, get_match_keys(matches)):
+                        if exp != res:
+                            print(f'    {res} (expected {exp})')
+
+    print(f'区間並列解析: {"OK" if ng == 0 else "NG"}（開始位置 {cnt} 通り、不一致 {ng}）')
+    return ng == 0
+
+
+def add_synth_args(parser: argparse.ArgumentParser) -> None:
+    """合成動画の台本・エンコードの引数を追加する
+
+    Args:
+        parser (argparse.ArgumentParser): 追加先
+    """
+    parser.add_argument('--script', default=DEFAULT_SCRIPT,
+                        help="台本。'左-右:最大フラッグ数:獲得順[:リマッチ回数]' のカンマ区切り（既定: %(default)s）")
+    parser.add_argument('--matches', type=int, default=0, help='台本の代わりに、この試合数のランダムな台本を使う')
+    parser.add_argument('--seed', type=int, default=0, help='ランダムな台本の乱数の種')
+    parser.add_argument('--codec', default='mp4v', help='FourCC（既定: %(default)s）')
+    parser.add_argument('--tolerance', type=float, default=C.PROC_SPD.INTVL_OTHERS + 1,
+                        help='検証で許容するタイムスタンプのずれ（秒）（既定: %(default)s）')
+
+
+def main(argv=None) -> int:
+    """メイン関数
+
+    Args:
+        argv (list[str]): コマンドライン引数。None なら sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    parser = argparse.ArgumentParser(description='処理速度の計測')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_source = subparsers.add_parser('source', help='フレームの読み込み方法ごとの速度')
+    parser_source.add_argument('video', help='動画ファイルのパス')
+    parser_source.add_argument('--strategies', nargs='+', choices=CvFrameSource.STRATEGIES,
+                               default=list(CvFrameSource.STRATEGIES))
+    parser_source.add_argument('--threads', nargs='+', type=int, default=[0, 1],
+                               help='デコーダーのスレッド数（0 は OpenCV の既定値）')
+    parser_source.add_argument('--strides', nargs='+', type=int, default=[15, 30, 120, 180],
+                               help='読み込むフレームの間隔')
+    parser_source.add_argument('--count', type=int, default=200, help='読み込むフレーム数')
+    parser_source.add_argument('--start', type=int, default=0, help='開始フレーム番号')
+    parser_source.add_argument('--backend', choices=BACKEND_CHOICES, default='any')
+    parser_source.add_argument('--ffmpeg-options', default=None)
+    parser_source.add_argument('--pipe', action='store_true', help='ffmpeg のパイプ（--backend pipe）の速度も計測する')
+    parser_source.set_defaults(func=run_source)
+
+    parser_synth = subparsers.add_parser('synth', help='合成動画の生成')
+    parser_synth.add_argument('output', help='出力ファイルのパス（期待する試合結果は拡張子を .expected.json にしたファイル）')
+    parser_synth.add_argument('--fps', type=float, default=30)
+    parser_synth.add_argument('--size', default='640x360', help='解像度（幅x高さ）')
+    parser_synth.add_argument('--gop', type=int, default=0, help='キーフレームの間隔（0 ならエンコーダーの既定値）')
+    add_synth_args(parser_synth)
+    parser_synth.set_defaults(func=run_synth)
+
+    parser_analyze = subparsers.add_parser('analyze', help='解析速度・処理段階ごとの時間（合成動画なら結果も検証）')
+    parser_analyze.add_argument('video', help='動画ファイルのパス')
+    parser_analyze.add_argument('--stride', type=int, default=60, help='処理段階ごとの計測で読み込む間隔（0 なら計測しない）')
+    parser_analyze.add_argument('--count', type=int, default=200, help='処理段階ごとの計測で読み込むフレーム数')
+    parser_analyze.add_argument('--tolerance', type=float, default=C.PROC_SPD.INTVL_OTHERS + 1,
+                                help='検証で許容するタイムスタンプのずれ（秒）（既定: %(default)s）')
+    parser_analyze.add_argument('--backend', choices=BACKEND_CHOICES, default='any')
+    parser_analyze.add_argument('--ffmpeg-options', default=None)
+    parser_analyze.set_defaults(func=run_analyze)
+
+    parser_suite = subparsers.add_parser('suite', help='条件を変えた合成動画の解析速度・結果の一覧')
+    parser_suite.add_argument('--fps', nargs='+', type=float, default=[30, 60])
+    parser_suite.add_argument('--sizes', nargs='+', default=['640x360', '1920x1080'], help='解像度（幅x高さ）')
+    parser_suite.add_argument('--gops', nargs='+', type=int, default=[0], help='キーフレームの間隔')
+    parser_suite.add_argument('--ext', default='.mp4', help='合成動画の拡張子（既定: %(default)s）')
+    parser_suite.add_argument('--work-dir', default=None, help='合成動画を一時的に置くディレクトリ')
+    parser_suite.add_argument('--backend', choices=BACKEND_CHOICES, default='any')
+    parser_suite.add_argument('--ffmpeg-options', default=None)
+    add_synth_args(parser_suite)
+    parser_suite.set_defaults(func=run_suite)
+
+    parser_startup = subparsers.add_parser('startup', help='起動時間（テンプレート画像のパックの有無）')
+    parser_startup.add_argument('--repeat', type=int, default=5, help='計測する回数')
+    parser_startup.set_defaults(func=run_startup)
+
+    parser_lut = subparsers.add_parser('lut', help='色の分類表の検証（HSV の判定との一致）とフラッグの判定時間')
+    parser_lut.add_argument('video', nargs='?', default=None, help='動画ファイルのパス（省略時は乱数の画像）')
+    parser_lut.add_argument('--stride', type=int, default=30, help='読み込むフレームの間隔')
+    parser_lut.add_argument('--count', type=int, default=500, help='判定するフレーム数')
+    parser_lut.add_argument('--no-all-colors', action='store_true', help='全ての色（2^24 色）での検証を省く')
+    parser_lut.set_defaults(func=run_lut)
+
+    parser_cascade = subparsers.add_parser('cascade', help='キャラクター選択画面の事前判定の検証（照合との一致）と判定時間')
+    parser_cascade.add_argument('video', nargs='?', default=None, help='動画ファイルのパス（省略時は乱数の画像）')
+    parser_cascade.add_argument('--stride', type=int, default=30, help='読み込むフレームの間隔')
+    parser_cascade.add_argument('--count', type=int, default=500, help='判定するフレーム数')
+    parser_cascade.set_defaults(func=run_cascade)
+
+    parser_parallel = subparsers.add_parser('parallel', help='区間の開始位置を変えた区間並列解析の検証（逐次解析との一致）')
+    parser_parallel.add_argument('--fps', type=float, default=30)
+    parser_parallel.add_argument('--size', default='640x360', help='解像度（幅x高さ）')
+    parser_parallel.add_argument('--charaselect', type=float, default=0.3,
+                                 help='キャラクター決定後のキャラクター選択画面の長さ（秒）（既定: %(default)s）')
+    parser_parallel.add_argument('--overlap', type=float, default=10, help='区間を重ねる時間（秒）（既定: %(default)s）')
+    parser_parallel.add_argument('--stride', type=int, default=1, help='区間の開始位置を動かす間隔（フレーム）')
+    parser_parallel.add_argument('--ext', default='.mp4', help='合成動画の拡張子（既定: %(default)s）')
+    parser_parallel.add_argument('--work-dir', default=None, help='合成動画を一時的に置くディレクトリ')
+    add_synth_args(parser_parallel)
+    parser_parallel.set_defaults(func=run_parallel)
+
+    for subparser in (parser_synth, parser_analyze, parser_suite, parser_startup, parser_lut, parser_cascade,
+                      parser_parallel):
+        subparser.add_argument('--resource-dir', default=None,
+                               help='matchtemplate、name_l、name_r があるディレクトリ（既定: カレントディレクトリ）')
+
+    args = parser.parse_args(argv)
+
+    if getattr(args, 'resource_dir', None) is not None:
+        # 画像はカレントディレクトリからの相対パスで読み込むため、入出力のパスを絶対パスにしてから移動する
+        for attr in ('output', 'video', 'work_dir'):
+            if getattr(args, attr, None) is not None:
+                setattr(args, attr, os.path.abspath(getattr(args, attr)))
+        os.chdir(args.resource_dir)
+
+    result = args.func(args)
+    return 1 if result is False else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""解析の途中経過の保存と再開
+"""
+import json
+import os
+
+from constants import Constants as C
+from analyzed_video_data import AnalyzedVideoData, MatchData, MatchResult
+from analyzed_statistics import AnalyzedStatistics
+from feature_store import get_fingerprint
+
+
+# 保存する処理データの項目
+VIDEO_ATTRS = ('frame_no', 'skip', 'skip_key', 'stat_text', 'mstat')
+
+# 保存する試合データの項目
+MATCH_ATTRS = ('match_no', 'fno_eofcharasel', 'fno_startmatch', 'name_L', 'name_R', 'max_flags')
+
+# 保存する統計情報のカウンタ
+STATS_ATTRS = (
+    'cnt_charaselect',
+    'cnt_blackout',
+    'cnt_matstarted',
+    'cnt_lastoneflag',
+    'cnt_matchfinished',
+    'cnt_other',
+    'cnt_refine',
+)
+
+
+class AnalysisCheckpoint:
+    """動画1件分の解析の途中経過（状態遷移・タイムスタンプ・統計情報）をファイルに保存するクラス
+
+    ファイル名は動画ファイルの識別文字列（FeatureStore と同じ）。
+    解析したフレームごとに capture() で状態を控えておき、save() でその時点の状態を書き込む。
+    フレームの解析中にキャンセル・例外が発生しても、控えた状態は解析済みのフレームと矛盾しない。
+
+    Attributes:
+        path (str): 保存先ファイルのパス
+        fingerprint (str): 動画ファイルの識別文字列
+    """
+
+
+    def __init__(self, checkpoint_dir: str, file: str):
+        """コンストラクタ
+
+        Args:
+            checkpoint_dir (str): 保存先ディレクトリ
+            file (str): 動画ファイルのパス
+        """
+        self.fingerprint = get_fingerprint(file)
+        self.path = os.path.join(checkpoint_dir, self.fingerprint + C.CHECKPOINT.SUFFIX)
+        self._snapshot = None
+
+
+    def load(self) -> dict:
+        """保存済みの途中経過を読み込む
+
+        Returns:
+            dict: 途中経過（無い、または読み込めなければ None）
+        """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get('version') != C.CHECKPOINT.FORMAT_VERSION or data.get('fingerprint') != self.fingerprint:
+            return None
+        return data
+
+
+    def restore(self, video_data: AnalyzedVideoData, astats: AnalyzedStatistics) -> bool:
+        """保存済みの途中経過を、処理データと統計情報に戻す
+
+        Args:
+            video_data (AnalyzedVideoData): init_analysis() 直後の処理データ
+            astats (AnalyzedStatistics): init_analysis() 直後の処理結果統計情報
+
+        Returns:
+            bool: 戻せればTrue、保存済みの途中経過が無ければFalse
+        """
+        data = self.load()
+        if data is None or data['totalframes'] != video_data.totalframes:
+            return False
+
+        for attr in VIDEO_ATTRS:
+            setattr(video_data, attr, data['video'][attr])
+        for attr in MATCH_ATTRS:
+            setattr(video_data.mdata, attr, data['mdata'][attr])
+        for attr in STATS_ATTRS:
+            setattr(astats, attr, data['stats'][attr])
+
+        video_data.matches = []
+        for values in data['matches']:
+            mdata = MatchData()
+            mdata.fno_startmatch = values['fno_startmatch']
+            mdata.name_L = values['name_L']
+            mdata.name_R = values['name_R']
+            video_data.matches.append(MatchResult(values['frame_no'], mdata, values['flags_L'], values['flags_R']))
+        video_data.timestamps_text = list(data['timestamps_text'])
+
+        video_data.set_progress(video_data.frame_no)
+        astats.resume_fno = video_data.frame_no
+        astats.resume_cnt = astats.get_cnt_total()
+        self.capture(video_data, astats)
+        return True
+
+
+    def capture(self, video_data: AnalyzedVideoData, astats: AnalyzedStatistics) -> None:
+        """現在の状態を控える（フレームの解析を終えた時点で呼ぶ）
+
+        Args:
+            video_data (AnalyzedVideoData): 処理データ
+            astats (AnalyzedStatistics): 処理結果統計情報
+        """
+        self._snapshot = {
+            'video': {attr: getattr(video_data, attr) for attr in VIDEO_ATTRS},
+            'mdata': {attr: getattr(video_data.mdata, attr) for attr in MATCH_ATTRS},
+            'stats': {attr: getattr(astats, attr) for attr in STATS_ATTRS},
+            # MatchResult・文字列は追加後に変更しないので、リストの複製だけでよい
+            'matches': list(video_data.matches),
+            'timestamps_text': list(video_data.timestamps_text),
+            'totalframes': video_data.totalframes,
+        }
+
+
+    def get_frame_no(self) -> int:
+        """控えた状態のフレーム番号
+
+        Returns:
+            int: フレーム番号（控えていなければ None）
+        """
+        return self._snapshot['video']['frame_no'] if self._snapshot is not None else None
+
+
+    def save(self) -> None:
+        """控えた状態をファイルに保存する
+        """
+        if self._snapshot is None:
+            return
+
+        snapshot = self._snapshot
+        data = {
+            'version': C.CHECKPOINT.FORMAT_VERSION,
+            'fingerprint': self.fingerprint,
+            'totalframes': snapshot['totalframes'],
+            'video': snapshot['video'],
+            'mdata': snapshot['mdata'],
+            'stats': snapshot['stats'],
+            'matches': [vars(result) for result in snapshot['matches']],
+            'timestamps_text': snapshot['timestamps_text'],
+        }
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # 書き込み中に中断しても壊れたファイルが残らないよう、一時ファイルから置き換える
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+
+    def remove(self) -> None:
+        """保存済みの途中経過を削除する（解析が完了したとき）
+        """
+        self._snapshot = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,174 @@
+"""画素の色の分類表（HSV に変換せずに、BGR の画素を白・赤・それ以外に分類する）
+
+HSV の色範囲（C.IMG_MATCH.HSV_RANGES_WH など）による画素ごとの分類を、BGR の値から直接引ける表にする。
+表は2段で、BGR の各チャンネルを上位 bits ビットで量子化した区画ごとに、区画内の全ての色が同じ分類なら
+その分類を持ち、色範囲の境界をまたぐ区画だけは区画内の色ごとの分類を持つ。
+
+区画の分類は、その区画の色が初めて現れた時に、区画内の全ての色を HSV に変換して求める
+（起動時に全ての色を変換すると時間がかかるため）。表を引いた結果は、HSV に変換して分類した結果と常に一致する。
+"""
+import cv2
+import numpy as np
+
+from constants import Constants as C
+
+
+# 区画の分類で、まだ求めていない区画
+CELL_UNKNOWN = 255
+
+# 区画の分類で、区画内の色によって分類が異なる区画
+CELL_MIXED = 254
+
+# フラッグの色の分類表（get_flag_lut() で1度だけ作る）
+_flag_lut = None
+
+
+def get_flag_lut() -> 'ColorLut':
+    """フラッグの色（白・赤・それ以外）の分類表を取得する
+
+    2回目以降は1回目に作ったものを返す（求めた区画を、動画・AnalyzeVideo をまたいで使い回す）
+
+    Returns:
+        ColorLut: 分類表（分類は C.IMG_MATCH.FLAGCOLOR_WH・FLAGCOLOR_RD・FLAGCOLOR_NO）
+    """
+    global _flag_lut
+    if _flag_lut is None:
+        # 白の判定を優先する（is_red_or_white() と同じ）
+        _flag_lut = ColorLut({C.IMG_MATCH.FLAGCOLOR_WH: C.IMG_MATCH.HSV_RANGES_WH,
+                              C.IMG_MATCH.FLAGCOLOR_RD: C.IMG_MATCH.HSV_RANGES_RD},
+                             C.IMG_MATCH.FLAGCOLOR_NO)
+    return _flag_lut
+
+
+class ColorLut:
+    """BGR の画素を、HSV の色範囲で分類する表
+
+    Attributes:
+        classes (dict): 分類をキーとする HSV の色範囲のリスト（先にある分類を優先する）
+        default (int): どの色範囲にも含まれない画素の分類
+        bits (int): 区画に量子化するビット数（チャンネルごと）
+        cnt_cells (int): 分類を求めた区画の数
+        cnt_mixed (int): そのうち、区画内の色によって分類が異なる区画の数
+    """
+
+
+    def __init__(self, classes: dict, default: int, bits: int = C.IMG_MATCH.LUT_BITS):
+        """コンストラクタ
+
+        Args:
+            classes (dict): 分類（0～253）をキーとする [(lower, upper), ...] 形式の HSV の色範囲（先にある分類を優先する）
+            default (int): どの色範囲にも含まれない画素の分類
+            bits (int): 区画に量子化するビット数（チャンネルごと、1～8）
+        """
+        self.classes = classes
+        self.default = default
+        self.bits = bits
+        self.cnt_cells = 0
+        self.cnt_mixed = 0
+
+        self._shift = 8 - bits
+        # チャンネルごとの値から、区画の番号・区画内の位置を求める表
+        values = np.arange(256, dtype=np.intp)
+        cells = values >> self._shift
+        offsets = values & ((1 << self._shift) - 1)
+        self._cell_weights = np.array([1 << (2 * bits), 1 << bits, 1], dtype=np.intp)
+        self._offset_weights = np.array([1 << (2 * self._shift), 1 << self._shift, 1], dtype=np.intp)
+        self._cell_values = cells
+        self._offset_values = offsets
+
+        self._cells = np.full(1 << (3 * bits), CELL_UNKNOWN, dtype=np.uint8)
+        # 分類が異なる区画の、区画内の色ごとの分類（区画ごとの行番号は _rows）
+        self._rows = np.zeros(1 << (3 * bits), dtype=np.intp)
+        self._fine = np.zeros((0, 1 << (3 * self._shift)), dtype=np.uint8)
+
+
+    def classify_hsv(self, pixels: np.ndarray) -> np.ndarray:
+        """画素を HSV に変換して分類する（表を作るための、表を使わない分類）
+
+        Args:
+            pixels (numpy.ndarray): BGR の画素（[..., 3]、uint8）
+
+        Returns:
+            numpy.ndarray: 画素ごとの分類（pixels の最後の次元を除いた形、uint8）
+        """
+        shape = pixels.shape[:-1]
+        frame_hsv = cv2.cvtColor(np.ascontiguousarray(pixels, dtype=np.uint8).reshape(-1, 1, 3), cv2.COLOR_BGR2HSV)
+
+        result = np.full(frame_hsv.shape[0], self.default, dtype=np.uint8)
+        # 優先度の低い分類から上書きする
+        for value, hsv_ranges in reversed(list(self.classes.items())):
+            mask = np.zeros(frame_hsv.shape[:2], dtype=np.uint8)
+            for lower, upper in hsv_ranges:
+                mask |= cv2.inRange(frame_hsv, lower, upper)
+            result[mask[:, 0] > 0] = value
+        return result.reshape(shape)
+
+
+    def _compile(self, cells: np.ndarray) -> None:
+        """区画内の全ての色を HSV に変換して、区画の分類を求める
+
+        Args:
+            cells (numpy.ndarray): 区画の番号（重複なし）
+        """
+        bits, shift = self.bits, self._shift
+        mask_cell, mask_offset = (1 << bits) - 1, (1 << shift) - 1
+        offsets = np.arange(1 << (3 * shift), dtype=np.intp)
+
+        # [区画, 区画内の位置, BGR] の全ての色
+        colors = np.stack([((cells[:, np.newaxis] >> (2 * bits - i * bits)) & mask_cell) << shift
+                           | ((offsets >> (2 * shift - i * shift)) & mask_offset)
+                           for i in range(3)], axis=-1).astype(np.uint8)
+        fine = self.classify_hsv(colors)
+
+        uniform = (fine == fine[:, :1]).all(axis=1)
+        self._cells[cells[uniform]] = fine[uniform, 0]
+
+        mixed = cells[~uniform]
+        self._cells[mixed] = CELL_MIXED
+        self._rows[mixed] = np.arange(len(self._fine), len(self._fine) + len(mixed))
+        self._fine = np.concatenate((self._fine, fine[~uniform]))
+
+        self.cnt_cells += len(cells)
+        self.cnt_mixed += len(mixed)
+
+
+    def classify(self, pixels: np.ndarray) -> np.ndarray:
+        """表を引いて画素を分類する（classify_hsv() と同じ結果）
+
+        Args:
+            pixels (numpy.ndarray): BGR の画素（[N, 3]、uint8）
+
+        Returns:
+            numpy.ndarray: 画素ごとの分類（[N]、uint8）
+        """
+        cell = self._cell_values[pixels] @ self._cell_weights
+        result = self._cells.take(cell)
+        if result.max() < CELL_MIXED:
+            return result
+
+        unknown = result == CELL_UNKNOWN
+        if unknown.any():
+            self._compile(np.unique(cell[unknown]))
+            result = self._cells.take(cell)
+
+        mixed = result == CELL_MIXED
+        if mixed.any():
+            offset = self._offset_values[pixels[mixed]] @ self._offset_weights
+            result[mixed] = self._fine[self._rows[cell[mixed]], offset]
+        return result
+
+
+    def count(self, pixels: np.ndarray, groups: np.ndarray, n_groups: int) -> np.ndarray:
+        """画素を分類し、グループごとに分類ごとの画素数を数える
+
+        Args:
+            pixels (numpy.ndarray): BGR の画素（[N, 3]、uint8）
+            groups (numpy.ndarray): 画素ごとのグループの番号（[N]、0～n_groups-1）
+            n_groups (int): グループの数
+
+        Returns:
+            numpy.ndarray: [グループ, 分類] の画素数（分類は 0～最大の分類）
+        """
+        n_classes = max(max(self.classes), self.default) + 1
+        counts = np.bincount(groups * n_classes + self.classify(pixels), minlength=n_groups * n_classes)
+        return counts.reshape(n_groups, n_classes)
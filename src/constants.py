@@ -35,6 +35,9 @@ class Char:
     PATTERN = re.compile(r'^hq\d_(.+)_\d+\.png$', re.IGNORECASE)  # キャラクター名画像の正規表現マッチパターン
     COLOR = cv2.IMREAD_GRAYSCALE  # キャラクター名画像をカラーかグレースケールのどちらで扱うか
     NOMATCH = 'nomatch'           # キャラクター名がマッチしなかった場合に返す文字列
+    EARLY_EXIT = 0.95             # 信頼度がこの値以上のキャラクター名が見つかれば、残りの画像は照合しない
+    NAME_BUFFER = 8               # キャラクター名の取得用に残す、キャラクター選択画面で解析した直近のフレーム数
+    NAME_VOTE_SPAN = 1/2          # キャラクター名を多数決するフレームの範囲（取得するフレームの前、秒）
 
 
 @dataclass(frozen=True)
@@ -46,6 +49,14 @@ class MatchTemplate:
     CHARASEL_COLOR = cv2.IMREAD_COLOR  # キャラクター選択画面をカラーかグレースケールのどちらで扱うか
 
 
+@dataclass(frozen=True)
+class TemplatePack:
+    """テンプレート画像のパック関連定数
+    """
+    FILE           = 'templates.pack'  # パックのファイル名（matchtemplate などと同じディレクトリ）
+    FORMAT_VERSION = 1                # 保存内容を変えたら増やす（古いパックは使わない）
+
+
 @dataclass(frozen=True)
 class ImageMatching:
     """画像照合定数
@@ -61,6 +72,17 @@ class ImageMatching:
     AREA_FLAG_XR     =  606                  # 右1番目フラッグ X 座標
     AREA_FLAG_YWH    = (       6,   6,   6)  # フラッグ Y 座標、幅width、高さheight
     AREA_FLAG_SPC    =   22                  # フラッグが並ぶ間隔
+    AREA_FLAGS_L     = ( 30,   6, 138,   6)  # 左フラッグ 1～7番目をまとめた範囲
+    AREA_FLAGS_R     = (474,   6, 138,   6)  # 右フラッグ 1～7番目をまとめた範囲
+
+    ROI_AREAS = (                            # フレームから切り出す範囲（これ以外の範囲は照合できない）
+        AREA_CHARASELECT,
+        AREA_CHARNAME_L,
+        AREA_CHARNAME_R,
+        AREA_CHKBLACKOUT,
+        AREA_FLAGS_L,
+        AREA_FLAGS_R,
+    )
 
     HSV_RANGES_WH = [                        # 白のHSV範囲
         (np.array([  0,   0, 150]), np.array([180,  30, 255]))
@@ -71,6 +93,10 @@ class ImageMatching:
         (np.array([170, 200,  50]), np.array([180, 255, 255]))
     ]
 
+    LUT_BITS      = 5  # 色の分類表（ColorLut）で、BGR の各チャンネルを量子化するビット数
+
+    CHARASEL_THRESHOLD = 0.7  # キャラクター選択画面の画像と照合した信頼度最大値がこれより大きければ、キャラクター選択画面
+
     FLAGCOLOR_RD  = 2  # 赤
     FLAGCOLOR_WH  = 1  # 白
     FLAGCOLOR_NO  = 0  # フラッグではない
@@ -86,8 +112,17 @@ class ImageMatching:
 class ProcessSpeed:
     """処理速度関連定数
     """
-    FRAME_CACHE_SIZE    = 30   # フレームをキャッシュする件数
+    ROI_CACHE_BYTES     = 4 << 20  # 解析したフレームの切り出した範囲をキャッシュするバイト数の上限
     MAX_SEQUENTIAL_READ = 40   # VideoCapture.set() でなく read() を使う最大値
+    PARALLEL_OVERLAP    = 120  # 区間並列解析で、区間の前に重ねて解析する時間（秒）
+    PREFETCH_DEPTH      = 8    # デコード用スレッドで先読みするフレーム数の上限
+
+    # シーク・読み進めのコスト計測
+    CALIB_GRABS         = 30   # 読み進めのコストを計測するフレーム数
+    CALIB_SEEKS         = 5    # シークのコストを計測する回数
+    PROBE_TIMEOUT       = 120  # ffprobe でキーフレームを取得する際のタイムアウト（秒）
+    PIPE_MAX_GAP        = 120  # FfmpegPipeSource で ffmpeg を起動し直さずに読み捨てる最大フレーム数
+    SNAP_KEYFRAME       = 1/2  # 優先度の低い画面で、キーフレームに寄せる最大距離（スキップ間隔に対する割合）
 
     # 処理をスキップする間隔（秒）
     INTVL_CHARASELECT   = 1/4  # キャラクター選択画面
@@ -97,6 +132,43 @@ class ProcessSpeed:
     INTVL_BLACKOUT      = 1    # 暗転画面
     INTVL_OTHERS        = 2    # その他画面
 
+    # 書き込み中の動画を追従する場合（--follow）
+    FOLLOW_TIMEOUT      = 10   # 動画ファイルがこの時間大きくならなければ、録画終了とみなす（秒）
+
+    # 境界を二分探索する場合（--refine）に、上の間隔の代わりに使う間隔（秒）
+    INTVL_REFINE        = 2    # キャラクター選択画面、残り１フラッグ
+
+
+@dataclass(frozen=True)
+class PreScan:
+    """事前走査（--prescan）関連定数
+    """
+    INTERVAL       = 1         # 走査する間隔（秒）
+    MARGIN         = 1/2       # 変化の無い区間の両端で、判定結果を使い回さない時間（秒）
+    FLAG_THUMB     = (46, 2)   # フラッグの帯（左右を横に並べたもの）を縮小する大きさ（幅、高さ）
+    CHARASEL_THUMB = (8, 36)   # キャラクター選択画面の帯を縮小する大きさ（幅、高さ）
+    THUMB_TOL      = 8.0       # 縮小画像の画素値の差がこれ以下なら、変化していないとみなす
+    DARK_LEVEL     = 4.0       # 暗転判定の範囲の平均輝度は、この値で頭打ちにして比べる
+    DARK_TOL       = 0.05      # 平均輝度の差がこれ以下なら、変化していないとみなす
+
+
+@dataclass(frozen=True)
+class Schedule:
+    """解析間隔の予測（--predict）関連定数
+    """
+    MIN_SAMPLES    = 3    # 予測に使う観測数（状態の継続時間・1フラッグの時間）の最小値
+    MIN_CONFIDENCE = 0.9  # 延ばした先でも状態が変わっていない確率（予測）がこの値以上なら、間隔を延ばす
+    MAX_JUMP       = 20   # 延ばした間隔の最大値（秒）
+
+
+@dataclass(frozen=True)
+class Cascade:
+    """画面判定の事前判定関連定数
+    """
+    GATE_MARGIN  = 0.005  # 事前判定の値と閾値の差がこれより大きければ照合を省く（照合の計算誤差の分）
+    GATE_MIN_VAR = 16.0   # 照合する位置の画素の分散（チャンネルの合計）がこれ未満なら、事前判定せずに照合する
+    EXPLORE      = 16     # 事前判定しない状態でも、この回数に1回は事前判定する（照合を省ける割合の変化を捉える）
+
 
 @dataclass(frozen=True)
 class StateTransition:
@@ -121,6 +193,43 @@ class StateTransition:
     MSTAT_MATFINISHED   = 3  # 試合終了後
 
 
+@dataclass(frozen=True)
+class FeatureCache:
+    """判定結果の保存関連定数
+    """
+    DIR                = 'cache'  # 保存先ディレクトリ
+    FORMAT_VERSION     = 1        # 判定方法を変えたら増やす（保存済みの判定結果を全て破棄する）
+    FINGERPRINT_BLOCKS = 4        # 動画ファイルの識別に使うブロック数
+    FINGERPRINT_BLOCK  = 65536    # 動画ファイルの識別に使うブロックの大きさ（バイト）
+    SAVE_INTERVAL      = 60       # 解析中に保存する間隔（秒）
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """解析の途中経過の保存関連定数
+    """
+    SUFFIX         = '.checkpoint.json'  # 保存先ファイル名（動画ファイルの識別文字列 + SUFFIX）
+    FORMAT_VERSION = 1                   # 保存内容を変えたら増やす（古い途中経過からは再開しない）
+    INTERVAL       = 300                 # 途中経過を保存する間隔（動画時間の秒）
+
+
+@dataclass(frozen=True)
+class Events:
+    """イベント出力（JSON Lines）関連定数
+    """
+    FLUSH_INTERVAL = 1.0  # 溜まったイベントを書き込む間隔（秒）
+    FLUSH_LINES    = 64   # この件数溜まったら、間隔を待たずに書き込む
+
+
+@dataclass(frozen=True)
+class Batch:
+    """複数の動画ファイルの一括解析関連定数
+    """
+    SUMMARY_FILE   = 'batch_summary.txt'  # 結果一覧の出力ファイル名
+    WATCH_INTERVAL = 10.0                 # フォルダを確認する間隔（秒）
+    EXTENSIONS     = ('.mp4', '.mkv', '.mov', '.avi', '.webm', '.flv', '.ts', '.m4v')  # 監視する動画ファイルの拡張子
+
+
 @dataclass(frozen=True)
 class Constants:
     """定数クラス
@@ -129,13 +238,22 @@ class Constants:
     BAR            = Bar()              # プログレスバー定数
     CHAR           = Char()             # キャラクター名定数
     MATCH_TEMPLATE = MatchTemplate()    # ロード画面など画像管理定数
+    TEMPLATE_PACK  = TemplatePack()     # テンプレート画像のパック関連定数
     IMG_MATCH      = ImageMatching()    # 画像照合定数
     PROC_SPD       = ProcessSpeed()     # 処理速度関連定数
+    PRESCAN        = PreScan()          # 事前走査関連定数
+    SCHEDULE       = Schedule()         # 解析間隔の予測関連定数
+    CASCADE        = Cascade()          # 画面判定の事前判定関連定数
     STAT           = StateTransition()  # 画面状態定数
+    CACHE          = FeatureCache()     # 判定結果の保存関連定数
+    CHECKPOINT     = Checkpoint()       # 解析の途中経過の保存関連定数
+    EVENTS         = Events()           # イベント出力関連定数
+    BATCH          = Batch()            # 一括解析関連定数
 
     ONCLICK_CANCEL = 'Cancel'     # キャンセルイベント
     CANCEL_KEY     = '-CANCEL-'   # キャンセルボタンのキー
 
     OUTPUT_FILE = 'timestamps.txt' # タイムスタンプ出力ファイル名
     STATIS_FILE = 'statistics.txt' # 処理結果統計情報出力ファイル名
+    STATS_JSON_VERSION = 1         # 処理結果統計情報（JSON）の形式。項目を変えたら増やす
     OUTPUT_ENCODING = 'utf-8'      # 出力ファイルのエンコーディング
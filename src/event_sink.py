@@ -0,0 +1,143 @@
+"""解析中のイベントの逐次出力（JSON Lines）
+"""
+import json
+import os
+import sys
+import time
+
+from constants import Constants as C
+
+
+class EventSink:
+    """解析中に検出したイベントを、1行1件の JSON（JSON Lines）で出力するクラス
+
+    イベントはバッファに溜め、FLUSH_INTERVAL 秒ごと（flush_if_due()）か FLUSH_LINES 件溜まった時点で
+    まとめて書き込む。
+    各イベントには、イベント名（event）、動画ファイル名（file）、フレーム番号（frame_no）、
+    動画内の時刻（time: h:mm:ss、sec: 秒）が入る。
+
+    Attributes:
+        output (TextIO): 出力先
+        file_name (str): 解析中の動画ファイル名
+        fps (float): 解析中の動画のフレームレート
+        cnt_events (int): 出力したイベント数
+    """
+
+
+    def __init__(self, output: str):
+        """コンストラクタ
+
+        Args:
+            output (str): 出力ファイルのパス（'-' なら標準出力）
+        """
+        if output == '-':
+            self.output = sys.stdout
+            self._close_output = False
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+            self.output = open(output, 'w', encoding=C.OUTPUT_ENCODING)
+            self._close_output = True
+
+        self.file_name = ''
+        self.fps = 0.0
+        self.cnt_events = 0
+        self._buffer = []
+        self._flush_time = time.monotonic()
+
+
+    def start_video(self, file_path: str, fps: float, totalframes: int) -> None:
+        """動画の解析開始イベントを出力し、以降のイベントの動画ファイル名・フレームレートを設定する
+
+        Args:
+            file_path (str): 動画ファイルのパス
+            fps (float): 動画のフレームレート
+            totalframes (int): 動画の総フレーム数（不明なら0）
+        """
+        self.file_name = os.path.basename(file_path)
+        self.fps = fps
+        self.emit('analysis_start', 0, fps=fps, totalframes=totalframes)
+
+
+    def emit(self, event: str, frame_no: int, **fields) -> None:
+        """イベントを出力する
+
+        Args:
+            event (str): イベント名
+            frame_no (int): イベントのフレーム番号
+            **fields: イベントごとの項目
+        """
+        sec = frame_no / self.fps if self.fps > 0 else 0.0
+        seconds = int(sec)
+        record = {
+            'event': event,
+            'file': self.file_name,
+            'frame_no': frame_no,
+            'time': f'{seconds // 3600:d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}',
+            'sec': round(sec, 3),
+        }
+        record.update(fields)
+        self._buffer.append(json.dumps(record, ensure_ascii=False) + '\n')
+        self.cnt_events += 1
+
+        if len(self._buffer) >= C.EVENTS.FLUSH_LINES:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+
+    def emit_match(self, result, match_no: int) -> None:
+        """試合の決着イベントを出力する
+
+        Args:
+            result (MatchResult): 試合の結果
+            match_no (int): 試合番号
+        """
+        if   result.flags_L == result.flags_R:
+            winner = 'draw'
+        elif result.flags_L >  result.flags_R:
+            winner = 'L'
+        else:
+            winner = 'R'
+
+        self.emit('match_end', result.frame_no, match_no=match_no, fno_startmatch=result.fno_startmatch,
+                  name_L=result.name_L, name_R=result.name_R, flags_L=result.flags_L, flags_R=result.flags_R,
+                  winner=winner, text=result.get_winner_text())
+
+
+    def end_video(self, frame_no: int, cnt_matches: int, cancelled: bool) -> None:
+        """動画の解析終了イベントを出力し、溜まっているイベントを書き込む
+
+        Args:
+            frame_no (int): 最後に解析したフレーム番号
+            cnt_matches (int): 決着した試合数
+            cancelled (bool): キャンセルされたか
+        """
+        self.emit('analysis_end', frame_no, matches=cnt_matches, cancelled=cancelled)
+        self.flush()
+
+
+    def flush_if_due(self) -> None:
+        """前回の書き込みから FLUSH_INTERVAL 秒経っていれば、溜まっているイベントを書き込む
+        """
+        if self._buffer and time.monotonic() - self._flush_time >= C.EVENTS.FLUSH_INTERVAL:
+            self.flush()
+
+
+    def flush(self) -> None:
+        """溜まっているイベントを書き込む
+        """
+        self._flush_time = time.monotonic()
+        if not self._buffer:
+            return
+
+        self.output.writelines(self._buffer)
+        self.output.flush()
+        self._buffer.clear()
+
+
+    def close(self) -> None:
+        """溜まっているイベントを書き込み、出力先を閉じる
+        """
+        self.flush()
+        if self._close_output:
+            self.output.close()
@@ -0,0 +1,209 @@
+"""動画ごとの判定結果の保存（2回目以降の解析でデコードを省く）
+"""
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from constants import Constants as C
+
+
+def get_fingerprint(file: str) -> str:
+    """動画ファイルの内容から、ファイルを識別する文字列を取得する
+
+    ファイル全体ではなく、サイズ・更新日時と、数か所のブロックのハッシュから求める
+
+    Args:
+        file (str): 動画ファイルのパス
+
+    Returns:
+        str: 識別文字列（16進数）
+    """
+    stat = os.stat(file)
+    size = stat.st_size
+    block = C.CACHE.FINGERPRINT_BLOCK
+
+    sha = hashlib.sha1()
+    sha.update(f'{size}:{stat.st_mtime_ns}'.encode())
+    with open(file, 'rb') as f:
+        for i in range(C.CACHE.FINGERPRINT_BLOCKS):
+            # 先頭から末尾まで等間隔の位置のブロック
+            offset = max(0, (size - block) * i // max(C.CACHE.FINGERPRINT_BLOCKS - 1, 1))
+            f.seek(offset)
+            sha.update(f.read(block))
+
+    return sha.hexdigest()
+
+
+def get_version(*parts) -> str:
+    """判定方法（テンプレート画像・定数など）から、判定結果のバージョン文字列を取得する
+
+    Args:
+        *parts: 判定結果に影響するもの（numpy.ndarray、bytes、その他は repr() で比較）
+
+    Returns:
+        str: バージョン文字列（16進数）
+    """
+    sha = hashlib.sha1()
+    sha.update(str(C.CACHE.FORMAT_VERSION).encode())
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            sha.update(part.tobytes())
+        elif isinstance(part, bytes):
+            sha.update(part)
+        else:
+            sha.update(repr(part).encode())
+    return sha.hexdigest()
+
+
+class FeatureStore:
+    """動画1件分の判定結果（FrameFeatures の値）をファイルに保存するクラス
+
+    ファイル名は動画ファイルの識別文字列。判定結果の種類ごとにバージョンを持ち、
+    テンプレート画像や定数が変わった種類だけを破棄する。
+
+    Attributes:
+        path (str): 保存先ファイルのパス
+        versions (dict): 判定結果の種類ごとのバージョン文字列
+        readonly (bool): True なら保存しない（新しい判定結果は get_new_entries() で取り出す）
+        cnt_replay (int): 保存済みの判定結果を使ったフレーム数
+    """
+
+
+    def __init__(self, cache_dir: str, file: str, versions: dict, readonly: bool = False):
+        """コンストラクタ（保存済みの判定結果があれば読み込む）
+
+        Args:
+            cache_dir (str): 保存先ディレクトリ
+            file (str): 動画ファイルのパス
+            versions (dict): 判定結果の種類ごとのバージョン文字列
+            readonly (bool): True なら保存しない
+        """
+        self.path = os.path.join(cache_dir, get_fingerprint(file) + '.json')
+        self.versions = versions
+        self.readonly = readonly
+        self.cnt_replay = 0
+
+        self._frames = {}
+        self._new = {}
+        self._dirty = False
+        self._save_time = time.monotonic()
+        self._load()
+
+
+    def _load(self) -> None:
+        """保存済みの判定結果を読み込む。バージョンが違う種類は読み込まない
+        """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        saved_versions = data.get('versions', {})
+        valid = {key for key, version in self.versions.items() if saved_versions.get(key) == version}
+        for fno, values in data.get('frames', {}).items():
+            values = {key: self._decode(key, value) for key, value in values.items() if key in valid}
+            if values:
+                self._frames[int(fno)] = values
+
+
+    @staticmethod
+    def _encode(value):
+        """判定結果を JSON に保存できる形にする
+        """
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        return value
+
+
+    @staticmethod
+    def _decode(key: str, value):
+        """JSON から読み込んだ判定結果を元の形に戻す
+        """
+        if key == 'flagstates':
+            return np.array(value)
+        if isinstance(value, list):
+            return tuple(value)
+        return value
+
+
+    def get(self, frame_no: int) -> dict:
+        """保存済みの判定結果を取得する
+
+        Args:
+            frame_no (int): フレーム番号
+
+        Returns:
+            dict: 判定結果の種類をキーとする連想配列（保存済みのものが無ければ None）
+        """
+        values = self._frames.get(frame_no)
+        if values is not None:
+            self.cnt_replay += 1
+        return values
+
+
+    def put(self, frame_no: int, key: str, value) -> None:
+        """判定結果を追加する（FrameFeatures の on_compute）
+
+        Args:
+            frame_no (int): フレーム番号
+            key (str): 判定結果の種類
+            value (object): 判定結果
+        """
+        if key not in self.versions:
+            return
+
+        self._frames.setdefault(frame_no, {})[key] = value
+        self._new.setdefault(frame_no, {})[key] = value
+        self._dirty = True
+
+        if not self.readonly and time.monotonic() - self._save_time >= C.CACHE.SAVE_INTERVAL:
+            # 異常終了に備えて、一定時間ごとに保存する
+            self.save()
+
+
+    def merge(self, entries: dict) -> None:
+        """他のプロセスで計算した判定結果を追加する
+
+        Args:
+            entries (dict): get_new_entries() の戻り値
+        """
+        for frame_no, values in entries.items():
+            for key, value in values.items():
+                self.put(frame_no, key, value)
+
+
+    def get_new_entries(self) -> dict:
+        """読み込み後に追加した判定結果を取得する
+
+        Returns:
+            dict: フレーム番号をキー、判定結果の連想配列を値とする連想配列
+        """
+        return self._new
+
+
+    def save(self) -> None:
+        """判定結果をファイルに保存する
+        """
+        self._save_time = time.monotonic()
+        if self.readonly or not self._dirty:
+            return
+
+        data = {
+            'versions': self.versions,
+            'frames': {
+                str(fno): {key: self._encode(value) for key, value in values.items()}
+                for fno, values in sorted(self._frames.items())
+            },
+        }
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # 書き込み中に中断しても壊れたファイルが残らないよう、一時ファイルから置き換える
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self._dirty = False
@@ -0,0 +1,113 @@
+"""1フレーム分の判定結果（特徴量）を保持するクラス
+"""
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from stage_stats import StageStats
+
+
+@dataclass
+class FeatureCounter:
+    """特徴量の再利用回数・計算回数
+
+    Attributes:
+        hit (int): 計算済みの値を再利用した回数
+        miss (int): 値を計算した回数
+        decoded (int): フレームを読み込んだ回数
+        stages (StageStats): 判定の種類ごとの時間・再利用回数の記録先（None なら記録しない）
+    """
+    hit: int = 0
+    miss: int = 0
+    decoded: int = 0
+    stages: StageStats = None
+
+
+    def reset(self) -> None:
+        """回数を0に戻す
+        """
+        self.hit = 0
+        self.miss = 0
+        self.decoded = 0
+
+
+class FrameFeatures:
+    """1フレーム分の判定結果（特徴量）を保持するクラス
+
+    フラッグの色、暗転判定の平均輝度、キャラクター選択画面・キャラクター名の信頼度などを、
+    初めて必要になったときに計算し、同じフレームでは計算済みの値を返す。
+    保存済みの判定結果（FeatureStore）から作った場合は、計算が必要になるまでフレームを読み込まない。
+
+    Attributes:
+        frame_no (int): フレーム番号
+        counter (FeatureCounter): 再利用回数・計算回数の集計先
+    """
+
+
+    def __init__(self, frame_no: int, rois: dict, counter: FeatureCounter = None, values: dict = None,
+                 load_rois: Callable[[], dict] = None, on_compute: Callable[[int, str, object], None] = None):
+        """コンストラクタ
+
+        Args:
+            frame_no (int): フレーム番号
+            rois (dict): フレームから切り出した範囲（None なら load_rois() で読み込む）
+            counter (FeatureCounter): 再利用回数・計算回数の集計先（None なら集計しない）
+            values (dict): 計算済みの特徴量
+            load_rois (Callable[[], dict]): フレームを読み込んで範囲を切り出す関数
+            on_compute (Callable[[int, str, object], None]): 特徴量を計算したときに (frame_no, key, value) で呼ぶ関数
+        """
+        self.frame_no = frame_no
+        self.counter = counter if counter is not None else FeatureCounter()
+        self._rois = rois
+        self._load_rois = load_rois
+        self._on_compute = on_compute
+        self._values = dict(values) if values is not None else {}
+
+
+    @property
+    def rois(self) -> dict:
+        """フレームから切り出した範囲（RoiExtractor.extract()）。必要になった時点で読み込む
+        """
+        if self._rois is None and self._load_rois is not None:
+            self._rois = self._load_rois()
+        return self._rois
+
+
+    def get_nbytes(self) -> int:
+        """読み込み済みの切り出した範囲の大きさ
+
+        Returns:
+            int: バイト数（範囲を読み込んでいなければ 0）
+        """
+        if self._rois is None:
+            return 0
+        return sum(roi.nbytes for roi in self._rois.values())
+
+
+    def get(self, key: str, compute: Callable[[], object]):
+        """特徴量を取得する。未計算なら compute() で計算する
+
+        Args:
+            key (str): 特徴量の名前
+            compute (Callable[[], object]): 特徴量を計算する関数
+
+        Returns:
+            object: 特徴量
+        """
+        stages = self.counter.stages
+        if key in self._values:
+            self.counter.hit += 1
+            if stages is not None:
+                stages.add_hit(key)
+            return self._values[key]
+
+        self.counter.miss += 1
+        start = time.perf_counter()
+        value = compute()
+        if stages is not None:
+            # 保存済みの判定結果から作ったフレームでは、フレームの読み込み時間を含む
+            stages.add(key, time.perf_counter() - start)
+        self._values[key] = value
+        if self._on_compute is not None:
+            self._on_compute(self.frame_no, key, value)
+        return value
@@ -0,0 +1,200 @@
+"""フレームの先読み（デコード用スレッド）
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable
+
+from frame_source import FrameSource
+
+
+@dataclass
+class PrefetchStats:
+    """先読みの統計情報
+
+    Attributes:
+        depth (int): キューの最大件数
+        cnt_read (int): 解析側が受け取ったフレーム数
+        cnt_replan (int): 読み込み予定を立て直した回数
+        cnt_discard (int): 予定の変更で捨てたフレーム数
+        sum_queued (int): 解析側が受け取る時点でキューにあったフレーム数の合計（平均の計算用）
+        stall_consumer (float): 解析側がフレームを待った時間（秒）
+        stall_producer (float): デコード側がキューの空きを待った時間（秒）
+    """
+    depth: int = 0
+    cnt_read: int = 0
+    cnt_replan: int = 0
+    cnt_discard: int = 0
+    sum_queued: int = 0
+    stall_consumer: float = 0.0
+    stall_producer: float = 0.0
+
+
+    def get_avg_queued(self) -> float:
+        """解析側が受け取る時点でキューにあったフレーム数の平均
+
+        Returns:
+            float: 平均件数
+        """
+        return self.sum_queued / self.cnt_read if self.cnt_read > 0 else 0.0
+
+
+class FramePrefetcher:
+    """デコード用スレッドで、次に解析する予定のフレームを先に読み込んで切り出すクラス
+
+    解析側が read(target_fno, skip) を呼ぶと、target_fno 以降 skip 間隔のフレームを読み込む予定を立てる。
+    デコード用スレッドは予定に従ってフレームを読み込み、切り出した範囲を上限付きのキューに入れる。
+    予定と違うフレームを要求された場合（スキップ間隔の変更、二分探索など）は、キューを捨てて予定を立て直す。
+
+    FrameSource は先読み中はデコード用スレッドだけが使う。
+
+    Attributes:
+        stats (PrefetchStats): 統計情報
+    """
+
+
+    def __init__(self, source: FrameSource, extract: Callable, depth: int):
+        """コンストラクタ（デコード用スレッドを開始する）
+
+        Args:
+            source (FrameSource): open() 済みの動画フレームの供給元
+            extract (Callable): フレームから範囲を切り出す関数（RoiExtractor.extract() など）
+            depth (int): キューの最大件数
+        """
+        self.source = source
+        self.extract = extract
+        self.depth = depth
+        self.stats = PrefetchStats(depth=depth)
+
+        self._cond = threading.Condition()
+        self._queue = deque()   # (フレーム番号, 読み込めたか, 切り出した範囲)
+        self._gen = 0           # 予定の世代。予定を立て直したら増やす
+        self._next_fno = None   # デコード用スレッドが次に読み込むフレーム番号（None なら予定なし）
+        self._skip = None       # 読み込む間隔（None なら1フレームだけ）
+        self._expected = None   # 解析側が次に受け取る予定のフレーム番号
+        self._stopped = False
+        self._error = None      # デコード用スレッドで発生した例外
+
+        self._thread = threading.Thread(target=self._run, name='frame-prefetch', daemon=True)
+        self._thread.start()
+
+
+    def _run(self) -> None:
+        """デコード用スレッドの処理
+        """
+        cond = self._cond
+        while True:
+            with cond:
+                wait_start = None
+                while not self._stopped and (self._next_fno is None or len(self._queue) >= self.depth):
+                    if self._next_fno is not None and wait_start is None:
+                        # キューが一杯で待つ
+                        wait_start = time.perf_counter()
+                    cond.wait()
+                if wait_start is not None:
+                    self.stats.stall_producer += time.perf_counter() - wait_start
+                if self._stopped:
+                    return
+
+                gen, fno, skip = self._gen, self._next_fno, self._skip
+                self._next_fno = fno + skip if skip else None
+
+            try:
+                ret, frame = self.source.read(fno, skip)
+                rois = self.extract(frame) if ret else None
+            except Exception as e:
+                # 解析側で例外を発生させる
+                ret, rois = False, None
+                with cond:
+                    self._error = e
+
+            with cond:
+                if gen == self._gen:
+                    self._queue.append((fno, ret, rois))
+                    if not ret:
+                        # 動画の終端。これ以上は読み込まない
+                        self._next_fno = None
+                else:
+                    self.stats.cnt_discard += 1
+                cond.notify_all()
+
+
+    def _replan(self, target_fno: int, skip: int) -> None:
+        """読み込み予定を立て直す（self._cond を取得した状態で呼ぶ）
+
+        Args:
+            target_fno (int): 次に読み込むフレーム番号
+            skip (int): 読み込む間隔（None なら1フレームだけ）
+        """
+        self._cancel()
+        self.stats.cnt_replan += 1
+        self._next_fno = target_fno
+        self._skip = skip
+        self._expected = target_fno
+        self._cond.notify_all()
+
+
+    def _cancel(self) -> None:
+        """読み込み予定を取り消す（self._cond を取得した状態で呼ぶ）
+        """
+        self.stats.cnt_discard += len(self._queue)
+        self._queue.clear()
+        self._gen += 1
+        self._next_fno = None
+        self._skip = None
+        self._expected = None
+
+
+    def read(self, target_fno: int, skip: int = None):
+        """指定したフレーム番号のフレームから切り出した範囲を取得する
+
+        Args:
+            target_fno (int): フレーム番号
+            skip (int): この後 skip 間隔で読み込む予定なら、その間隔（None なら先読みしない）
+
+        Returns:
+            bool: 読み込めればTrue
+            object: 切り出した範囲（extract() の戻り値）。読み込めなければ None
+        """
+        cond = self._cond
+        with cond:
+            if target_fno != self._expected:
+                self._replan(target_fno, skip)
+
+            self.stats.sum_queued += len(self._queue)
+
+            # 要求したフレームが読み込まれるのを待つ
+            wait_start = time.perf_counter()
+            while not self._queue:
+                cond.wait()
+            self.stats.stall_consumer += time.perf_counter() - wait_start
+
+            fno, ret, rois = self._queue.popleft()
+            self.stats.cnt_read += 1
+
+            if self._error is not None:
+                error, self._error = self._error, None
+                self._cancel()
+                raise error
+
+            if not ret or not skip:
+                # 動画の終端、または先読みしない場合は予定を取り消す
+                self._cancel()
+            elif skip != self._skip:
+                # 受け取ったフレームは使えるが、それ以降の予定は間隔が違う
+                self._replan(fno + skip, skip)
+            else:
+                self._expected = fno + skip
+            cond.notify_all()
+
+        return ret, rois
+
+
+    def close(self) -> None:
+        """デコード用スレッドを終了する
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
@@ -0,0 +1,818 @@
+"""動画フレームの供給元
+"""
+import bisect
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import cv2
+import numpy as np
+
+from constants import Constants as C
+
+
+class FrameSource:
+    """動画フレームの供給元の基底クラス
+
+    AnalyzeVideo はこのクラスを通してフレームを取得する。
+    派生クラスで open()、close()、read() などを実装する。
+
+    Attributes:
+        stats (StageStats): シーク・デコードの時間・回数の記録先（None なら記録しない）
+    """
+
+    stats = None
+
+
+    def open(self, file: str) -> bool:
+        """動画ファイルを開く
+
+        Args:
+            file (str): 動画ファイルのパス
+
+        Returns:
+            bool: 開けたらTrue
+        """
+        raise NotImplementedError
+
+
+    def close(self) -> None:
+        """動画ファイルを閉じる
+        """
+        raise NotImplementedError
+
+
+    def is_opened(self) -> bool:
+        """動画ファイルを開いているかを返す
+
+        Returns:
+            bool: 開いていればTrue
+        """
+        raise NotImplementedError
+
+
+    def get_fps(self) -> float:
+        """動画のフレームレートを取得
+
+        Returns:
+            float: 動画のフレームレート
+        """
+        raise NotImplementedError
+
+
+    def get_totalframes(self) -> int:
+        """動画のフレーム数を取得
+
+        Returns:
+            int: 動画のフレーム数
+        """
+        raise NotImplementedError
+
+
+    def get_frame_size(self) -> tuple:
+        """read() で返すフレームの大きさを取得
+
+        Returns:
+            tuple: (幅, 高さ)
+        """
+        raise NotImplementedError
+
+
+    def get_scaling(self) -> tuple:
+        """フレームを縮小する方法を取得する（縮小方法で画素が変わるため、保存する判定結果のバージョンに含める）
+
+        Returns:
+            tuple: 縮小方法の識別。既定は元の解像度のフレームを返し、RoiExtractor が縮小する
+        """
+        return ('cv', C.IMG_MATCH.BASE_RESOLUTION)
+
+
+    def read(self, target_fno: int, next_skip: int = None):
+        """指定したフレーム番号のフレームを読み込む
+
+        Args:
+            target_fno (int): フレーム番号
+            next_skip (int): この後 next_skip 間隔のフレームを読む予定なら、その間隔（間引いて読む供給元が使う）
+
+        Returns:
+            bool: 読み込めたらTrue
+            numpy.ndarray: フレーム（BGR）
+        """
+        raise NotImplementedError
+
+
+    def snap_to_keyframe(self, fno: int, max_dist: int, min_fno: int = 0) -> int:
+        """指定したフレーム番号に近いキーフレームのフレーム番号を返す
+
+        キーフレームの位置が分からない場合は fno をそのまま返す
+
+        Args:
+            fno (int): フレーム番号
+            max_dist (int): fno からの最大距離（フレーム）
+            min_fno (int): これより小さいフレーム番号は返さない
+
+        Returns:
+            int: フレーム番号
+        """
+        return fno
+
+
+    def is_live(self) -> bool:
+        """書き込み中の動画ファイル（総フレーム数が不明で、前に戻れない）を読んでいるかを返す
+
+        Returns:
+            bool: 書き込み中の動画ファイルならTrue
+        """
+        return False
+
+
+class CvFrameSource(FrameSource):
+    """cv2.VideoCapture によるフレーム供給元
+
+    目的のフレームまでの近距離は grab() で進めて、目的のフレームだけ retrieve() する。
+    grab() はデコードのみで BGR 変換・コピーを行わないため、read() で読み捨てるより速い。
+
+    Attributes:
+        capture (cv2.VideoCapture): 動画ファイルのキャプチャオブジェクト
+        backend (int): OpenCV のバックエンド（cv2.CAP_FFMPEG など）
+        threads (int): デコーダーのスレッド数（0 なら OpenCV の既定値）
+        ffmpeg_options (str): FFmpeg のキャプチャオプション（'key;value|key;value' 形式）
+        strategy (str): 近距離の進め方。'grab'（grab/retrieve）または 'read'（read で読み捨てる）
+        max_sequential (int): set() でなく順に読み進める最大フレーム数（コストモデルが無い場合）
+        calibrate (bool): 開いた時にキーフレームの位置とシーク・読み進めのコストを計測するか
+        keyframes (list[int]): キーフレームのフレーム番号のリスト（不明なら None）
+        cost_grab (float): 1フレーム読み進めるコスト（秒）（未計測なら None）
+        cost_seek (float): シークの固定コスト（秒）。キーフレームが不明ならキーフレームからのデコードを含む平均値
+        follow (bool): 書き込み中の動画ファイルを追従するか。FFmpeg の follow オプションで終端に達しても
+                       ファイルが大きくなるのを待ち、C.PROC_SPD.FOLLOW_TIMEOUT 秒大きくならなければ終端とする。
+                       書き込み中のファイルはシークできないため、前から順に読み進めるだけにする
+    """
+
+    # バックエンド名と OpenCV の定数の対応
+    BACKENDS = {
+        'any':       cv2.CAP_ANY,
+        'ffmpeg':    cv2.CAP_FFMPEG,
+        'msmf':      cv2.CAP_MSMF,
+        'dshow':     cv2.CAP_DSHOW,
+        'gstreamer': cv2.CAP_GSTREAMER,
+    }
+
+    STRATEGIES = ('grab', 'read')
+
+
+    def __init__(self, backend: int = cv2.CAP_ANY, threads: int = 0, ffmpeg_options: str = None,
+                 strategy: str = 'grab', max_sequential: int = C.PROC_SPD.MAX_SEQUENTIAL_READ,
+                 calibrate: bool = True, follow: bool = False):
+        """コンストラクタ
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f'unknown strategy: {strategy}')
+
+        self.capture = None
+        self.backend = backend
+        self.threads = threads
+        self.ffmpeg_options = ffmpeg_options
+        self.strategy = strategy
+        self.max_sequential = max_sequential
+        self.calibrate = calibrate
+        self.follow = follow
+
+        self.keyframes = None
+        self.cost_grab = None
+        self.cost_seek = None
+
+
+    def open(self, file: str) -> bool:
+        """動画ファイルを開く
+
+        Args:
+            file (str): 動画ファイルのパス
+
+        Returns:
+            bool: 開けたらTrue
+        """
+        self.close()
+
+        # FFmpeg バックエンドのオプションは環境変数で渡す
+        ffmpeg_options = self.ffmpeg_options
+        backend = self.backend
+        if self.follow:
+            # 終端で待つのは FFmpeg バックエンドだけ（rw_timeout はマイクロ秒）
+            follow_options = f'follow;1|rw_timeout;{int(C.PROC_SPD.FOLLOW_TIMEOUT * 1000000)}'
+            ffmpeg_options = follow_options if ffmpeg_options is None else f'{ffmpeg_options}|{follow_options}'
+            backend = cv2.CAP_FFMPEG
+        # 環境変数は開く時だけ読まれるので、開いたら元に戻す（後で開く他の動画に引き継がない）
+        prev_options = os.environ.get('OPENCV_FFMPEG_CAPTURE_OPTIONS')
+        if ffmpeg_options is not None:
+            os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = ffmpeg_options
+
+        params = []
+        if self.threads > 0:
+            params += [cv2.CAP_PROP_N_THREADS, self.threads]
+
+        try:
+            self.capture = cv2.VideoCapture(file, backend, params)
+        finally:
+            if ffmpeg_options is not None:
+                if prev_options is None:
+                    del os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS']
+                else:
+                    os.environ['OPENCV_FFMPEG_CAPTURE_OPTIONS'] = prev_options
+        if not self.capture.isOpened():
+            return False
+
+        self.keyframes = None
+        self.cost_grab = None
+        self.cost_seek = None
+        if self.calibrate and not self.follow and self.get_totalframes() > 1:
+            self.keyframes = probe_keyframes(file)
+            self._calibrate()
+
+        return True
+
+
+    def _calibrate(self) -> None:
+        """シークと読み進めのコストを計測する
+        """
+        totalframes = self.get_totalframes()
+
+        # 読み進めのコスト（1フレームあたり）
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        cnt_grab = min(C.PROC_SPD.CALIB_GRABS, totalframes - 1)
+        start = time.perf_counter()
+        for _ in range(cnt_grab):
+            if not self.capture.grab():
+                break
+        self.cost_grab = (time.perf_counter() - start) / max(cnt_grab, 1)
+
+        # シークのコスト（動画内に均等に散らした位置へ移動して1フレーム読む）
+        costs = []
+        for k in range(C.PROC_SPD.CALIB_SEEKS):
+            fno = totalframes * (2*k + 1) // (2 * C.PROC_SPD.CALIB_SEEKS)
+            start = time.perf_counter()
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, fno)
+            self.capture.grab()
+            cost = time.perf_counter() - start
+            if self.keyframes:
+                # キーフレームから目的のフレームまでのデコード分を除いた固定コスト
+                cost -= self.cost_grab * (fno - self._prev_keyframe(fno))
+            costs.append(max(cost, 0.0))
+        self.cost_seek = sum(costs) / len(costs)
+
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+
+    def _prev_keyframe(self, fno: int) -> int:
+        """指定したフレーム番号以前で最も近いキーフレームを返す
+
+        Args:
+            fno (int): フレーム番号
+
+        Returns:
+            int: キーフレームのフレーム番号
+        """
+        i = bisect.bisect_right(self.keyframes, fno)
+        return self.keyframes[i-1] if i > 0 else 0
+
+
+    def get_seek_model(self) -> str:
+        """シーク・読み進めのコストモデルの説明文を返す
+
+        Returns:
+            str: 説明文（未計測なら空文字）
+        """
+        if self.cost_grab is None:
+            return ''
+
+        text = f'読み進め {self.cost_grab * 1000:.2f}ms/フレーム、シーク {self.cost_seek * 1000:.2f}ms'
+        if self.keyframes:
+            gop = self.get_totalframes() / len(self.keyframes)
+            text += f'、キーフレーム {len(self.keyframes)} 個（平均間隔 {gop:.1f} フレーム）'
+        if self.cost_grab > 0:
+            text += f'、損益分岐 {self.cost_seek / self.cost_grab:.0f} フレーム'
+        return text
+
+
+    def _is_sequential(self, current_fno: int, target_fno: int) -> bool:
+        """set() でなく順に読み進めた方が速いかを判定
+
+        Args:
+            current_fno (int): 現在位置のフレーム番号
+            target_fno (int): 目的のフレーム番号
+
+        Returns:
+            bool: 順に読み進めた方が速ければTrue
+        """
+        delta = target_fno - current_fno
+        if delta < 0:
+            return False
+
+        if self.cost_grab is None:
+            return delta <= self.max_sequential
+
+        # シークは直前のキーフレームからデコードし直すので、その分のコストを加える
+        cost_seek = self.cost_seek
+        if self.keyframes:
+            cost_seek += self.cost_grab * (target_fno - self._prev_keyframe(target_fno))
+        return delta * self.cost_grab <= cost_seek
+
+
+    def snap_to_keyframe(self, fno: int, max_dist: int, min_fno: int = 0) -> int:
+        """指定したフレーム番号に近いキーフレームのフレーム番号を返す
+
+        キーフレームの位置が分からない場合は fno をそのまま返す
+
+        Args:
+            fno (int): フレーム番号
+            max_dist (int): fno からの最大距離（フレーム）
+            min_fno (int): これより小さいフレーム番号は返さない
+
+        Returns:
+            int: フレーム番号
+        """
+        if not self.keyframes:
+            return fno
+
+        i = bisect.bisect_left(self.keyframes, fno)
+        candidates = [kf for kf in self.keyframes[max(i-1, 0):i+1]
+                      if kf >= min_fno and abs(kf - fno) <= max_dist]
+        if not candidates:
+            return fno
+        return min(candidates, key=lambda kf: abs(kf - fno))
+
+
+    def is_live(self) -> bool:
+        """書き込み中の動画ファイル（総フレーム数が不明で、前に戻れない）を読んでいるかを返す
+
+        Returns:
+            bool: follow が有効ならTrue
+        """
+        return self.follow
+
+
+    def close(self) -> None:
+        """動画ファイルを閉じる
+        """
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+    def is_opened(self) -> bool:
+        """動画ファイルを開いているかを返す
+
+        Returns:
+            bool: 開いていればTrue
+        """
+        return self.capture is not None and self.capture.isOpened()
+
+
+    def get_fps(self) -> float:
+        """動画のフレームレートを取得
+
+        Returns:
+            float: 動画のフレームレート
+        """
+        return self.capture.get(cv2.CAP_PROP_FPS)
+
+
+    def get_totalframes(self) -> int:
+        """動画のフレーム数を取得
+
+        Returns:
+            int: 動画のフレーム数（書き込み中で不明なら0）
+        """
+        if self.follow:
+            # 書き込み中のファイルのフレーム数は不定値になる
+            return 0
+        return int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+
+    def get_frame_size(self) -> tuple:
+        """read() で返すフレームの大きさを取得
+
+        Returns:
+            tuple: (幅, 高さ)
+        """
+        return (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+
+    def get_backend_name(self) -> str:
+        """実際に使われているバックエンド名を取得
+
+        Returns:
+            str: バックエンド名
+        """
+        return self.capture.getBackendName()
+
+
+    def read(self, target_fno: int, next_skip: int = None):
+        """指定したフレーム番号のフレームを読み込む
+
+        Args:
+            target_fno (int): フレーム番号
+            next_skip (int): 使わない
+
+        Returns:
+            bool: 読み込めたらTrue
+            numpy.ndarray: フレーム（BGR）
+        """
+        # 現在位置取得
+        current_fno = int(self.capture.get(cv2.CAP_PROP_POS_FRAMES))
+        delta = target_fno - current_fno
+
+        if self.follow and delta < 0:
+            # 書き込み中のファイルは前に戻れない
+            return False, None
+
+        stats = self.stats
+        if not self.follow and not self._is_sequential(current_fno, target_fno):
+            # 遠距離なら直接 set() する
+            start = time.perf_counter()
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, target_fno)
+            if stats is not None:
+                stats.add_seek(delta, time.perf_counter() - start)
+            delta = 0
+
+        # 近距離なら順に読み進める
+        start = time.perf_counter()
+        if self.strategy == 'read':
+            for _ in range(delta):
+                ret, _ = self.capture.read()
+            ret, frame = self.capture.read()
+            if stats is not None:
+                stats.add('decode', time.perf_counter() - start)
+                stats.cnt_grab += delta + 1
+            return ret, frame
+
+        # 目的のフレームも含めて grab() する
+        cnt_grab = 0
+        for _ in range(delta + 1):
+            if not self.capture.grab():
+                break
+            cnt_grab += 1
+        if stats is not None:
+            stats.add('decode', time.perf_counter() - start)
+            stats.cnt_grab += cnt_grab
+        if cnt_grab <= delta:
+            return False, None
+
+        start = time.perf_counter()
+        ret, frame = self.capture.retrieve()
+        if stats is not None:
+            stats.add('retrieve', time.perf_counter() - start)
+        return ret, frame
+
+
+# ffmpeg の実行ファイルのパスをキーとする、バージョン（get_ffmpeg_version()）
+_ffmpeg_versions = {}
+
+
+def get_ffmpeg_version(ffmpeg: str) -> tuple:
+    """ffmpeg のバージョンを取得する（実行ファイルごとに1度だけ ffmpeg -version を実行する）
+
+    Args:
+        ffmpeg (str): ffmpeg の実行ファイルのパス
+
+    Returns:
+        tuple: (メジャー, マイナー)。開発版などで番号が分からなければ () 、実行できなければ None
+    """
+    if ffmpeg not in _ffmpeg_versions:
+        try:
+            result = subprocess.run([ffmpeg, '-hide_banner', '-version'], capture_output=True, text=True,
+                                    timeout=C.PROC_SPD.PROBE_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired):
+            result = None
+        if result is None or result.returncode != 0:
+            _ffmpeg_versions[ffmpeg] = None
+        else:
+            match = re.search(r'version n?(\d+)\.(\d+)', result.stdout)
+            _ffmpeg_versions[ffmpeg] = (int(match.group(1)), int(match.group(2))) if match else ()
+    return _ffmpeg_versions[ffmpeg]
+
+
+class FfmpegPipeSource(FrameSource):
+    """ffmpeg プロセスでデコード・縮小・間引きしたフレームを、パイプで受け取るフレーム供給元
+
+    ffmpeg に -vf select（間引き）,scale（縮小）を指定し、BGR の生データをパイプから読む。
+    cv2.VideoCapture と違い、元の解像度のフレームを BGR に変換・コピーせず、縮小後のフレームだけを受け取る。
+    間引く間隔は read() の next_skip（この後読む間隔）で決める。前に戻る、間引いた格子に乗らない、
+    または max_gap より遠いフレームを要求されたら、-ss で目的のフレームから ffmpeg を起動し直す。
+
+    フレームは使い回すバッファに読み込むので、次の read() までに使い終えること
+    （RoiExtractor.extract() は切り出した範囲をコピーする）。
+    ffmpeg が異常終了した場合や、動画の終端より前で出力が途切れた場合は、動画の終端とみなさずに
+    ffmpeg のエラー出力を付けて OSError を送出する（解析が途中で終わったことに気付けるように）。
+
+    Attributes:
+        ffmpeg (str): ffmpeg の実行ファイルのパス（None なら PATH から探す）
+        size (tuple): 出力するフレームの大きさ (幅, 高さ)
+        threads (int): デコーダーのスレッド数（0 なら ffmpeg の既定値）
+        max_gap (int): ffmpeg を起動し直さずに読み捨てる最大フレーム数
+        file (str): 開いている動画ファイルのパス
+        cnt_restart (int): ffmpeg を起動した回数
+    """
+
+
+    def __init__(self, ffmpeg: str = None, size: tuple = C.IMG_MATCH.BASE_RESOLUTION[2:], threads: int = 0,
+                 max_gap: int = C.PROC_SPD.PIPE_MAX_GAP):
+        """コンストラクタ
+        """
+        self.ffmpeg = ffmpeg
+        self.size = tuple(size)
+        self.threads = threads
+        self.max_gap = max_gap
+        self.file = None
+        self.cnt_restart = 0
+
+        self._fps = 0.0
+        self._totalframes = 0
+        self._proc = None
+        self._stderr = None     # ffmpeg のエラー出力の保存先（一時ファイル）
+        self._sync_args = []    # フレームを複製・間引きしないオプション（ffmpeg のバージョンで異なる）
+        self._next_fno = None   # パイプから次に届くフレームのフレーム番号
+        self._stride = 1        # パイプに届くフレームの間隔
+
+        # フレームを読み込むバッファ（np.frombuffer で同じメモリを配列として参照する）
+        width, height = self.size
+        self._buffer = bytearray(width * height * 3)
+        self._frame = np.frombuffer(self._buffer, dtype=np.uint8).reshape(height, width, 3)
+
+
+    def open(self, file: str) -> bool:
+        """動画ファイルを開く（フレームレート・フレーム数だけを取得し、ffmpeg は最初の read() で起動する）
+
+        Args:
+            file (str): 動画ファイルのパス
+
+        Returns:
+            bool: 開けたらTrue
+        """
+        self.close()
+        if self.ffmpeg is None:
+            self.ffmpeg = shutil.which('ffmpeg')
+        if self.ffmpeg is None:
+            return False
+
+        # -fps_mode は ffmpeg 5.1 から。それより前は -vsync を使う
+        version = get_ffmpeg_version(self.ffmpeg)
+        if version is None:
+            return False
+        self._sync_args = ['-vsync', 'passthrough'] if version and version < (5, 1) else ['-fps_mode', 'passthrough']
+
+        # フレーム数は CvFrameSource と同じ値を使う
+        capture = cv2.VideoCapture(file)
+        if not capture.isOpened():
+            return False
+        self._fps = capture.get(cv2.CAP_PROP_FPS)
+        self._totalframes = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+
+        self.file = file
+        self.cnt_restart = 0
+        return True
+
+
+    def _start(self, start_fno: int, stride: int) -> None:
+        """start_fno から stride 間隔のフレームを出力する ffmpeg を起動する
+
+        Args:
+            start_fno (int): 最初に出力するフレーム番号
+            stride (int): 出力するフレームの間隔
+        """
+        self._stop()
+
+        cmd = [self.ffmpeg, '-nostdin', '-loglevel', 'error']
+        if self.threads > 0:
+            cmd += ['-threads', str(self.threads)]
+        if start_fno > 0:
+            # 目的のフレームと1つ前のフレームの中間の時刻から（時刻の丸めで前後のフレームにずれないように）
+            cmd += ['-ss', f'{(start_fno - 0.5) / self._fps:.6f}']
+        cmd += ['-i', self.file, '-map', '0:v:0', '-an', '-sn']
+
+        filters = []
+        if stride > 1:
+            # n はシーク後のフレームの通し番号
+            filters.append(f"select='not(mod(n,{stride}))'")
+        filters.append('scale={}:{}:flags=area'.format(*self.size))
+        cmd += ['-vf', ','.join(filters)] + self._sync_args + ['-pix_fmt', 'bgr24', '-f', 'rawvideo', 'pipe:1']
+
+        # エラー出力はパイプだと読まずに溜まって詰まるので、一時ファイルに書かせる
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                      stderr=self._stderr, bufsize=len(self._buffer))
+        self._next_fno = start_fno
+        self._stride = stride
+        self.cnt_restart += 1
+
+
+    def _stop(self) -> None:
+        """ffmpeg を終了する
+        """
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.stdout.close()
+            self._proc.wait()
+            self._proc = None
+        if self._stderr is not None:
+            self._stderr.close()
+            self._stderr = None
+        self._next_fno = None
+
+
+    def _check_exit(self, target_fno: int) -> None:
+        """パイプの出力が終わった ffmpeg の終了を待ち、動画の終端まで出力したかを確かめる
+
+        Args:
+            target_fno (int): 読み込もうとしたフレーム番号
+
+        Raises:
+            OSError: ffmpeg が異常終了した、または動画の終端より前で出力が途切れた
+        """
+        returncode = self._proc.wait()
+        if returncode == 0 and target_fno >= self._totalframes:
+            return
+
+        self._stderr.seek(0)
+        message = self._stderr.read().decode(errors='replace').strip()
+        self._stop()
+        if returncode != 0:
+            raise OSError(f'ffmpeg exited with code {returncode} at frame {target_fno}: {message}')
+        raise OSError(f'ffmpeg output ended at frame {target_fno} of {self._totalframes}: {message}')
+
+
+    def _read_frame(self) -> bool:
+        """パイプから1フレーム分をバッファに読み込む
+
+        Returns:
+            bool: 1フレーム分読み込めたらTrue（ffmpeg の出力が終わったらFalse）
+        """
+        view = memoryview(self._buffer)
+        got = 0
+        while got < len(view):
+            n = self._proc.stdout.readinto(view[got:])
+            if not n:
+                return False
+            got += n
+        self._next_fno += self._stride
+        return True
+
+
+    def read(self, target_fno: int, next_skip: int = None):
+        """指定したフレーム番号のフレームを読み込む
+
+        Args:
+            target_fno (int): フレーム番号
+            next_skip (int): この後 next_skip 間隔のフレームを読む予定なら、その間隔（ffmpeg で間引く間隔）
+
+        Returns:
+            bool: 読み込めたらTrue（動画の終端ならFalse）
+            numpy.ndarray: フレーム（BGR、size の大きさ）。次の read() までに使い終えること
+
+        Raises:
+            OSError: ffmpeg が異常終了した、または動画の終端より前で出力が途切れた
+        """
+        stats = self.stats
+        delta = target_fno - self._next_fno if self._next_fno is not None else -1
+        if delta < 0 or delta % self._stride != 0 or delta > self.max_gap:
+            # パイプの続きでは届かないので、目的のフレームから起動し直す
+            start = time.perf_counter()
+            self._start(target_fno, max(next_skip or 1, 1))
+            if stats is not None:
+                stats.add_seek(delta, time.perf_counter() - start)
+
+        # 目的のフレームまでは読み捨てる
+        start = time.perf_counter()
+        cnt_read = 0
+        ret = True
+        while ret and self._next_fno <= target_fno:
+            ret = self._read_frame()
+            cnt_read += ret
+        if stats is not None:
+            stats.add('decode', time.perf_counter() - start)
+            stats.cnt_grab += cnt_read
+
+        if not ret:
+            # 動画の終端なら読み込めなかったことを返す（途中で途切れた場合は OSError）
+            self._check_exit(target_fno)
+            self._stop()
+            return False, None
+        return True, self._frame
+
+
+    def close(self) -> None:
+        """動画ファイルを閉じる
+        """
+        self._stop()
+        self.file = None
+
+
+    def is_opened(self) -> bool:
+        """動画ファイルを開いているかを返す
+
+        Returns:
+            bool: 開いていればTrue
+        """
+        return self.file is not None
+
+
+    def get_fps(self) -> float:
+        """動画のフレームレートを取得
+
+        Returns:
+            float: 動画のフレームレート
+        """
+        return self._fps
+
+
+    def get_totalframes(self) -> int:
+        """動画のフレーム数を取得
+
+        Returns:
+            int: 動画のフレーム数
+        """
+        return self._totalframes
+
+
+    def get_frame_size(self) -> tuple:
+        """read() で返すフレームの大きさを取得
+
+        Returns:
+            tuple: (幅, 高さ)
+        """
+        return self.size
+
+
+    def get_scaling(self) -> tuple:
+        """フレームを縮小する方法を取得する（ffmpeg がフレーム全体を flags=area で縮小する）
+
+        Returns:
+            tuple: 縮小方法の識別
+        """
+        return ('pipe', self.size, 'area')
+
+
+def probe_keyframes(file: str) -> list:
+    """ffprobe で動画のキーフレームの位置を取得する
+
+    パケットの情報だけを読むのでデコードはしない。ffprobe が無い場合や失敗した場合は None を返す
+
+    Args:
+        file (str): 動画ファイルのパス
+
+    Returns:
+        list[int]: キーフレームのフレーム番号（表示順）のリスト
+    """
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return None
+
+    cmd = [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'packet=pts,flags', '-of', 'csv=p=0', file]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=C.PROC_SPD.PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if result.returncode != 0:
+        return None
+
+    packets = []
+    for i, line in enumerate(result.stdout.splitlines()):
+        fields = line.strip().split(',')
+        if len(fields) < 2:
+            continue
+        pts = int(fields[0]) if fields[0].lstrip('-').isdigit() else i
+        packets.append((pts, 'K' in fields[1]))
+
+    # デコード順から表示順に並べ替えて、キーフレームのフレーム番号を求める
+    packets.sort(key=lambda packet: packet[0])
+    keyframes = [fno for fno, (_, is_key) in enumerate(packets) if is_key]
+    return keyframes or None
+
+
+# create_frame_source() で指定できるバックエンド名
+BACKEND_CHOICES = tuple(CvFrameSource.BACKENDS) + ('pipe',)
+
+
+def create_frame_source(backend: str = 'any', threads: int = 0, ffmpeg_options: str = None,
+                        strategy: str = 'grab', calibrate: bool = True, follow: bool = False) -> FrameSource:
+    """コマンドライン引数などの文字列から FrameSource を生成する
+
+    Args:
+        backend (str): バックエンド名（BACKEND_CHOICES のいずれか。'pipe' なら FfmpegPipeSource）
+        threads (int): デコーダーのスレッド数
+        ffmpeg_options (str): FFmpeg のキャプチャオプション
+        strategy (str): 近距離の進め方（'grab' または 'read'）
+        calibrate (bool): 開いた時にシーク・読み進めのコストを計測するか
+        follow (bool): 書き込み中の動画ファイルを追従するか
+
+    Returns:
+        FrameSource: フレーム供給元
+    """
+    if backend == 'pipe':
+        return FfmpegPipeSource(threads=threads)
+    return CvFrameSource(CvFrameSource.BACKENDS[backend], threads, ffmpeg_options, strategy,
+                         calibrate=calibrate, follow=follow)
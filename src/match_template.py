@@ -1,8 +1,6 @@
 """キャラクター選択画面など画像管理
 """
-import os
-import cv2
-from constants import Constants as C
+from template_pack import get_templates
 
 
 class MatchTemplate:
@@ -13,5 +11,4 @@ class MatchTemplate:
     def __init__(self):
         """コンストラクタ
         """
-        filepath_charasel = os.path.join(C.MATCH_TEMPLATE.DIR, C.MATCH_TEMPLATE.CHARASELECT)
-        self.img_charaselect = cv2.imread(filepath_charasel, C.MATCH_TEMPLATE.CHARASEL_COLOR)
+        self.img_charaselect = get_templates()['charaselect']
@@ -0,0 +1,114 @@
+"""キャラクター名画像の一括照合
+"""
+import cv2
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from constants import Constants as C
+
+
+class NameMatcher:
+    """キャラクター名画像をまとめて照合するクラス
+
+    cv2.matchTemplate(TM_CCOEFF_NORMED) と同じ信頼度を、同じ大きさの画像ごとに行列積1回で計算する。
+    画像は読み込み時にグレースケール化・平均を引いて正規化しておく。
+    同じ大きさの画像が1つしかない場合は、cv2.matchTemplate をそのまま使う。
+
+    Attributes:
+        names (list[str]): キャラクター名のリスト（charnames の順）
+        groups (list[tuple]): 画像の大きさごとの (高さ, 幅, names のインデックス, 正規化済み画像の行列
+                              （1つしかない場合はグレースケール画像）)
+    """
+
+
+    def __init__(self, charnames: list, early_exit: float = C.CHAR.EARLY_EXIT):
+        """コンストラクタ
+
+        Args:
+            charnames (list): template_pack.load_name_images() の戻り値
+            early_exit (float): 信頼度がこの値以上の画像が見つかれば、残りの大きさの画像は照合しない
+        """
+        self.names = [charadata['charname'] for charadata in charnames]
+        self.early_exit = early_exit
+
+        images = {}
+        for i, charadata in enumerate(charnames):
+            image = charadata['image']
+            if len(image.shape) > 2:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            images.setdefault(image.shape, []).append((i, image))
+
+        # 画像の多い大きさから照合する
+        self.groups = []
+        for (h, w), items in sorted(images.items(), key=lambda item: -len(item[1])):
+            indexes = np.array([i for i, _ in items])
+            if len(items) == 1:
+                self.groups.append((h, w, indexes, items[0][1]))
+                continue
+
+            templs = np.stack([image.reshape(-1) for _, image in items]).astype(np.float64)
+            templs -= templs.mean(axis=1, keepdims=True)
+            norms = np.linalg.norm(templs, axis=1, keepdims=True)
+            # 単色の画像は常に信頼度 0 とする
+            templs = np.divide(templs, norms, out=np.zeros_like(templs), where=norms > 0)
+            self.groups.append((h, w, indexes, templs))
+
+
+    def get_scores(self, image) -> np.ndarray:
+        """全キャラクター名画像の信頼度最大値を取得
+
+        Args:
+            image (numpy.ndarray): 照合する範囲の画像（カラーまたはグレースケール）
+
+        Returns:
+            numpy.ndarray: names の順の信頼度最大値（早期終了で照合しなかった画像は -1.0）
+        """
+        if len(image.shape) > 2:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        image_f = image.astype(np.float64)
+
+        scores = np.full(len(self.names), -1.0)
+        for h, w, indexes, templs in self.groups:
+            if h > image.shape[0] or w > image.shape[1]:
+                continue
+
+            if len(indexes) == 1:
+                # 同じ大きさの画像が1つだけ
+                result = cv2.matchTemplate(image, templs, cv2.TM_CCOEFF_NORMED)
+                scores[indexes] = result.max()
+            else:
+                # 全ての位置の窓を [位置, 画素] に並べ、平均を引いて正規化する
+                windows = sliding_window_view(image_f, (h, w)).reshape(-1, h * w)
+                windows = windows - windows.mean(axis=1, keepdims=True)
+                norms = np.linalg.norm(windows, axis=1)
+
+                corr = windows @ templs.T
+                # 単色の窓は信頼度 0 とする（cv2.matchTemplate と同じ）
+                corr = np.divide(corr, norms[:, np.newaxis], out=np.zeros_like(corr), where=norms[:, np.newaxis] > 1e-6)
+                scores[indexes] = corr.max(axis=0)
+
+            if scores.max() >= self.early_exit:
+                break
+
+        return scores
+
+
+    def match(self, image):
+        """最も信頼度の高いキャラクター名を取得
+
+        Args:
+            image (numpy.ndarray): 照合する範囲の画像（カラーまたはグレースケール）
+
+        Returns:
+            str: キャラクター名文字列（信頼度が 0 以下なら C.CHAR.NOMATCH）
+            float: 信頼度最大値
+        """
+        if not self.names:
+            return C.CHAR.NOMATCH, 0.0
+
+        scores = self.get_scores(image)
+        best = int(scores.argmax())
+        if scores[best] <= 0.0:
+            return C.CHAR.NOMATCH, 0.0
+
+        return self.names[best], float(scores[best])
@@ -0,0 +1,461 @@
+"""動画の区間並列解析
+
+動画を時間で N 個の区間に分け、区間ごとに別プロセス（別の cv2.VideoCapture）で解析した後、
+区間の境界で状態遷移の結果をつなぎ合わせる。
+
+各区間は、前の区間の終わりと少し重なる位置（overlap）から、状態不明のまま解析を始める。
+状態遷移の結果は「フレーム番号・スキップ間隔・状態」が同じになれば以降は同じになるため、
+前の区間の結果と同じ状態になったフレーム（合流点）で後ろの区間の結果に切り替える。
+重なりの中で合流しなかった場合は、合流するまでメインプロセスで逐次解析を続けるので、
+結果は常に逐次解析と同じになる。
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import TextIO
+
+import cv2
+
+from constants import Constants as C
+from analyze_video import AnalyzeVideo
+from analyzed_video_data import AnalyzedVideoData, MatchResult
+from analyzed_statistics import AnalyzedStatistics
+from analyze_runner import AnalyzeRunner, init_analysis
+from frame_source import create_frame_source
+from stage_stats import StageStats
+from roi_cache import RoiCacheStats
+from screen_cascade import CascadeStats
+
+
+# 統計情報のカウンタ名（SampleState.counts の並び順）
+COUNT_ATTRS = (
+    'cnt_charaselect',
+    'cnt_blackout',
+    'cnt_matstarted',
+    'cnt_lastoneflag',
+    'cnt_matchfinished',
+    'cnt_other',
+)
+
+# 区間の途中から解析を始めた場合に、値が不明（前の区間の値を引き継ぐ）となる項目
+INHERITED_ATTRS = ('fno_eofcharasel', 'fno_startmatch', 'name_L', 'name_R')
+
+
+@dataclass(frozen=True)
+class SampleState:
+    """解析したフレーム時点の状態
+
+    INHERITED_ATTRS の項目は、区間の途中から解析を始めて値が分からない場合 None になる
+    """
+    frame_no: int
+    skip: int
+    skip_key: int
+    mstat: int
+    match_no: int
+    fno_eofcharasel: int
+    fno_startmatch: int
+    name_L: str
+    name_R: str
+    max_flags: int
+    counts: tuple
+
+
+    @classmethod
+    def capture(cls, video_data: AnalyzedVideoData, astats: AnalyzedStatistics) -> 'SampleState':
+        """処理データと統計情報から、現在の状態を取得する
+
+        Args:
+            video_data (AnalyzedVideoData): 処理データ
+            astats (AnalyzedStatistics): 処理結果統計情報
+
+        Returns:
+            SampleState: 現在の状態
+        """
+        mdata = video_data.mdata
+        return cls(
+            frame_no=video_data.frame_no,
+            skip=video_data.skip,
+            skip_key=video_data.skip_key,
+            mstat=video_data.mstat,
+            match_no=mdata.match_no,
+            fno_eofcharasel=mdata.fno_eofcharasel,
+            fno_startmatch=mdata.fno_startmatch,
+            name_L=mdata.name_L,
+            name_R=mdata.name_R,
+            max_flags=mdata.max_flags,
+            counts=tuple(getattr(astats, attr) for attr in COUNT_ATTRS),
+        )
+
+
+    def restore(self, video_data: AnalyzedVideoData, astats: AnalyzedStatistics) -> None:
+        """処理データと統計情報を、この状態に戻す
+
+        Args:
+            video_data (AnalyzedVideoData): 処理データ
+            astats (AnalyzedStatistics): 処理結果統計情報
+        """
+        mdata = video_data.mdata
+        video_data.frame_no   = self.frame_no
+        video_data.skip       = self.skip
+        video_data.skip_key   = self.skip_key
+        video_data.mstat      = self.mstat
+        mdata.match_no        = self.match_no
+        mdata.fno_eofcharasel = self.fno_eofcharasel
+        mdata.fno_startmatch  = self.fno_startmatch
+        mdata.name_L          = self.name_L
+        mdata.name_R          = self.name_R
+        mdata.max_flags       = self.max_flags
+        for attr, count in zip(COUNT_ATTRS, self.counts):
+            setattr(astats, attr, count)
+
+
+    def is_compatible(self, other: 'SampleState') -> bool:
+        """other（後ろの区間の状態）が、この状態（確定した状態）と以降同じ結果になるかを判定
+
+        Args:
+            other (SampleState): 後ろの区間の状態
+
+        Returns:
+            bool: 以降同じ結果になるならTrue
+        """
+        if ( self.frame_no  != other.frame_no
+          or self.skip      != other.skip
+          or self.skip_key  != other.skip_key
+          or self.mstat     != other.mstat
+          or self.max_flags != other.max_flags ):
+            return False
+
+        # キャラクター選択画面の後は、次の試合のキャラクタ名取得に使うため一致が必要
+        if self.mstat == C.STAT.MSTAT_CHARASELECT and self.fno_eofcharasel != other.fno_eofcharasel:
+            return False
+
+        # それ以外は、不明（None）なら確定した状態の値を引き継ぐ
+        for attr in ('fno_startmatch', 'name_L', 'name_R'):
+            value = getattr(other, attr)
+            if value is not None and value != getattr(self, attr):
+                return False
+
+        return True
+
+
+@dataclass
+class SegmentResult:
+    """1区間の解析結果
+    Attributes:
+        start_fno (int): 解析を開始したフレーム番号
+        records (list[SampleState]): 解析したフレームごとの状態
+        matches (list[MatchResult]): 決着した試合の結果のリスト
+        eof (bool): 動画の終端まで解析したか
+        cnt_feature_hit (int): 判定結果の再利用回数
+        cnt_feature_miss (int): 判定結果の計算回数
+        cnt_decoded (int): フレームを読み込んだ回数
+        cnt_cache_replay (int): 保存済みの判定結果を使ったフレーム数
+        cache_entries (dict): 新しく計算した判定結果（FeatureStore.get_new_entries()）
+        stage_stats (StageStats): 処理段階ごとの時間・回数
+        cnt_name_buffer (int): キャラクター名をキャラクター選択画面で残したフレームから取得した回数
+        cnt_name_seek (int): キャラクター名をフレームに戻って取得した回数
+        roi_cache_stats (RoiCacheStats): 切り出した範囲のキャッシュの統計情報
+        cascade_stats (CascadeStats): 画面判定の事前判定の統計情報
+    """
+    start_fno: int
+    records: list
+    matches: list
+    eof: bool
+    cnt_feature_hit: int = 0
+    cnt_feature_miss: int = 0
+    cnt_decoded: int = 0
+    cnt_cache_replay: int = 0
+    cache_entries: dict = None
+    stage_stats: StageStats = None
+    cnt_name_buffer: int = 0
+    cnt_name_seek: int = 0
+    roi_cache_stats: RoiCacheStats = None
+    cascade_stats: CascadeStats = None
+
+
+def _init_worker(cv_threads: int) -> None:
+    """ワーカープロセスの初期化
+
+    Args:
+        cv_threads (int): ワーカー1つあたりの OpenCV のスレッド数
+    """
+    cv2.setNumThreads(cv_threads)
+
+
+def analyze_segment(file_path: str, start_fno: int, stop_fno: int, source_args: dict = None,
+                    runner_args: dict = None, cache_dir: str = None,
+                    roi_cache_bytes: int = C.PROC_SPD.ROI_CACHE_BYTES) -> SegmentResult:
+    """1区間を解析する（ワーカープロセスで実行）
+
+    Args:
+        file_path (str): 動画ファイルのパス
+        start_fno (int): 解析を開始するフレーム番号（0 なら動画の先頭から）
+        stop_fno (int): このフレーム番号以降を解析したら終了する（None なら動画の終端まで）
+        source_args (dict): create_frame_source() の引数（None なら既定の FrameSource）
+        runner_args (dict): AnalyzeRunner のその他の引数
+        cache_dir (str): 判定結果の保存先ディレクトリ（ワーカーは読み込むだけで、保存はメインプロセスで行う）
+        roi_cache_bytes (int): 切り出した範囲と判定結果をメモリに残すバイト数の上限
+
+    Returns:
+        SegmentResult: 区間の解析結果
+    """
+    analyze = AnalyzeVideo(create_frame_source(**(source_args or {})), cache_dir=cache_dir, cache_readonly=True,
+                           roi_cache_bytes=roi_cache_bytes)
+    if not analyze.file_open(file_path):
+        analyze.file_close()
+        return SegmentResult(start_fno, [], [], True)
+
+    video_data, astats = init_analysis(analyze, file_path)
+    if start_fno > 0:
+        # 区間の途中からなので、それまでの状態は不明
+        video_data.frame_no = start_fno
+        for attr in INHERITED_ATTRS:
+            setattr(video_data.mdata, attr, None)
+
+    runner = AnalyzeRunner(analyze, video_data, astats, out=None, **(runner_args or {}))
+    records = []
+    eof = True
+    while runner.step():
+        records.append(SampleState.capture(video_data, astats))
+        if stop_fno is not None and video_data.frame_no >= stop_fno:
+            eof = False
+            break
+
+    analyze.file_close()
+    store = analyze.feature_store
+    return SegmentResult(start_fno, records, video_data.matches, eof,
+                         analyze.feature_counter.hit, analyze.feature_counter.miss, analyze.feature_counter.decoded,
+                         store.cnt_replay if store is not None else 0,
+                         store.get_new_entries() if store is not None else {},
+                         analyze.stage_stats, analyze.cnt_name_buffer, analyze.cnt_name_seek,
+                         analyze.frame_cache.stats, analyze.screen_cascade.stats)
+
+
+class SerialWalker:
+    """区間が合流しなかった部分を、メインプロセスで逐次解析するクラス
+    """
+
+
+    def __init__(self, analyze: AnalyzeVideo, video_data: AnalyzedVideoData, astats: AnalyzedStatistics,
+                 runner_args: dict = None):
+        """コンストラクタ
+
+        Args:
+            analyze (AnalyzeVideo): file_open() 済みの動画解析クラス
+            video_data (AnalyzedVideoData): 作業用の処理データ
+            astats (AnalyzedStatistics): 作業用の処理結果統計情報
+            runner_args (dict): AnalyzeRunner のその他の引数
+        """
+        self.runner = AnalyzeRunner(analyze, video_data, astats, out=None, **(runner_args or {}))
+        self.last = None
+        self.cnt_steps = 0
+
+
+    def step(self, state: SampleState):
+        """state の次のフレームを解析する
+
+        Args:
+            state (SampleState): 確定した最後の状態
+
+        Returns:
+            SampleState: 解析後の状態（動画の終端なら None）
+            list[MatchResult]: 決着した試合の結果のリスト
+        """
+        video_data = self.runner.video_data
+        if state is not self.last:
+            state.restore(video_data, self.runner.astats)
+        video_data.matches = []
+
+        if not self.runner.step():
+            return None, []
+
+        self.cnt_steps += 1
+        self.last = SampleState.capture(video_data, self.runner.astats)
+        return self.last, video_data.matches
+
+
+def _substitute(record, state: SampleState, **kwargs):
+    """不明（None）の項目を state の値で置き換える
+
+    Args:
+        record (SampleState | MatchResult): 後ろの区間の状態または試合結果
+        state (SampleState): 合流点の確定した状態
+        **kwargs: その他に置き換える項目
+
+    Returns:
+        SampleState | MatchResult: 置き換えた結果
+    """
+    for attr in INHERITED_ATTRS:
+        if hasattr(record, attr) and getattr(record, attr) is None:
+            kwargs[attr] = getattr(state, attr)
+
+    if isinstance(record, SampleState):
+        return replace(record, **kwargs)
+
+    for attr, value in kwargs.items():
+        setattr(record, attr, value)
+    return record
+
+
+def merge_segments(results: list, walker_factory) -> tuple:
+    """区間ごとの解析結果をつなぎ合わせる
+
+    Args:
+        results (list[SegmentResult]): 区間の解析結果（先頭から順）
+        walker_factory (Callable[[], SerialWalker]): 逐次解析が必要になった時に SerialWalker を生成する関数
+
+    Returns:
+        list[SampleState]: 解析したフレームごとの状態
+        list[MatchResult]: 決着した試合の結果のリスト
+        int: メインプロセスで逐次解析したフレーム数
+    """
+    truth   = list(results[0].records)
+    matches = list(results[0].matches)
+    eof     = results[0].eof
+    walker  = None
+
+    for segment in results[1:]:
+        if eof or not truth:
+            break
+
+        index = {state.frame_no: j for j, state in enumerate(segment.records)}
+        last_fno = segment.records[-1].frame_no if segment.records else -1
+        scan = 0
+
+        while True:
+            # 合流点を探す
+            conv = None
+            for i in range(scan, len(truth)):
+                j = index.get(truth[i].frame_no)
+                if j is not None and truth[i].is_compatible(segment.records[j]):
+                    conv = (i, j)
+                    break
+            scan = len(truth)
+
+            if conv is not None:
+                i, j = conv
+                state, origin = truth[i], segment.records[j]
+                offset = state.match_no - origin.match_no
+                truth = truth[:i+1] + [
+                    _substitute(
+                        record, state,
+                        match_no=record.match_no + offset,
+                        counts=tuple(s + r - o for s, r, o in zip(state.counts, record.counts, origin.counts)),
+                    )
+                    for record in segment.records[j+1:]
+                ]
+                matches = [m for m in matches if m.frame_no <= state.frame_no] + [
+                    _substitute(m, state) for m in segment.matches if m.frame_no > state.frame_no
+                ]
+                eof = segment.eof
+                break
+
+            if truth[-1].frame_no >= last_fno:
+                # この区間の結果とは合流しなかった。逐次解析の結果で次の区間との合流を探す
+                break
+
+            # 合流するまで逐次解析を続ける
+            if walker is None:
+                walker = walker_factory()
+            state, new_matches = walker.step(truth[-1])
+            if state is None:
+                eof = True
+                break
+            truth.append(state)
+            matches.extend(new_matches)
+
+    # 最後の区間の結果とも合流しなかった場合は、動画の終端まで逐次解析する
+    while not eof and truth:
+        if walker is None:
+            walker = walker_factory()
+        state, new_matches = walker.step(truth[-1])
+        if state is None:
+            break
+        truth.append(state)
+        matches.extend(new_matches)
+
+    cnt_serial = walker.cnt_steps if walker is not None else 0
+    return truth, matches, cnt_serial
+
+
+def analyze_parallel(analyze: AnalyzeVideo, file_path: str, video_data: AnalyzedVideoData,
+                     astats: AnalyzedStatistics, jobs: int,
+                     overlap: float = C.PROC_SPD.PARALLEL_OVERLAP, out: TextIO = None,
+                     source_args: dict = None, runner_args: dict = None, cache_dir: str = None) -> None:
+    """動画を区間に分けて並列に解析し、結果を video_data、astats に格納する
+
+    Args:
+        analyze (AnalyzeVideo): file_open() 済みの動画解析クラス（合流しなかった部分の逐次解析に使う）
+        file_path (str): 動画ファイルのパス
+        video_data (AnalyzedVideoData): init_analysis() で初期化した処理データ
+        astats (AnalyzedStatistics): init_analysis() で初期化した処理結果統計情報
+        jobs (int): 並列数（区間数）
+        overlap (float): 区間の前に重ねて解析する時間（秒）
+        out (TextIO): コンソール出力先（None なら出力しない）
+        source_args (dict): ワーカーで使う create_frame_source() の引数
+        runner_args (dict): AnalyzeRunner のその他の引数（snap_keyframes など）
+        cache_dir (str): ワーカーで使う判定結果の保存先ディレクトリ（analyze と同じであること）
+    """
+    totalframes = video_data.totalframes
+    seg_len = totalframes / jobs
+    overlap_frames = int(video_data.fps * overlap)
+
+    segments = []
+    for k in range(jobs):
+        start_fno = 0 if k == 0 else max(0, int(seg_len * k) - overlap_frames)
+        stop_fno  = None if k == jobs - 1 else int(seg_len * (k+1))
+        segments.append((start_fno, stop_fno))
+
+    # CPU コアをワーカー間で分け合う
+    cv_threads = max(1, (os.cpu_count() or 1) // jobs)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                             initializer=_init_worker, initargs=(cv_threads,)) as executor:
+        futures = [executor.submit(analyze_segment, file_path, start_fno, stop_fno, source_args, runner_args, cache_dir,
+                                   analyze.frame_cache.budget)
+                   for start_fno, stop_fno in segments]
+        results = []
+        for k, future in enumerate(futures):
+            results.append(future.result())
+            if out is not None:
+                print(f'区間 {k+1}/{jobs} 解析完了', file=out)
+
+    def walker_factory():
+        work_data, work_stats = init_analysis(analyze, file_path)
+        return SerialWalker(analyze, work_data, work_stats, runner_args)
+
+    records, matches, cnt_serial = merge_segments(results, walker_factory)
+
+    # 結合した結果を格納する
+    for match in matches:
+        video_data.add_match(match)
+    if records:
+        records[-1].restore(video_data, astats)
+        video_data.mdata.match_no = len(matches)
+
+    # 判定結果の再利用回数・計算回数は、重ねて解析した分・逐次解析した分も含めた合計
+    astats.cnt_feature_hit  = sum(result.cnt_feature_hit  for result in results) + analyze.feature_counter.hit
+    astats.cnt_feature_miss = sum(result.cnt_feature_miss for result in results) + analyze.feature_counter.miss
+    astats.cnt_decoded      = sum(result.cnt_decoded      for result in results) + analyze.feature_counter.decoded
+    astats.cnt_name_buffer  = sum(result.cnt_name_buffer  for result in results) + analyze.cnt_name_buffer
+    astats.cnt_name_seek    = sum(result.cnt_name_seek    for result in results) + analyze.cnt_name_seek
+    astats.stage_stats = analyze.stage_stats
+    astats.roi_cache_stats = analyze.frame_cache.stats
+    astats.cascade_stats = analyze.screen_cascade.stats
+    for result in results:
+        if result.stage_stats is not None:
+            astats.stage_stats.merge(result.stage_stats)
+        if result.roi_cache_stats is not None:
+            astats.roi_cache_stats.merge(result.roi_cache_stats)
+        if result.cascade_stats is not None:
+            astats.cascade_stats.merge(result.cascade_stats)
+
+    # ワーカーで新しく計算した判定結果は、メインプロセスでまとめて保存する
+    if analyze.feature_store is not None:
+        astats.cnt_cache_replay = sum(result.cnt_cache_replay for result in results) + analyze.feature_store.cnt_replay
+        for result in results:
+            analyze.feature_store.merge(result.cache_entries)
+
+    if out is not None:
+        print(f'区間の結合完了（逐次解析 {cnt_serial} フレーム）', file=out)
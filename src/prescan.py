@@ -0,0 +1,221 @@
+"""事前走査（動画全体を粗い間隔で走査し、画面が変化していない区間を求める）
+
+1回目の走査では、一定間隔のフレームから安い特徴（暗転判定の範囲の平均輝度、フラッグの帯・
+キャラクター選択画面の帯の縮小画像）だけを求める。特徴が変わらない区間は、区間の最初のフレームの
+判定結果をそのまま使えるので、2回目の解析（状態遷移）では特徴が変わった区間とその前後だけ
+フレームを読み込んで判定する。
+
+判定結果の種類ごとに区間を求めるので、例えば試合中は背景が動いていても、フラッグの帯が変わらなければ
+フラッグの判定結果を使い回せる。
+"""
+import bisect
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import cv2
+import numpy as np
+
+from constants import Constants as C
+from roi_extractor import get_roi
+
+
+# 区間ごとに使い回す判定結果の種類
+PRESCAN_KEYS = ('flagstates', 'charaselect_maxval', 'blackout_mean')
+
+
+def get_signature(rois: dict) -> dict:
+    """フレームから切り出した範囲の安い特徴を求める
+
+    Args:
+        rois (dict): フレームから切り出した範囲（RoiExtractor.extract()）
+
+    Returns:
+        dict: 判定結果の種類（PRESCAN_KEYS）をキーとする特徴（numpy.ndarray、float32）
+    """
+    strip = np.concatenate((get_roi(rois, C.IMG_MATCH.AREA_FLAGS_L),
+                            get_roi(rois, C.IMG_MATCH.AREA_FLAGS_R)), axis=1)
+    band = get_roi(rois, C.IMG_MATCH.AREA_CHARASELECT)
+    # 暗転の判定に関係するのは暗い場合だけなので、明るさは DARK_LEVEL で頭打ちにする
+    mean = cv2.mean(get_roi(rois, C.IMG_MATCH.AREA_CHKBLACKOUT))[:3]
+
+    return {
+        'flagstates':         cv2.resize(strip, C.PRESCAN.FLAG_THUMB, interpolation=cv2.INTER_AREA).astype(np.float32),
+        'charaselect_maxval': cv2.resize(band, C.PRESCAN.CHARASEL_THUMB, interpolation=cv2.INTER_AREA).astype(np.float32),
+        'blackout_mean':      np.minimum(np.array(mean, dtype=np.float32), C.PRESCAN.DARK_LEVEL),
+    }
+
+
+def is_same(key: str, sig_a: np.ndarray, sig_b: np.ndarray) -> bool:
+    """2つのフレームの特徴が同じとみなせるかを判定
+
+    Args:
+        key (str): 判定結果の種類
+        sig_a (numpy.ndarray): 特徴
+        sig_b (numpy.ndarray): 特徴
+
+    Returns:
+        bool: 差が許容値以内ならTrue
+    """
+    tol = C.PRESCAN.DARK_TOL if key == 'blackout_mean' else C.PRESCAN.THUMB_TOL
+    return float(np.abs(sig_a - sig_b).max()) <= tol
+
+
+@dataclass
+class PreScanStats:
+    """事前走査の統計情報
+
+    Attributes:
+        interval (int): 走査した間隔（フレーム）
+        cnt_sample (int): 走査したフレーム数
+        elapsed (float): 走査にかかった時間（秒）
+        cnt_shared (int): 2回目の解析で、区間の判定結果を使ったフレーム数
+        quiet_frames (dict): 判定結果の種類をキーとする、判定結果を使い回せる区間のフレーム数の合計
+    """
+    interval: int = 0
+    cnt_sample: int = 0
+    elapsed: float = 0.0
+    cnt_shared: int = 0
+    quiet_frames: dict = None
+
+
+class _Stretch:
+    """特徴が変わらない区間（走査中）
+
+    Attributes:
+        start_fno (int): 区間の最初のフレーム番号
+        last_fno (int): 区間の最後に走査したフレーム番号
+        signature (numpy.ndarray): 区間の最初のフレームの特徴
+        features (FrameFeatures): 区間の最初のフレーム（判定結果を求めたら None）
+        value (object): 区間の最初のフレームの判定結果
+    """
+
+
+    def __init__(self, fno: int, signature: np.ndarray, features):
+        """コンストラクタ
+        """
+        self.start_fno = fno
+        self.last_fno = fno
+        self.signature = signature
+        self.features = features
+        self.value = None
+
+
+class PreScan:
+    """動画全体を粗い間隔で走査し、判定結果の種類ごとに特徴が変わらない区間を求めるクラス
+
+    区間の両端から margin フレームは、画面の切り替わりに近いので判定結果を使い回さない。
+
+    Attributes:
+        interval (int): 走査する間隔（フレーム）
+        margin (int): 区間の両端で判定結果を使い回さないフレーム数
+        done (bool): 走査が終わったか
+        stats (PreScanStats): 統計情報
+    """
+
+
+    def __init__(self, fps: float, interval: float = C.PRESCAN.INTERVAL, margin: float = C.PRESCAN.MARGIN):
+        """コンストラクタ
+
+        Args:
+            fps (float): 動画のフレームレート
+            interval (float): 走査する間隔（秒）
+            margin (float): 区間の両端で判定結果を使い回さない時間（秒）
+        """
+        self.interval = max(1, int(fps * interval))
+        self.margin = int(fps * margin)
+        self.done = False
+        self.stats = PreScanStats(self.interval, quiet_frames={key: 0 for key in PRESCAN_KEYS})
+        # 判定結果の種類ごとの、判定結果を使い回せる区間（開始・終了フレーム番号は昇順）
+        self._starts = {key: [] for key in PRESCAN_KEYS}
+        self._ends = {key: [] for key in PRESCAN_KEYS}
+        self._values = {key: [] for key in PRESCAN_KEYS}
+
+
+    def _close(self, key: str, stretch: _Stretch) -> None:
+        """走査中の区間を閉じ、判定結果を使い回せる範囲を登録する
+
+        Args:
+            key (str): 判定結果の種類
+            stretch (_Stretch): 区間
+        """
+        if stretch.features is not None:
+            # 1フレームしか走査していない区間は、使い回さない
+            return
+        start = stretch.start_fno + self.margin
+        end = stretch.last_fno - self.margin
+        if start > end:
+            return
+        self._starts[key].append(start)
+        self._ends[key].append(end)
+        self._values[key].append(stretch.value)
+        self.stats.quiet_frames[key] += end - start + 1
+
+
+    def run(self, analyze, on_sample: Callable[[int], bool] = None) -> bool:
+        """動画全体を走査する
+
+        Args:
+            analyze (AnalyzeVideo): file_open() 済みの動画解析クラス
+            on_sample (Callable[[int], bool]): フレームを走査する度にフレーム番号で呼ぶ関数。False を返すと中止
+
+        Returns:
+            bool: 最後まで走査したらTrue、中止したらFalse
+        """
+        start_time = time.perf_counter()
+        stretches = {}
+        fno = 0
+        completed = True
+        while fno < analyze.get_totalframes():
+            if on_sample is not None and not on_sample(fno):
+                completed = False
+                break
+            if not analyze.set_frame(fno, self.interval):
+                break
+            self.stats.cnt_sample += 1
+
+            start = time.perf_counter()
+            signature = get_signature(analyze.features.rois)
+            for key in PRESCAN_KEYS:
+                stretch = stretches.get(key)
+                if stretch is not None and is_same(key, stretch.signature, signature[key]):
+                    stretch.last_fno = fno
+                    if stretch.features is not None:
+                        # 2フレーム目で変わらなければ、区間の最初のフレームで判定する
+                        stretch.value = analyze.get_feature(stretch.features, key)
+                        stretch.features = None
+                else:
+                    if stretch is not None:
+                        self._close(key, stretch)
+                    stretches[key] = _Stretch(fno, signature[key], analyze.features)
+            analyze.stage_stats.add('prescan', time.perf_counter() - start)
+
+            # キーフレームの位置が分かっていれば、近くのキーフレームを走査する（シーク後すぐにデコードできる）
+            fno = analyze.snap_to_keyframe(fno + self.interval, self.interval // 2, fno + 1)
+
+        for key, stretch in stretches.items():
+            self._close(key, stretch)
+
+        self.done = completed
+        self.stats.elapsed = time.perf_counter() - start_time
+        return completed
+
+
+    def get_values(self, fno: int) -> dict:
+        """指定したフレームで使い回せる判定結果を返す
+
+        Args:
+            fno (int): フレーム番号
+
+        Returns:
+            dict: 判定結果の種類をキーとする判定結果（使い回せるものが無ければ空）
+        """
+        values = {}
+        for key in PRESCAN_KEYS:
+            i = bisect.bisect_right(self._starts[key], fno) - 1
+            if i >= 0 and fno <= self._ends[key][i]:
+                values[key] = self._values[key][i]
+        if values:
+            self.stats.cnt_shared += 1
+        return values
+
@@ -0,0 +1,155 @@
+"""解析したフレームの切り出した範囲と判定結果のキャッシュ（LRU、バイト数の上限付き）
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from frame_features import FrameFeatures
+
+
+# 1フレームあたりの、切り出した範囲以外の大きさの見積もり（バイト）
+ENTRY_OVERHEAD = 1024
+
+
+@dataclass
+class RoiCacheStats:
+    """キャッシュの統計情報
+
+    Attributes:
+        budget (int): バイト数の上限
+        hits (int): キャッシュにあったフレーム数
+        misses (int): キャッシュに無かったフレーム数
+        cnt_evict (int): 上限を超えたため捨てたフレーム数
+        peak_bytes (int): 使ったバイト数の最大値
+    """
+    budget: int = 0
+    hits: int = 0
+    misses: int = 0
+    cnt_evict: int = 0
+    peak_bytes: int = 0
+
+
+    def merge(self, other: 'RoiCacheStats') -> None:
+        """他のキャッシュ（並列解析のワーカーなど）の統計情報を加算する
+
+        Args:
+            other (RoiCacheStats): 加算する統計情報
+        """
+        self.hits += other.hits
+        self.misses += other.misses
+        self.cnt_evict += other.cnt_evict
+        self.peak_bytes = max(self.peak_bytes, other.peak_bytes)
+
+
+    def get_hit_rate(self) -> float:
+        """キャッシュにあった割合
+
+        Returns:
+            float: 割合（0.0～1.0）
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+
+class RoiCache:
+    """フレーム番号をキーとする FrameFeatures（切り出した範囲と判定結果）の LRU キャッシュ
+
+    フレーム全体ではなく、照合に使う範囲（RoiExtractor.extract()）だけを持つ。
+    使ったバイト数が budget を超えたら、最も長く使っていないフレームから捨てる。
+    バイト数は切り出した範囲の大きさに、判定結果などの分として ENTRY_OVERHEAD を足したもの。
+    保存済みの判定結果から作ったフレームは、範囲を後から読み込むことがあるので、
+    追加・取得の度に最近使ったフレームの大きさを数え直す。
+
+    Attributes:
+        budget (int): バイト数の上限
+        nbytes (int): 使っているバイト数
+        stats (RoiCacheStats): 統計情報
+    """
+
+
+    def __init__(self, budget: int):
+        """コンストラクタ
+
+        Args:
+            budget (int): バイト数の上限（0 ならキャッシュしない）
+        """
+        self.budget = budget
+        self.nbytes = 0
+        self.stats = RoiCacheStats(budget)
+        self._entries = OrderedDict()
+
+
+    def __len__(self) -> int:
+        """キャッシュにあるフレーム数
+        """
+        return len(self._entries)
+
+
+    def clear(self) -> None:
+        """キャッシュと統計情報を消去する
+        """
+        self._entries.clear()
+        self.nbytes = 0
+        self.stats = RoiCacheStats(self.budget)
+
+
+    def _remeasure_last(self) -> None:
+        """最近使ったフレームの大きさを数え直す（後から範囲を読み込んだ場合に備える）
+        """
+        if not self._entries:
+            return
+        frame_no, (features, size) = next(reversed(self._entries.items()))
+        new_size = features.get_nbytes() + ENTRY_OVERHEAD
+        if new_size != size:
+            self._entries[frame_no] = (features, new_size)
+            self.nbytes += new_size - size
+
+
+    def _evict(self) -> None:
+        """バイト数の上限を超えていれば、最も長く使っていないフレームから捨てる
+        """
+        while self.nbytes > self.budget and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            self.stats.cnt_evict += 1
+        self.stats.peak_bytes = max(self.stats.peak_bytes, self.nbytes)
+
+
+    def get(self, frame_no: int) -> FrameFeatures:
+        """キャッシュからフレームを取得する（最近使ったものにする）
+
+        Args:
+            frame_no (int): フレーム番号
+
+        Returns:
+            FrameFeatures: 切り出した範囲と判定結果（無ければ None）
+        """
+        self._remeasure_last()
+        entry = self._entries.get(frame_no)
+        if entry is None:
+            self.stats.misses += 1
+            self._evict()
+            return None
+
+        self._entries.move_to_end(frame_no)
+        self.stats.hits += 1
+        self._evict()
+        return entry[0]
+
+
+    def put(self, frame_no: int, features: FrameFeatures) -> None:
+        """フレームをキャッシュに追加する
+
+        Args:
+            frame_no (int): フレーム番号
+            features (FrameFeatures): 切り出した範囲と判定結果
+        """
+        self._remeasure_last()
+        old = self._entries.pop(frame_no, None)
+        if old is not None:
+            self.nbytes -= old[1]
+
+        size = features.get_nbytes() + ENTRY_OVERHEAD
+        if size <= self.budget:
+            self._entries[frame_no] = (features, size)
+            self.nbytes += size
+        self._evict()
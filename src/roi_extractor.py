@@ -0,0 +1,122 @@
+"""フレームから画像照合に使う範囲（ROI）だけを切り出す
+"""
+import cv2
+import numpy as np
+
+from constants import Constants as C
+
+
+class RoiExtractor:
+    """フレームから画像照合に使う範囲（ROI）だけを切り出すクラス
+
+    フレーム全体を 640×360 にリサイズする代わりに、元の解像度のフレームから
+    C.IMG_MATCH.ROI_AREAS の範囲だけを切り出して 640×360 基準の大きさにする。
+    元の解像度が 640×360 の整数倍なら、フレーム全体をリサイズしてから切り出した結果と一致する。
+
+    Attributes:
+        frame_size (tuple): 元のフレームの大きさ (幅, 高さ)
+        areas (tuple): 切り出す範囲のリスト（640×360 基準の (x, y, w, h)）
+    """
+
+
+    def __init__(self, frame_size: tuple, areas: tuple = C.IMG_MATCH.ROI_AREAS):
+        """コンストラクタ
+
+        フレームの大きさに合わせて、切り出す範囲を元の解像度に変換しておく
+
+        Args:
+            frame_size (tuple): 元のフレームの大きさ (幅, 高さ)
+            areas (tuple): 切り出す範囲のリスト（640×360 基準の (x, y, w, h)）
+        """
+        self.frame_size = frame_size
+        self.areas = areas
+
+        width, height = frame_size
+        base_w, base_h = C.IMG_MATCH.BASE_RESOLUTION[2:]
+        sx = width  / base_w
+        sy = height / base_h
+
+        self._plans = [self._make_plan(area, sx, sy) for area in areas]
+
+
+    def _make_plan(self, area: tuple, sx: float, sy: float) -> tuple:
+        """1つの範囲の切り出し方法を決める
+
+        Args:
+            area (tuple): 640×360 基準の範囲 (x, y, w, h)
+            sx (float): 横方向の倍率（元の幅 / 640）
+            sy (float): 縦方向の倍率（元の高さ / 360）
+
+        Returns:
+            tuple: (area, 切り出す元の範囲のスライス, 変換行列（リサイズで済む場合 None）)
+        """
+        x, y, w, h = area
+        width, height = self.frame_size
+
+        if sx == int(sx) and sy == int(sy):
+            # 整数倍なら、元の解像度で対応する範囲を切り出してリサイズすれば全体をリサイズしたのと一致する
+            sx, sy = int(sx), int(sy)
+            return area, (slice(y*sy, (y+h)*sy), slice(x*sx, (x+w)*sx)), None
+
+        # 整数倍でない場合は、周囲に余白を付けて切り出し、アフィン変換で同じ位置の画素を補間する
+        margin = 2
+        x0 = max(0, int((x - margin) * sx))
+        y0 = max(0, int((y - margin) * sy))
+        x1 = min(width,  int((x + w + margin) * sx) + 1)
+        y1 = min(height, int((y + h + margin) * sy) + 1)
+        matrix = np.array([
+            [sx, 0.0, (x + 0.5) * sx - 0.5 - x0],
+            [0.0, sy, (y + 0.5) * sy - 0.5 - y0],
+        ])
+        return area, (slice(y0, y1), slice(x0, x1)), matrix
+
+
+    def extract(self, frame) -> dict:
+        """フレームから範囲を切り出す
+
+        Args:
+            frame (numpy.ndarray): 元の解像度のフレーム
+
+        Returns:
+            dict: 範囲 (x, y, w, h) をキー、切り出した画像（640×360 基準の大きさ）を値とする連想配列
+        """
+        rois = {}
+        for area, (slice_y, slice_x), matrix in self._plans:
+            w, h = area[2:]
+            crop = frame[slice_y, slice_x]
+            if matrix is not None:
+                roi = cv2.warpAffine(crop, matrix, (w, h),
+                                     flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                                     borderMode=cv2.BORDER_REPLICATE)
+            elif crop.shape[1] == w and crop.shape[0] == h:
+                # 640×360 の動画はリサイズ不要。キャッシュにフレーム全体が残らないようコピーする
+                roi = crop.copy()
+            else:
+                roi = cv2.resize(crop, (w, h))
+            rois[area] = roi
+
+        return rois
+
+
+def get_roi(rois: dict, area: tuple):
+    """切り出した範囲の連想配列から、指定した範囲の画像を取得する
+
+    area が切り出した範囲のどれかに含まれていれば、その一部を返す
+
+    Args:
+        rois (dict): RoiExtractor.extract() の戻り値
+        area (tuple): 640×360 基準の範囲 (x, y, w, h)
+
+    Returns:
+        numpy.ndarray: 指定した範囲の画像
+    """
+    roi = rois.get(area)
+    if roi is not None:
+        return roi
+
+    x, y, w, h = area
+    for (rx, ry, rw, rh), roi in rois.items():
+        if rx <= x and ry <= y and x + w <= rx + rw and y + h <= ry + rh:
+            return roi[y-ry:y-ry+h, x-rx:x-rx+w]
+
+    raise ValueError(f'area {area} is not in ROI_AREAS')
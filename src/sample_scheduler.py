@@ -0,0 +1,240 @@
+"""解析するフレームの間隔の決定（状態ごとの継続時間を学習して予測する）
+"""
+from dataclasses import dataclass
+
+from constants import Constants as C
+
+
+# 継続時間を学習して間隔を延ばす状態（skip_key）。その他画面、試合終了後、暗転画面
+DURATION_KEYS = (0, 2, 5)
+
+# 1フラッグあたりの時間を学習して間隔を延ばす状態（skip_key）。試合中
+ROUND_KEYS = (4,)
+
+
+def get_base_skips(fps: float, refine: bool = False) -> dict:
+    """状態ごとの基本のスキップ間隔（フレーム）を返す
+
+    Args:
+        fps (float): 動画のフレームレート
+        refine (bool): 切り替わりを二分探索で求めるか（キャラクター選択画面・残り１フラッグも粗い間隔にする）
+
+    Returns:
+        dict[int, int]: skip_key をキーとするスキップ間隔
+    """
+    # 低フレームレートでもスキップ間隔が0にならないようにする
+    skips = {
+        1: max( 1, int( fps * C.PROC_SPD.INTVL_CHARASELECT ) ),
+        2: max( 1, int( fps * C.PROC_SPD.INTVL_MATCHFINISHED ) ),
+        3: max( 1, int( fps * C.PROC_SPD.INTVL_LASTONEFLAG ) ),
+        4: max( 1, int( fps * C.PROC_SPD.INTVL_MATCHSTARTED ) ),
+        5: max( 1, int( fps * C.PROC_SPD.INTVL_BLACKOUT ) ),
+        0: max( 1, int( fps * C.PROC_SPD.INTVL_OTHERS ) )
+    }
+    if refine:
+        # 切り替わりは二分探索で求めるので、細かい間隔で解析しなくてよい
+        skip_refine = max(1, int(fps * C.PROC_SPD.INTVL_REFINE))
+        skips[1] = skip_refine
+        skips[3] = skip_refine
+    return skips
+
+
+@dataclass
+class SchedulerStats:
+    """解析間隔の予測の統計情報
+
+    Attributes:
+        cnt_jump (int): 間隔を延ばした回数
+        cnt_hit (int): 延ばした先でも状態が変わっていなかった回数
+        cnt_skipped (int): 間隔を延ばしたため解析せずに済んだフレーム数（基本の間隔で数えた数）
+        sum_predicted (float): 間隔を延ばした際に予測した、状態が変わっていない確率の合計
+    """
+    cnt_jump: int = 0
+    cnt_hit: int = 0
+    cnt_skipped: int = 0
+    sum_predicted: float = 0.0
+
+
+    def get_hit_rate(self) -> float:
+        """延ばした先でも状態が変わっていなかった割合（実績）
+
+        Returns:
+            float: 割合（0.0～1.0）
+        """
+        return self.cnt_hit / self.cnt_jump if self.cnt_jump > 0 else 0.0
+
+
+    def get_predicted_rate(self) -> float:
+        """延ばした先でも状態が変わっていない確率の平均（予測）
+
+        Returns:
+            float: 確率（0.0～1.0）
+        """
+        return self.sum_predicted / self.cnt_jump if self.cnt_jump > 0 else 0.0
+
+
+class SampleScheduler:
+    """状態（skip_key）ごとに、次に解析するフレームまでの間隔を決めるクラス
+
+    基本は状態ごとの固定の間隔（skips）で解析する。predict が有効なら、解析しながら
+    状態ごとの継続時間（その他画面・試合終了後・暗転画面）と、試合中の1フラッグあたりの時間を学習し、
+    状態がしばらく変わらないと予測できる間は、基本の間隔の倍数に延ばす。
+    例えば試合中は、残りのフラッグ数から決着までの最短時間を見積もり、序盤は大きく飛ばす。
+
+    継続時間は、状態を最初に解析したフレームから最後に解析したフレームまで（実際より短めの値）とする。
+    延ばした先で状態が変わっていた場合（予測が外れた場合）は、呼び出し元が飛ばしたフレームから
+    基本の間隔で解析し直し、その状態が終わるまで間隔を延ばさない。
+
+    Attributes:
+        fps (float): 動画のフレームレート
+        skips (dict[int, int]): skip_key をキーとする基本のスキップ間隔（フレーム）
+        predict (bool): 学習した継続時間から間隔を延ばすか
+        stats (SchedulerStats): 統計情報
+        durations (dict[int, list[int]]): skip_key をキーとする、終わった状態の継続時間（フレーム）
+        rounds (list[float]): 試合中に1フラッグ増えるまでの時間（フレーム）
+        flag_total (int): 直前に解析したフレームの、左右の獲得フラッグ数の合計（試合中でなければ None）
+    """
+
+
+    def __init__(self, fps: float, refine: bool = False, predict: bool = False):
+        """コンストラクタ
+
+        Args:
+            fps (float): 動画のフレームレート
+            refine (bool): 切り替わりを二分探索で求めるか（get_base_skips()）
+            predict (bool): 学習した継続時間から間隔を延ばすか
+        """
+        self.fps = fps
+        self.skips = get_base_skips(fps, refine)
+        self.predict = predict
+        self.stats = SchedulerStats()
+        self.durations = {key: [] for key in DURATION_KEYS}
+        self.rounds = []
+        self.flag_total = None
+
+        self._key = None         # 直前に解析したフレームの状態
+        self._first_fno = None   # 状態を最初に解析したフレーム番号
+        self._last_fno = None    # 状態を最後に解析したフレーム番号
+        self._stable = False     # 直前に解析したフレームから間隔を延ばしてよいか
+        self._missed = False     # 今の状態で予測が外れたか
+        self._lead = 0           # 試合中の、左右の獲得フラッグ数の多い方
+        self._max_flags = 0      # 試合中の最大フラッグ数
+        self._flag_fno = None    # 今のフラッグ数の合計を最初に解析したフレーム番号
+        self._flag_last_fno = None  # 今のフラッグ数の合計を最後に解析したフレーム番号
+        self._predicted = None   # 間隔を延ばした際に予測した確率（確認待ちでなければ None）
+
+
+    def observe(self, frame_no: int, key: int, stable: bool, flags: tuple = None, max_flags: int = 0) -> None:
+        """解析したフレームの状態を記録し、継続時間・1フラッグあたりの時間を学習する
+
+        Args:
+            frame_no (int): 解析したフレーム番号
+            key (int): フレームの状態（skip_key）
+            stable (bool): このフレームから間隔を延ばしてよいか（状態が続いているか確認できる画面か）
+            flags (tuple[int, int]): 試合中なら左右の獲得フラッグ数（試合中でなければ None）
+            max_flags (int): 最大フラッグ数
+        """
+        if key != self._key:
+            if self._key in self.durations:
+                self.durations[self._key].append(self._last_fno - self._first_fno)
+            self._key = key
+            self._first_fno = frame_no
+            self._missed = False
+        self._last_fno = frame_no
+        self._stable = stable
+
+        if flags is None:
+            self.flag_total = None
+            return
+
+        total = sum(flags)
+        if self.flag_total is None or total < self.flag_total:
+            # 新しい試合
+            self._flag_fno = frame_no
+        elif total > self.flag_total:
+            # 前のフラッグ数を最初に解析したフレームから最後に解析したフレームまでを、1フラッグの時間（短めの値）とする
+            self.rounds.append((self._flag_last_fno - self._flag_fno) / (total - self.flag_total))
+            self._flag_fno = frame_no
+        self.flag_total = total
+        self._flag_last_fno = frame_no
+        self._lead = max(flags)
+        self._max_flags = max_flags
+
+
+    def _get_survival(self, samples: list, elapsed: float):
+        """継続時間の観測値から、状態が変わらない確率を求める関数を返す
+
+        Args:
+            samples (list[float]): 継続時間の観測値（フレーム）
+            elapsed (float): 状態が続いている時間（フレーム）
+
+        Returns:
+            Callable[[int], float]: あと何フレーム状態が変わらない確率を返す関数（観測数が足りなければ None）
+        """
+        alive = [d for d in samples if d >= elapsed]
+        if len(alive) < C.SCHEDULE.MIN_SAMPLES:
+            return None
+        return lambda span: sum(1 for d in alive if d >= elapsed + span) / len(alive)
+
+
+    def plan(self, frame_no: int) -> int:
+        """次に解析するまでの間隔を、基本の間隔の何倍にするかを返す
+
+        2倍以上にした場合は、次に解析したフレームで confirm() を呼ぶこと
+
+        Args:
+            frame_no (int): 直前に解析したフレーム番号
+
+        Returns:
+            int: 倍数（1 なら基本の間隔）
+        """
+        self._predicted = None
+        if not self.predict or not self._stable or self._missed:
+            return 1
+
+        key = self._key
+        if key in ROUND_KEYS:
+            # 決着までには、多い方があと (max_flags - lead) フラッグ獲得する必要がある
+            remaining = self._max_flags - self._lead
+            if remaining < 2 or self._flag_fno is None:
+                return 1
+            survival = self._get_survival([remaining * r for r in self.rounds], frame_no - self._flag_fno)
+        elif key in DURATION_KEYS:
+            survival = self._get_survival(self.durations[key], frame_no - self._first_fno)
+        else:
+            return 1
+        if survival is None:
+            return 1
+
+        skip = self.skips[key]
+        max_jump = max(1, int(self.fps * C.SCHEDULE.MAX_JUMP) // skip)
+        jump, predicted = 1, 1.0
+        for k in range(2, max_jump + 1):
+            p = survival(k * skip)
+            if p < C.SCHEDULE.MIN_CONFIDENCE:
+                break
+            jump, predicted = k, p
+
+        if jump > 1:
+            self._predicted = predicted
+            self.stats.cnt_jump += 1
+            self.stats.sum_predicted += predicted
+        return jump
+
+
+    def confirm(self, jump: int, hit: bool) -> None:
+        """間隔を延ばした先のフレームで、状態が変わっていなかったかを記録する
+
+        Args:
+            jump (int): plan() で返した倍数
+            hit (bool): 状態が変わっていなければTrue
+        """
+        if self._predicted is None:
+            return
+        self._predicted = None
+        if hit:
+            self.stats.cnt_hit += 1
+            self.stats.cnt_skipped += jump - 1
+        else:
+            # 飛ばしたフレームから解析し直すので、今の状態では延ばさない
+            self._missed = True
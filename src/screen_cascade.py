@@ -0,0 +1,259 @@
+"""画面判定（AnalyzeVideo.get_screen()）の事前判定と、事前判定を使うかの判断
+
+画面判定は、対戦画面（フラッグの色）→ キャラクター選択画面（テンプレート照合）→ 暗転画面（平均輝度）の順で、
+先に当てはまったものを結果とする。判定は互いに排他ではない（例えば暗転画面でも照合の結果は分からない）ので、
+後の判定を先に行っても、前の判定が当てはまらないことを確かめるまでは結果が決まらない。
+そのため判定の順序は変えず、最も時間のかかるキャラクター選択画面の照合（フラッグ・暗転の十数倍）の前に、
+安い事前判定（DirectMatcher）を置く。事前判定の値が閾値から十分離れていれば、照合を省く。
+
+事前判定で照合を省ける割合は、直前の画面によって異なる（例えば暗転画面の次は、範囲が一様で省けないことが多い）。
+直前の画面ごとに省けた割合（直前の画面から、省ける画面に移る確率）を数え、計測した事前判定・照合の時間と
+合わせて、事前判定した方が平均で速くなる場合だけ事前判定する。事前判定を使うかどうかで判定結果は変わらない。
+"""
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+
+from constants import Constants as C
+from stage_stats import StageStats, pad_text
+
+
+# 画面の表示名（表示順）
+SCREEN_LABELS = {
+    C.STAT.SCRN_MATCHVALID:   '試合成立後',
+    C.STAT.SCRN_MATCHINVALID: '試合開始後',
+    C.STAT.SCRN_CHARASELECT:  'キャラ選択',
+    C.STAT.SCRN_BLACKOUT:     '暗転画面',
+    C.STAT.SCRN_OTHERS:       'その他',
+}
+
+
+class DirectMatcher:
+    """照合する位置が少ない場合のテンプレート照合（cv2.TM_CCOEFF_NORMED と同じ値）を、直接計算するクラス
+
+    cv2.matchTemplate() はテンプレート画像が大きいと離散フーリエ変換で相関を求めるので、
+    キャラクター選択画面のように照合する位置が数か所しかない場合も時間がかかる。
+    ここでは、照合する位置（窓）ごとの画素値の平均・二乗和を積分画像から求め、
+    チャンネルごとの平均を引いたテンプレート画像との内積を直接計算する（倍精度のため、値はほぼ一致する）。
+
+    Attributes:
+        template_shape (tuple): テンプレート画像の (高さ, 幅)
+        roi_shape (tuple): 照合する範囲の画像の (高さ, 幅)
+    """
+
+
+    def __init__(self, template: np.ndarray, roi_shape: tuple):
+        """コンストラクタ
+
+        Args:
+            template (numpy.ndarray): テンプレート画像（グレースケール、カラー）
+            roi_shape (tuple): 照合する範囲の画像の (高さ, 幅)（テンプレート画像以上の大きさ）
+        """
+        self.template_shape = template.shape[:2]
+        self.roi_shape = tuple(roi_shape[:2])
+        th, tw = self.template_shape
+        h, w = self.roi_shape
+
+        # テンプレート画像の、チャンネルごとの平均を引いた画素値
+        tmpl = template.reshape(th, tw, -1).astype(np.float64)
+        tmpl -= tmpl.reshape(-1, tmpl.shape[2]).mean(axis=0)
+        self._tmpl_norm = np.sqrt((tmpl * tmpl).sum())
+        self._n_pixels = th * tw
+
+        # 窓の x ごとに、テンプレート画像を範囲の幅に広げて x だけずらしたもの（[範囲の th 行の画素, x]）
+        # 範囲の th 行分の画素（連続したメモリ）との積で、窓の x ごとの内積がまとめて求まる
+        n_channels = tmpl.shape[2]
+        shifted = np.zeros((w - tw + 1, th, w, n_channels))
+        for x in range(w - tw + 1):
+            shifted[x, :, x:x+tw] = tmpl
+        self._shifted = np.ascontiguousarray(shifted.reshape(w - tw + 1, -1).T)
+
+        # 積分画像（幅 w+1）での、窓ごとの四隅の位置（[右下, 右上, 左下, 左上]、[窓の y, 窓の x]）
+        ys = np.arange(h - th + 1)[:, np.newaxis]
+        xs = np.arange(w - tw + 1)[np.newaxis, :]
+        self._corners = tuple(y * (w + 1) + x for y, x in ((ys + th, xs + tw), (ys, xs + tw), (ys + th, xs), (ys, xs)))
+
+
+    def match(self, roi: np.ndarray) -> float:
+        """テンプレート画像と照合した信頼度最大値を求める
+
+        窓の画素値がほぼ一様な場合は、cv2.matchTemplate() の値が計算誤差で大きく振れるため求めない
+
+        Args:
+            roi (numpy.ndarray): 照合する範囲の画像（テンプレート画像と同じチャンネル数、uint8）
+
+        Returns:
+            float: 信頼度最大値（求めない場合は None）
+        """
+        if self._tmpl_norm == 0.0:
+            return None
+        th = self.template_shape[0]
+        n_channels = 1 if roi.ndim == 2 else roi.shape[2]
+
+        # 窓ごとの、チャンネルごとの平均を引いた二乗和
+        sums, sqsums = cv2.integral2(roi, sdepth=cv2.CV_32S, sqdepth=cv2.CV_64F)
+        sums = sums.reshape(-1, n_channels)
+        sqsums = sqsums.reshape(-1, n_channels)
+        c11, c01, c10, c00 = self._corners
+        totals = (sums[c11] - sums[c01] - sums[c10] + sums[c00]).astype(np.float64)
+        energy = ((sqsums[c11] - sqsums[c01] - sqsums[c10] + sqsums[c00]).sum(axis=-1)
+                  - (totals * totals).sum(axis=-1) / self._n_pixels)
+        if energy.min() < C.CASCADE.GATE_MIN_VAR * self._n_pixels:
+            return None
+
+        # テンプレート画像は平均を引いてあるので、窓の平均を引かずに内積を求めてよい
+        pixels = roi.reshape(roi.shape[0], -1).astype(np.float64)
+        corr = np.stack([pixels[y:y+th].reshape(-1) @ self._shifted for y in range(energy.shape[0])])
+        return float((corr / (self._tmpl_norm * np.sqrt(energy))).max())
+
+
+@dataclass
+class CascadeStats:
+    """画面判定の事前判定の統計情報（直前に判定した画面ごと）
+
+    Attributes:
+        gate_calls (dict): 直前の画面をキーとする、事前判定した回数
+        gate_resolved (dict): 直前の画面をキーとする、事前判定で結果が決まり照合を省いた回数
+        gate_bypassed (dict): 直前の画面をキーとする、省ける見込みが低いため事前判定せずに照合した回数
+        transitions (dict): 直前の画面をキーとする、{判定した画面: 回数}
+    """
+    gate_calls: dict = field(default_factory=dict)
+    gate_resolved: dict = field(default_factory=dict)
+    gate_bypassed: dict = field(default_factory=dict)
+    transitions: dict = field(default_factory=dict)
+
+
+    def merge(self, other: 'CascadeStats') -> None:
+        """他の統計情報（並列解析のワーカーなど）を加算する
+
+        Args:
+            other (CascadeStats): 加算する統計情報
+        """
+        for mine, theirs in ((self.gate_calls, other.gate_calls), (self.gate_resolved, other.gate_resolved),
+                             (self.gate_bypassed, other.gate_bypassed)):
+            for screen, count in theirs.items():
+                mine[screen] = mine.get(screen, 0) + count
+        for prev, counts in other.transitions.items():
+            mine = self.transitions.setdefault(prev, {})
+            for screen, count in counts.items():
+                mine[screen] = mine.get(screen, 0) + count
+
+
+    def get_resolved_rate(self, prev: str) -> float:
+        """直前の画面が prev の場合に、事前判定で照合を省けた割合（回数が少ない間は 1/2 に寄せた値）
+
+        Args:
+            prev (str): 直前の画面
+
+        Returns:
+            float: 割合（0.0～1.0）
+        """
+        return (self.gate_resolved.get(prev, 0) + 1) / (self.gate_calls.get(prev, 0) + 2)
+
+
+    def get_result(self) -> str:
+        """統計情報（statistics.txt）に書き込む文字列を返す
+
+        Returns:
+            str: 直前の画面ごとの、事前判定の回数・照合を省いた割合・次の画面がキャラクター選択画面だった割合
+        """
+        text  = 'キャラ選択の事前判定（直前の画面ごと）\n'
+        text += pad_text('', 12) + ''.join(pad_text(head, width, right=True) for head, width in
+                                           (('事前判定', 10), ('照合省略', 10), ('不使用', 10), ('次がキャラ選択', 16))) + '\n'
+        for prev, label in SCREEN_LABELS.items():
+            calls = self.gate_calls.get(prev, 0)
+            counts = self.transitions.get(prev, {})
+            if calls == 0 and prev not in self.gate_bypassed and not counts:
+                continue
+            rate = self.gate_resolved.get(prev, 0) / calls * 100 if calls > 0 else 0.0
+            to_charaselect = counts.get(C.STAT.SCRN_CHARASELECT, 0) / max(sum(counts.values()), 1) * 100
+            text += (f'{pad_text(label, 12)}{calls:10d}{rate:9.1f}%{self.gate_bypassed.get(prev, 0):10d}'
+                     f'{to_charaselect:15.1f}%\n')
+        return text.rstrip('\n')
+
+
+class ScreenCascade:
+    """直前の画面と計測した時間から、キャラクター選択画面の照合の前に事前判定するかを決めるクラス
+
+    直前の画面が prev のとき、事前判定で照合を省ける割合を p、事前判定・照合の1回あたりの時間を
+    t_gate・t_match とすると、p × t_match > t_gate なら事前判定する。時間は StageStats の
+    'charaselect_gate'・'charaselect_match' の計測値を使い、計測値が無い間は事前判定する。
+    事前判定しない状態でも、省ける割合の変化を捉えるため、C.CASCADE.EXPLORE 回に1回は事前判定する。
+
+    Attributes:
+        stages (StageStats): 事前判定・照合の時間の計測値
+        stats (CascadeStats): 統計情報
+        prev_screen (str): 直前に判定した画面
+    """
+
+
+    def __init__(self, stages: StageStats = None):
+        """コンストラクタ
+
+        Args:
+            stages (StageStats): 事前判定・照合の時間の計測値（None なら常に事前判定する）
+        """
+        self.stages = stages
+        self.stats = CascadeStats()
+        self.prev_screen = C.STAT.SCRN_OTHERS
+        self._skipped = {}  # 直前の画面をキーとする、続けて事前判定しなかった回数
+
+
+    def _get_cost(self, stage: str) -> float:
+        """段階の1回あたりの時間
+
+        Args:
+            stage (str): 段階名
+
+        Returns:
+            float: 時間（秒、計測値が無ければ None）
+        """
+        count = self.stages.counts.get(stage, 0) if self.stages is not None else 0
+        return self.stages.times[stage] / count if count > 0 else None
+
+
+    def use_gate(self) -> bool:
+        """キャラクター選択画面の照合の前に、事前判定するかを判断する
+
+        Returns:
+            bool: 事前判定するならTrue（結果を record_gate() で記録すること）
+        """
+        cost_gate = self._get_cost('charaselect_gate')
+        cost_match = self._get_cost('charaselect_match')
+        if cost_gate is None or cost_match is None:
+            return True
+        prev = self.prev_screen
+        if self.stats.get_resolved_rate(prev) * cost_match > cost_gate:
+            return True
+
+        skipped = self._skipped.get(prev, 0) + 1
+        if skipped >= C.CASCADE.EXPLORE:
+            self._skipped[prev] = 0
+            return True
+        self._skipped[prev] = skipped
+        self.stats.gate_bypassed[prev] = self.stats.gate_bypassed.get(prev, 0) + 1
+        return False
+
+
+    def record_gate(self, resolved: bool) -> None:
+        """事前判定の結果を記録する
+
+        Args:
+            resolved (bool): 事前判定で結果が決まり、照合を省いたならTrue
+        """
+        prev = self.prev_screen
+        self.stats.gate_calls[prev] = self.stats.gate_calls.get(prev, 0) + 1
+        if resolved:
+            self.stats.gate_resolved[prev] = self.stats.gate_resolved.get(prev, 0) + 1
+
+
+    def record_screen(self, screen: str) -> None:
+        """判定した画面を記録し、直前の画面にする
+
+        Args:
+            screen (str): 判定した画面
+        """
+        counts = self.stats.transitions.setdefault(self.prev_screen, {})
+        counts[screen] = counts.get(screen, 0) + 1
+        self.prev_screen = screen
@@ -0,0 +1,209 @@
+"""処理段階ごとの時間・回数の計測
+"""
+from dataclasses import dataclass, field
+
+
+# 処理段階の表示名（表示順）
+STAGE_LABELS = {
+    'seek':               'シーク',
+    'decode':             'デコード',
+    'retrieve':           '変換（BGR）',
+    'resize':             '切り出し・縮小',
+    'prescan':            '事前走査',
+    'flagstates':         'フラッグ（色）',
+    'blackout_mean':      '暗転',
+    'charaselect_maxval': 'キャラ選択',
+    'charaselect_gate':   '　事前判定',  # キャラ選択の内訳
+    'charaselect_match':  '　照合',      # キャラ選択の内訳
+    'charaname_L':        'キャラ名（左）',
+    'charaname_R':        'キャラ名（右）',
+}
+
+# シーク距離の分布で、後ろに戻ったシークのキー
+SEEK_BACKWARD = -1
+
+
+def get_seek_bucket(distance: int) -> int:
+    """シーク距離の分布の区間を返す
+
+    Args:
+        distance (int): シーク前の位置からの距離（フレーム）
+
+    Returns:
+        int: 区間の上限（2の累乗）。後ろに戻った場合は SEEK_BACKWARD
+    """
+    if distance < 0:
+        return SEEK_BACKWARD
+    return 1 << max(distance - 1, 0).bit_length()
+
+
+def pad_text(text: str, width: int, right: bool = False) -> str:
+    """全角文字を半角2桁として、文字列を指定した桁数に揃える
+
+    Args:
+        text (str): 文字列
+        width (int): 桁数
+        right (bool): 右寄せにするか
+
+    Returns:
+        str: 揃えた文字列
+    """
+    pad = ' ' * max(width - sum(2 if ord(c) > 0xff else 1 for c in text), 0)
+    return pad + text if right else text + pad
+
+
+@dataclass
+class StageStats:
+    """処理段階ごとの時間・回数
+
+    FrameSource（シーク・デコード）、AnalyzeVideo（切り出し）、FrameFeatures（判定ごと）が記録する。
+    記録は time.perf_counter() の差分を足すだけなので、解析速度にはほぼ影響しない。
+    先読み中はデコード・切り出しをデコード用スレッドで記録するが、解析側とは別の段階なので競合しない。
+
+    Attributes:
+        times (dict): 段階名をキーとする合計時間（秒）
+        counts (dict): 段階名をキーとする回数
+        hits (dict): 判定結果の種類をキーとする、計算済みの値を再利用した回数
+        cnt_grab (int): デコードしたフレーム数（読み進めで読み捨てた分を含み、シーク時の内部のデコードは含まない）
+        cnt_seek (int): シークした回数
+        seek_hist (dict): シーク距離の分布。区間の上限（get_seek_bucket()）をキーとする回数
+    """
+    times: dict = field(default_factory=dict)
+    counts: dict = field(default_factory=dict)
+    hits: dict = field(default_factory=dict)
+    cnt_grab: int = 0
+    cnt_seek: int = 0
+    seek_hist: dict = field(default_factory=dict)
+
+
+    def add(self, stage: str, elapsed: float, count: int = 1) -> None:
+        """段階の時間・回数を加算する
+
+        Args:
+            stage (str): 段階名
+            elapsed (float): 時間（秒）
+            count (int): 回数
+        """
+        self.times[stage] = self.times.get(stage, 0.0) + elapsed
+        self.counts[stage] = self.counts.get(stage, 0) + count
+
+
+    def add_hit(self, key: str) -> None:
+        """計算済みの判定結果を再利用した回数を加算する
+
+        Args:
+            key (str): 判定結果の種類
+        """
+        self.hits[key] = self.hits.get(key, 0) + 1
+
+
+    def add_seek(self, distance: int, elapsed: float) -> None:
+        """シークの時間・距離を記録する
+
+        Args:
+            distance (int): シーク前の位置からの距離（フレーム）
+            elapsed (float): 時間（秒）
+        """
+        self.add('seek', elapsed)
+        self.cnt_seek += 1
+        bucket = get_seek_bucket(distance)
+        self.seek_hist[bucket] = self.seek_hist.get(bucket, 0) + 1
+
+
+    def merge(self, other: 'StageStats') -> None:
+        """他の計測結果（並列解析のワーカーなど）を加算する
+
+        Args:
+            other (StageStats): 加算する計測結果
+        """
+        for stage, elapsed in other.times.items():
+            self.add(stage, elapsed, other.counts.get(stage, 0))
+        for key, count in other.hits.items():
+            self.hits[key] = self.hits.get(key, 0) + count
+        for bucket, count in other.seek_hist.items():
+            self.seek_hist[bucket] = self.seek_hist.get(bucket, 0) + count
+        self.cnt_grab += other.cnt_grab
+        self.cnt_seek += other.cnt_seek
+
+
+    @staticmethod
+    def get_label(stage: str) -> str:
+        """段階の表示名を、全角7文字（半角14桁）に揃えて返す
+
+        Args:
+            stage (str): 段階名
+
+        Returns:
+            str: 表示名
+        """
+        return pad_text(STAGE_LABELS.get(stage, stage), 14)
+
+
+    def get_stages(self) -> list:
+        """記録のある段階名を表示順に返す
+
+        Returns:
+            list[str]: 段階名のリスト
+        """
+        stages = [stage for stage in STAGE_LABELS if stage in self.counts or stage in self.hits]
+        return stages + sorted(set(self.counts) - set(stages))
+
+
+    def to_dict(self) -> dict:
+        """JSON に書き込める形式に変換する
+
+        Returns:
+            dict: 計測結果
+        """
+        return {
+            'stages': {stage: {'count': self.counts.get(stage, 0),
+                               'time':  round(self.times.get(stage, 0.0), 6),
+                               'hit':   self.hits.get(stage, 0)} for stage in self.get_stages()},
+            'cnt_grab': self.cnt_grab,
+            'cnt_seek': self.cnt_seek,
+            'seek_hist': {str(bucket): count for bucket, count in sorted(self.seek_hist.items())},
+        }
+
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'StageStats':
+        """to_dict() の形式から復元する
+
+        Args:
+            data (dict): to_dict() の戻り値
+
+        Returns:
+            StageStats: 計測結果
+        """
+        stats = cls(cnt_grab=data['cnt_grab'], cnt_seek=data['cnt_seek'],
+                    seek_hist={int(bucket): count for bucket, count in data['seek_hist'].items()})
+        for stage, values in data['stages'].items():
+            if values['count'] > 0:
+                stats.add(stage, values['time'], values['count'])
+            if values['hit'] > 0:
+                stats.hits[stage] = values['hit']
+        return stats
+
+
+    def get_result(self) -> str:
+        """統計情報（statistics.txt）に書き込む文字列を返す
+
+        Returns:
+            str: 処理段階ごとの時間・回数、シーク距離の分布
+        """
+        text  =  '処理段階ごとの時間\n'
+        text += pad_text('', 14) + ''.join(pad_text(head, 10, right=True) for head in ('回数', '合計(秒)', 'ms/回', '再利用')) + '\n'
+        for stage in self.get_stages():
+            count = self.counts.get(stage, 0)
+            elapsed = self.times.get(stage, 0.0)
+            per = elapsed / count * 1000 if count > 0 else 0.0
+            text += f'{self.get_label(stage)}{count:10d}{elapsed:10.2f}{per:10.3f}{self.hits.get(stage, 0):10d}\n'
+
+        text += f'シーク　　：{self.cnt_seek:7d} 回'
+        if self.seek_hist:
+            hist = []
+            for bucket, count in sorted(self.seek_hist.items()):
+                hist.append(f'戻り {count}' if bucket == SEEK_BACKWARD else f'≦{bucket} {count}')
+            text += '（距離 ' + '、'.join(hist) + '）'
+
+        return text
@@ -0,0 +1,387 @@
+"""ベンチマーク用の合成動画の生成
+
+リポジトリ内のテンプレート画像（matchtemplate/charaselect.png、name_l、name_r）と、描画したフラッグ・暗転から、
+Hellish Quart の対戦動画に似た動画を生成する。試合の台本（ScriptMatch のリスト）から、期待するタイムスタンプも求める。
+
+使用例:
+    python src/benchmark.py synth out.mp4 --fps 60 --size 1920x1080 --script "Jan-Dynis:3:LRLL:1,Zera-Marie:2:RR"
+"""
+import os
+import random
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from constants import Constants as C
+
+
+@dataclass(frozen=True)
+class ScriptMatch:
+    """台本の1試合（リマッチを含む）
+
+    Attributes:
+        name_L (str): キャラクター名（左）
+        name_R (str): キャラクター名（右）
+        max_flags (int): 最大フラッグ数
+        rounds (str): フラッグを獲得した側の並び（'L' または 'R'）。どちらかが max_flags に達したら決着
+        rematches (int): 同じキャラクターでのリマッチの回数
+    """
+    name_L: str
+    name_R: str
+    max_flags: int
+    rounds: str
+    rematches: int = 0
+
+
+    def get_flags(self) -> tuple:
+        """決着時の獲得フラッグ数
+
+        Returns:
+            tuple: (左, 右)
+        """
+        return self.rounds.count('L'), self.rounds.count('R')
+
+
+@dataclass
+class SceneLengths:
+    """合成動画の各画面の長さ（秒）
+    """
+    opening: float = 5     # 動画の最初のその他画面
+    cursor: float = 1      # キャラクター選択中（別のキャラクター名）の画面。2回表示する
+    charaselect: float = 4 # キャラクター決定後のキャラクター選択画面
+    loading: float = 3     # 暗転後、対戦画面までのその他画面
+    intro: float = 8       # 対戦画面でフラッグを獲得する前
+    round: float = 6       # フラッグを1つ獲得するごと
+    blackout: float = 1    # 暗転
+    result: float = 2      # 決着後のその他画面
+    ending: float = 4      # 動画の最後のその他画面
+
+
+@dataclass
+class ExpectedMatch:
+    """合成動画で期待する試合結果
+
+    Attributes:
+        fno_match (int): 対戦画面が始まるフレーム番号
+        fno_finish (int): 決着するフレーム番号
+        name_L (str): キャラクター名（左）
+        name_R (str): キャラクター名（右）
+        flags_L (int): 左プレイヤー獲得フラッグ数
+        flags_R (int): 右プレイヤー獲得フラッグ数
+    """
+    fno_match: int
+    fno_finish: int
+    name_L: str
+    name_R: str
+    flags_L: int
+    flags_R: int
+
+
+# 台本の既定値（gen_script() を使わない場合）
+DEFAULT_SCRIPT = 'Jan-Dynis:3:LRLL:1,Zera-Marie:2:RR,Hasan-Jacek:1:L'
+
+
+def parse_script(text: str) -> list:
+    """台本の文字列を解析する
+
+    'name_L-name_R:max_flags:rounds[:rematches]' をカンマ区切りで並べる。例: 'Jan-Dynis:3:LRLL:1,Zera-Marie:2:RR'
+
+    Args:
+        text (str): 台本の文字列
+
+    Returns:
+        list[ScriptMatch]: 台本
+
+    Raises:
+        ValueError: 書式が正しくない場合
+    """
+    script = []
+    for item in text.split(','):
+        fields = item.strip().split(':')
+        if len(fields) not in (3, 4) or '-' not in fields[0]:
+            raise ValueError(f'invalid script item: {item}')
+        name_L, name_R = fields[0].split('-', 1)
+        match = ScriptMatch(name_L, name_R, int(fields[1]), fields[2].upper(),
+                            int(fields[3]) if len(fields) == 4 else 0)
+
+        flags_L, flags_R = match.get_flags()
+        if ( set(match.rounds) - {'L', 'R'}
+          or max(flags_L, flags_R) != match.max_flags
+          or not 1 <= match.max_flags <= C.IMG_MATCH.MAX_FLAGS ):
+            raise ValueError(f'rounds must end when one side reaches max_flags: {item}')
+        script.append(match)
+
+    return script
+
+
+def gen_script(count: int, names: list, seed: int = 0) -> list:
+    """ランダムな台本を生成する
+
+    Args:
+        count (int): 試合数（リマッチを含まない）
+        names (list[str]): 使うキャラクター名
+        seed (int): 乱数の種
+
+    Returns:
+        list[ScriptMatch]: 台本
+    """
+    rng = random.Random(seed)
+    script = []
+    for _ in range(count):
+        max_flags = rng.choice([1, 2, 3, 5])
+        rounds = ''
+        while max(rounds.count('L'), rounds.count('R')) < max_flags:
+            rounds += rng.choice('LR')
+        script.append(ScriptMatch(rng.choice(names), rng.choice(names), max_flags, rounds,
+                                  rng.choice([0, 0, 1, 2])))
+    return script
+
+
+class SyntheticVideo:
+    """合成動画を生成するクラス
+
+    画面は 640x360（C.IMG_MATCH.BASE_RESOLUTION）で描画し、指定の解像度に拡大する。
+    背景は1フレームごとに動かし、エンコード・デコードの負荷を実際の動画に近づける。
+
+    Attributes:
+        fps (float): フレームレート
+        size (tuple): 解像度 (幅, 高さ)
+        codec (str): FourCC
+        gop (int): キーフレームの間隔（0 ならエンコーダーの既定値）
+        lengths (SceneLengths): 各画面の長さ
+        names (list[str]): 左右どちらのキャラクター名画像もあるキャラクター名
+    """
+
+
+    def __init__(self, fps: float = 30, size: tuple = (640, 360), codec: str = 'mp4v', gop: int = 0,
+                 lengths: SceneLengths = None, seed: int = 0):
+        """コンストラクタ（カレントディレクトリのテンプレート画像を読み込む）
+
+        Args:
+            fps (float): フレームレート
+            size (tuple): 解像度 (幅, 高さ)
+            codec (str): FourCC
+            gop (int): キーフレームの間隔（0 ならエンコーダーの既定値）
+            lengths (SceneLengths): 各画面の長さ
+            seed (int): 背景の乱数の種
+        """
+        self.fps = fps
+        self.size = size
+        self.codec = codec
+        self.gop = gop
+        self.lengths = lengths if lengths is not None else SceneLengths()
+
+        self._charaselect = cv2.imread(os.path.join(C.MATCH_TEMPLATE.DIR, C.MATCH_TEMPLATE.CHARASELECT))
+        if self._charaselect is None:
+            raise OSError(f'cannot read {C.MATCH_TEMPLATE.CHARASELECT}')
+        self._names_L = self._load_names(C.CHAR.NAMEDIR_L)
+        self._names_R = self._load_names(C.CHAR.NAMEDIR_R)
+        self.names = sorted(set(self._names_L) & set(self._names_R))
+
+        # 背景（横に2倍の幅のテクスチャを、フレームごとにずらして切り出す）
+        _, _, base_w, base_h = C.IMG_MATCH.BASE_RESOLUTION
+        rng = np.random.default_rng(seed)
+        texture = rng.integers(40, 90, (base_h // 4, base_w // 4, 3)).astype(np.uint8)
+        texture = cv2.resize(texture, (base_w, base_h), interpolation=cv2.INTER_LINEAR)
+        self._texture = np.concatenate([texture, texture], axis=1)
+
+
+    @staticmethod
+    def _load_names(image_dir: str) -> dict:
+        """キャラクター名画像（カラー）を読み込む
+
+        Args:
+            image_dir (str): キャラクター名画像のディレクトリ名
+
+        Returns:
+            dict: キャラクター名をキー、画像を値とする連想配列（同じ名前の画像が複数あれば最初のもの）
+        """
+        images = {}
+        for filename in sorted(os.listdir(image_dir)):
+            match = C.CHAR.PATTERN.match(filename)
+            if match and match.group(1) not in images:
+                image = cv2.imread(os.path.join(image_dir, filename))
+                if image is not None:
+                    images[match.group(1)] = image
+        return images
+
+
+    @staticmethod
+    def _paste(frame, image, area) -> None:
+        """画像を範囲の中央に貼り付ける（範囲からはみ出す部分は切り捨てる）
+        """
+        x, y, w, h = area
+        ih, iw = min(image.shape[0], h), min(image.shape[1], w)
+        x += (w - iw) // 2
+        y += (h - ih) // 2
+        frame[y:y+ih, x:x+iw] = image[:ih, :iw]
+
+
+    def _background(self, fno: int):
+        """その他画面（動く背景）
+        """
+        _, _, base_w, _ = C.IMG_MATCH.BASE_RESOLUTION
+        offset = (fno * 2) % base_w
+        return self._texture[:, offset:offset+base_w].copy()
+
+
+    def _draw_charaselect(self, fno: int, name_L: str, name_R: str):
+        """キャラクター選択画面
+        """
+        frame = self._background(fno)
+        self._paste(frame, self._charaselect, C.IMG_MATCH.AREA_CHARASELECT)
+        self._paste(frame, self._names_L[name_L], C.IMG_MATCH.AREA_CHARNAME_L)
+        self._paste(frame, self._names_R[name_R], C.IMG_MATCH.AREA_CHARNAME_R)
+        return frame
+
+
+    def _draw_match(self, fno: int, max_flags: int, flags_L: int, flags_R: int):
+        """対戦画面（画面上部にフラッグ）。獲得したフラッグは赤、それ以外は白
+        """
+        frame = self._background(fno)
+        frame[0:20, :] = (60, 40, 30)
+        _, y, w, h = (0,) + C.IMG_MATCH.AREA_FLAG_YWH
+        for i in range(max_flags):
+            x_L = C.IMG_MATCH.AREA_FLAG_XL + C.IMG_MATCH.AREA_FLAG_SPC * i
+            x_R = C.IMG_MATCH.AREA_FLAG_XR - C.IMG_MATCH.AREA_FLAG_SPC * i
+            frame[y:y+h, x_L:x_L+w] = (0, 0, 255) if i < flags_L else (255, 255, 255)
+            frame[y:y+h, x_R:x_R+w] = (0, 0, 255) if i < flags_R else (255, 255, 255)
+        return frame
+
+
+    def _draw_blackout(self, fno: int):
+        """暗転
+        """
+        _, _, base_w, base_h = C.IMG_MATCH.BASE_RESOLUTION
+        return np.zeros((base_h, base_w, 3), np.uint8)
+
+
+    def build_timeline(self, script: list):
+        """台本から、画面の並びと期待する試合結果を求める
+
+        Args:
+            script (list[ScriptMatch]): 台本
+
+        Returns:
+            list[tuple]: (描画関数, 引数, フレーム数) のリスト
+            list[ExpectedMatch]: 期待する試合結果
+        """
+        lengths = self.lengths
+        timeline = []
+        expected = []
+        fno = 0
+
+        def add(draw, args, seconds):
+            nonlocal fno
+            frames = int(seconds * self.fps)
+            timeline.append((draw, args, frames))
+            fno += frames
+
+        unknown = [name for match in script for name in (match.name_L, match.name_R) if name not in self.names]
+        if unknown:
+            raise ValueError(f'no name image: {", ".join(sorted(set(unknown)))}')
+
+        add(self._draw_background_scene, (), lengths.opening)
+        for match in script:
+            # 別のキャラクターにカーソルを合わせてから決定する
+            decoys = [name for name in self.names if name not in (match.name_L, match.name_R)] or self.names
+            for i in range(2):
+                add(self._draw_charaselect, (decoys[i % len(decoys)], decoys[-1 - i % len(decoys)]), lengths.cursor)
+            add(self._draw_charaselect, (match.name_L, match.name_R), lengths.charaselect)
+            add(self._draw_blackout, (), lengths.blackout)
+            add(self._draw_background_scene, (), lengths.loading)
+
+            for _ in range(match.rematches + 1):
+                fno_match = fno
+                flags_L = flags_R = 0
+                add(self._draw_match, (match.max_flags, 0, 0), lengths.intro)
+                for winner in match.rounds:
+                    flags_L += winner == 'L'
+                    flags_R += winner == 'R'
+                    if max(flags_L, flags_R) == match.max_flags:
+                        fno_finish = fno
+                    add(self._draw_match, (match.max_flags, flags_L, flags_R), lengths.round)
+                expected.append(ExpectedMatch(fno_match, fno_finish, match.name_L, match.name_R, flags_L, flags_R))
+                add(self._draw_blackout, (), lengths.blackout)
+                add(self._draw_background_scene, (), lengths.result)
+        add(self._draw_background_scene, (), lengths.ending)
+
+        return timeline, expected
+
+
+    def _draw_background_scene(self, fno: int):
+        """その他画面
+        """
+        return self._background(fno)
+
+
+    def write(self, path: str, script: list) -> list:
+        """台本どおりの動画を書き出す
+
+        Args:
+            path (str): 出力ファイルのパス
+            script (list[ScriptMatch]): 台本
+
+        Returns:
+            list[ExpectedMatch]: 期待する試合結果
+
+        Raises:
+            OSError: 動画を書き出せない場合
+        """
+        timeline, expected = self.build_timeline(script)
+
+        params = []
+        if self.gop > 0:
+            params += [cv2.VIDEOWRITER_PROP_KEY_INTERVAL, self.gop]
+        writer = cv2.VideoWriter(path, cv2.CAP_ANY, cv2.VideoWriter_fourcc(*self.codec), self.fps, self.size, params)
+        if not writer.isOpened():
+            raise OSError(f'cannot write {path} with codec {self.codec}')
+
+        fno = 0
+        try:
+            for draw, args, frames in timeline:
+                for _ in range(frames):
+                    frame = draw(fno, *args)
+                    if frame.shape[1::-1] != tuple(self.size):
+                        frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR)
+                    writer.write(frame)
+                    fno += 1
+        finally:
+            writer.release()
+
+        return expected
+
+
+def check_matches(matches: list, expected: list, fps: float, tolerance: float) -> list:
+    """解析結果の試合と、期待する試合結果を比較する
+
+    タイムスタンプ（試合開始時のフレーム番号）は、対戦画面が始まる3秒前から tolerance 秒以内のずれを許す
+
+    Args:
+        matches (list[MatchResult]): 解析結果の試合
+        expected (list[ExpectedMatch]): 期待する試合結果
+        fps (float): フレームレート
+        tolerance (float): 許容するずれ（秒）
+
+    Returns:
+        list[str]: 不一致の内容（一致すれば空）
+    """
+    errors = []
+    if len(matches) != len(expected):
+        errors.append(f'match count: {len(matches)} (expected {len(expected)})')
+
+    for i, (result, exp) in enumerate(zip(matches, expected), 1):
+        if (result.name_L, result.name_R) != (exp.name_L, exp.name_R):
+            errors.append(f'M{i:02d} names: {result.name_L} vs {result.name_R} '
+                          f'(expected {exp.name_L} vs {exp.name_R})')
+        if (result.flags_L, result.flags_R) != (exp.flags_L, exp.flags_R):
+            errors.append(f'M{i:02d} flags: {result.flags_L}:{result.flags_R} '
+                          f'(expected {exp.flags_L}:{exp.flags_R})')
+
+        # AnalyzeRunner.start_match() は検出したフレームの3秒前を試合開始とする
+        diff = (result.fno_startmatch - (exp.fno_match - int(fps * 3))) / fps
+        if not -1 / fps <= diff <= tolerance:
+            errors.append(f'M{i:02d} start: {diff:+.2f}s from expected')
+
+    return errors
@@ -0,0 +1,301 @@
+"""テンプレート画像（キャラクター名・キャラクター選択画面）のパック
+
+起動の度に画像を1枚ずつ読み込んで PNG を展開する代わりに、展開済みの画像をまとめた1つのファイルから読み込む。
+パックは、識別文字列・ヘッダー（JSON）の長さ・ヘッダー・全画像の画素を続けて並べたもので、
+1回の read() で読み込み、各画像は読み込んだバイト列をそのまま参照する（コピーしない）。
+
+使用例（画像を追加・変更したらパックを作り直す）:
+    python src/template_pack.py
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from constants import Constants as C
+
+
+# パックの先頭の識別文字列
+PACK_MAGIC = b'HQTPACK\0'
+
+# 識別文字列に続くヘッダーの長さの形式（リトルエンディアンの符号なし32ビット整数）
+HEADER_LENGTH = struct.Struct('<I')
+
+# 読み込んだテンプレート画像（get_templates() で1度だけ読み込む）
+_templates = None
+
+# 最後に get_templates() で読み込んだ方法（'pack' か 'images'）と時間（秒）
+load_info = {'source': None, 'time': 0.0}
+
+
+def load_name_images(image_dir: str) -> list:
+    """指定のディレクトリ内にあるキャラクター名画像をロード
+
+    Args:
+        image_dir (str): キャラクター名画像のディレクトリ名
+
+    Returns:
+        list: 以下のような連想配列のリスト
+        [
+            {'filename': 'hq10_Jan.png',   'image': <画像データ>, 'charname': 'Jan'},
+            {'filename': 'hq10_Dynis.png', 'image': <画像データ>, 'charname': 'Dynis'},
+            ...
+        ]
+    """
+    char_list = []
+
+    # ディレクトリ内のファイルを取得
+    for filename in os.listdir(image_dir):
+        match = C.CHAR.PATTERN.match(filename)
+        if match:
+            # キャラクター画像ファイル名が正規表現パターンにマッチした場合、リストに追加する
+            character_name = match.group(1)
+            file_path = os.path.join(image_dir, filename)
+            img = cv2.imread(file_path, C.CHAR.COLOR)
+
+            if img is not None:
+                char_list.append({
+                    'filename': filename,
+                    'image': img,
+                    'charname': character_name
+                })
+            else:
+                print(f"[WARN] 画像の読み込みに失敗: {file_path}")
+
+    return char_list
+
+
+def load_charaselect():
+    """キャラクター選択画面の画像をロード
+
+    Returns:
+        numpy.ndarray: キャラクター選択画面の画像
+    """
+    filepath_charasel = os.path.join(C.MATCH_TEMPLATE.DIR, C.MATCH_TEMPLATE.CHARASELECT)
+    return cv2.imread(filepath_charasel, C.MATCH_TEMPLATE.CHARASEL_COLOR)
+
+
+def load_images() -> dict:
+    """テンプレート画像を画像ファイルから読み込む
+
+    Returns:
+        dict: 'name_l'、'name_r'（load_name_images() の戻り値）、'charaselect'（画像）をキーとする連想配列
+    """
+    return {
+        'name_l': load_name_images(C.CHAR.NAMEDIR_L),
+        'name_r': load_name_images(C.CHAR.NAMEDIR_R),
+        'charaselect': load_charaselect(),
+    }
+
+
+def _get_colors() -> dict:
+    """パックに保存する画像の読み込み方法（カラー・グレースケール）
+
+    Returns:
+        dict: 画像の種類をキーとする cv2.imread() のフラグ
+    """
+    return {'name': int(C.CHAR.COLOR), 'charaselect': int(C.MATCH_TEMPLATE.CHARASEL_COLOR)}
+
+
+def _get_file_sizes(image_dir: str) -> dict:
+    """ディレクトリ内のキャラクター名画像のファイル名と大きさ
+
+    Args:
+        image_dir (str): キャラクター名画像のディレクトリ名
+
+    Returns:
+        dict: ファイル名をキーとするファイルの大きさ（バイト）
+    """
+    return {filename: os.path.getsize(os.path.join(image_dir, filename))
+            for filename in os.listdir(image_dir) if C.CHAR.PATTERN.match(filename)}
+
+
+def build_pack(pack_file: str = C.TEMPLATE_PACK.FILE) -> dict:
+    """テンプレート画像を画像ファイルから読み込み、パックを作る
+
+    Args:
+        pack_file (str): パックのファイルパス
+
+    Returns:
+        dict: 読み込んだテンプレート画像（load_images() の戻り値）
+    """
+    templates = load_images()
+    if templates['charaselect'] is None:
+        raise OSError(f'cannot read: {os.path.join(C.MATCH_TEMPLATE.DIR, C.MATCH_TEMPLATE.CHARASELECT)}')
+
+    images = [templates['charaselect']]
+    meta = {
+        'version': C.TEMPLATE_PACK.FORMAT_VERSION,
+        'colors': _get_colors(),
+        'charaselect_size': os.path.getsize(os.path.join(C.MATCH_TEMPLATE.DIR, C.MATCH_TEMPLATE.CHARASELECT)),
+    }
+    for key, image_dir in (('name_l', C.CHAR.NAMEDIR_L), ('name_r', C.CHAR.NAMEDIR_R)):
+        sizes = _get_file_sizes(image_dir)
+        meta[key] = []
+        for charadata in templates[key]:
+            images.append(charadata['image'])
+            meta[key].append({'filename': charadata['filename'], 'charname': charadata['charname'],
+                              'size': sizes[charadata['filename']]})
+
+    # 画素の位置は、画素の先頭からのオフセットと形状（charaselect、name_l、name_r の順）
+    offset = 0
+    meta['images'] = []
+    for image in images:
+        meta['images'].append({'offset': offset, 'shape': list(image.shape)})
+        offset += image.nbytes
+    header = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+
+    # 書き込み中に中断しても壊れたファイルが残らないよう、一時ファイルから置き換える
+    tmp_path = pack_file + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PACK_MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+        for image in images:
+            f.write(np.ascontiguousarray(image, dtype=np.uint8).tobytes())
+    os.replace(tmp_path, pack_file)
+    return templates
+
+
+def is_stale(meta: dict) -> bool:
+    """パックを作った後に、画像ファイルが追加・変更されたかを判定
+
+    画像のディレクトリが無い場合（パックだけを配布した場合）は、パックをそのまま使う
+
+    Args:
+        meta (dict): パックに保存した画像の情報
+
+    Returns:
+        bool: 画像ファイルとパックの内容が異なればTrue
+    """
+    for key, image_dir in (('name_l', C.CHAR.NAMEDIR_L), ('name_r', C.CHAR.NAMEDIR_R)):
+        if not os.path.isdir(image_dir):
+            continue
+        packed = {item['filename']: item['size'] for item in meta[key]}
+        if _get_file_sizes(image_dir) != packed:
+            return True
+
+    filepath_charasel = os.path.join(C.MATCH_TEMPLATE.DIR, C.MATCH_TEMPLATE.CHARASELECT)
+    if os.path.exists(filepath_charasel) and os.path.getsize(filepath_charasel) != meta['charaselect_size']:
+        return True
+
+    return False
+
+
+def load_pack(pack_file: str = C.TEMPLATE_PACK.FILE) -> dict:
+    """パックからテンプレート画像を読み込む
+
+    Args:
+        pack_file (str): パックのファイルパス
+
+    Returns:
+        dict: load_images() と同じ形式の連想配列（パックが無い、古い、または画像ファイルと異なれば None）
+    """
+    try:
+        # ファイル全体を1回で読み込む
+        with open(pack_file, 'rb') as f:
+            data = f.read()
+        if not data.startswith(PACK_MAGIC):
+            return None
+        pos = len(PACK_MAGIC)
+        (header_length,) = HEADER_LENGTH.unpack_from(data, pos)
+        pos += HEADER_LENGTH.size
+        meta = json.loads(data[pos:pos + header_length].decode('utf-8'))
+        pos += header_length
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if meta.get('version') != C.TEMPLATE_PACK.FORMAT_VERSION or meta.get('colors') != _get_colors():
+        return None
+    if is_stale(meta):
+        print(f'[WARN] テンプレート画像が {pack_file} と異なります。画像ファイルから読み込みます'
+              '（python src/template_pack.py で作り直せます）')
+        return None
+
+    # 読み込んだバイト列を、画像ごとの配列として参照する（読み取り専用）
+    images = [np.frombuffer(data, dtype=np.uint8, count=int(np.prod(item['shape'])), offset=pos + item['offset'])
+              .reshape(item['shape']) for item in meta['images']]
+
+    templates = {'charaselect': images[0]}
+    i = 1
+    for key in ('name_l', 'name_r'):
+        templates[key] = []
+        for item in meta[key]:
+            templates[key].append({'filename': item['filename'], 'image': images[i], 'charname': item['charname']})
+            i += 1
+    return templates
+
+
+def get_templates(pack_file: str = C.TEMPLATE_PACK.FILE) -> dict:
+    """テンプレート画像を取得する（パックがあればパックから、無ければ画像ファイルから読み込む）
+
+    2回目以降は1回目に読み込んだものを返す（CharNames と MatchTemplate で共有する）
+
+    Args:
+        pack_file (str): パックのファイルパス（None ならパックを使わない）
+
+    Returns:
+        dict: load_images() と同じ形式の連想配列
+    """
+    global _templates
+    if _templates is not None:
+        return _templates
+
+    start = time.perf_counter()
+    templates = load_pack(pack_file) if pack_file is not None else None
+    load_info['source'] = 'pack' if templates is not None else 'images'
+    if templates is None:
+        templates = load_images()
+    load_info['time'] = time.perf_counter() - start
+
+    _templates = templates
+    return templates
+
+
+def get_startup_text(elapsed: float) -> str:
+    """起動時間の表示文字列
+
+    Args:
+        elapsed (float): 起動にかかった時間（秒）
+
+    Returns:
+        str: 起動時間と、テンプレート画像の読み込み方法・時間
+    """
+    source = 'パック' if load_info['source'] == 'pack' else '画像ファイル'
+    return f'起動時間：  {elapsed:.2f} 秒（テンプレート画像 {source}から {load_info["time"] * 1000:.0f}ms）'
+
+
+def main(argv=None) -> int:
+    """パックを作り直す
+
+    Args:
+        argv (list[str]): コマンドライン引数。None なら sys.argv
+
+    Returns:
+        int: 終了コード
+    """
+    parser = argparse.ArgumentParser(description='テンプレート画像のパックを作り直す')
+    parser.add_argument('-o', '--output', default=None,
+                        help=f'パックのファイルパス（既定: リソースのディレクトリの {C.TEMPLATE_PACK.FILE}）')
+    parser.add_argument('--resource-dir', default=None,
+                        help='matchtemplate、name_l、name_r があるディレクトリ（既定: カレントディレクトリ）')
+    args = parser.parse_args(argv)
+
+    if args.resource_dir is not None:
+        if args.output is not None:
+            args.output = os.path.abspath(args.output)
+        os.chdir(args.resource_dir)
+    if args.output is None:
+        args.output = C.TEMPLATE_PACK.FILE
+
+    templates = build_pack(args.output)
+    print(f'{args.output}: キャラクター名画像 {len(templates["name_l"])}+{len(templates["name_r"])} 枚、'
+          f'キャラクター選択画面 1 枚')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
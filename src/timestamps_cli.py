@@ -0,0 +1,454 @@
+"""Hellish Quart 対戦動画タイムスタンプ抽出ツール（コマンドライン版）
+
+GUI（FreeSimpleGUI、tkinter）を使わずに動画を解析する。サーバーや cron での実行用。
+
+使用例:
+    python src/timestamps_cli.py video1.mp4 video2.mkv -o out/
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+from functools import partial
+
+# 起動時間の計測開始（重いモジュールの読み込み前）
+START_TIME = time.perf_counter()
+
+from constants import Constants as C
+from timestamps_output import TimestampsOutput
+from analyze_video import AnalyzeVideo
+from analyze_runner import AnalyzeRunner, init_analysis
+from parallel_analyze import analyze_parallel
+from checkpoint import AnalysisCheckpoint
+from event_sink import EventSink
+from frame_source import BACKEND_CHOICES, CvFrameSource, create_frame_source
+from template_pack import get_startup_text
+from batch_runner import BatchRunner, FileResult, VideoWatcher, expand_videos, get_worker_threads
+
+
+def format_output_name(name_format: str, file_path: str, date: datetime) -> str:
+    """出力ファイル名の書式から、ファイル名を生成する
+
+    Args:
+        name_format (str): 出力ファイル名の書式（{date}: 日付 YYYYMMDD、{stem}: 動画ファイル名（拡張子なし））
+        file_path (str): 動画ファイルのパス
+        date (datetime): {date} に埋め込む日付
+
+    Returns:
+        str: 出力ファイル名
+    """
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return name_format.format(date=date.strftime('%Y%m%d'), stem=stem)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """コマンドライン引数を解析する
+
+    Args:
+        argv (list[str]): コマンドライン引数。None なら sys.argv
+
+    Returns:
+        argparse.Namespace: 解析結果
+    """
+    parser = argparse.ArgumentParser(description='Hellish Quart の対戦動画からタイムスタンプを出力する')
+    parser.add_argument('videos', nargs='*', help='動画ファイルのパス（*.mp4 などのワイルドカードも使える）')
+    parser.add_argument('-o', '--output-dir', default='.',
+                        help='出力先ディレクトリ（既定: カレントディレクトリ）')
+    parser.add_argument('--timestamps-name', default='{date}' + C.OUTPUT_FILE,
+                        help='タイムスタンプ出力ファイル名。{date} {stem} が使える（既定: %(default)s）')
+    parser.add_argument('--stats-name', default='{date}' + C.STATIS_FILE,
+                        help='統計情報出力ファイル名。{date} {stem} が使える（既定: %(default)s）')
+    parser.add_argument('--summary-name', default='{date}' + C.BATCH.SUMMARY_FILE,
+                        help='複数の動画ファイルを解析した場合の、結果一覧の出力ファイル名。{date} が使える（既定: %(default)s）')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='複数の動画ファイルを並行して解析するプロセス数。CPU コアはプロセス間で分け合う（既定: %(default)s）')
+    parser.add_argument('--watch', default=None, metavar='DIR',
+                        help='フォルダを監視し、書き込みが終わった動画ファイルを順に解析する（Ctrl+C で終了）')
+    parser.add_argument('--watch-interval', type=float, default=C.BATCH.WATCH_INTERVAL,
+                        help='フォルダを確認する間隔（秒）。この間大きさが変わらなければ書き込みが終わったとみなす（既定: %(default)s）')
+    parser.add_argument('--compare-stats', nargs='?', const='', default=None, metavar='JSON',
+                        help='統計情報を前回の解析結果（統計情報の JSON ファイル）と比較する。'
+                             'ファイルを省略すると、上書きする前の同じ名前の JSON ファイルと比較する')
+    parser.add_argument('--progress-interval', type=float, default=1.0,
+                        help='進捗表示の最短間隔（秒）（既定: %(default)s）')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='1つの動画を区間に分けて並列に解析するプロセス数（既定: %(default)s）')
+    parser.add_argument('--overlap', type=float, default=C.PROC_SPD.PARALLEL_OVERLAP,
+                        help='並列解析で区間の前に重ねて解析する時間（秒）（既定: %(default)s）')
+    parser.add_argument('--backend', choices=BACKEND_CHOICES, default='any',
+                        help='OpenCV の動画読み込みバックエンド。pipe なら ffmpeg でデコード・縮小・間引きしたフレームを'
+                             'パイプで受け取る（既定: %(default)s）')
+    parser.add_argument('--decoder-threads', type=int, default=0,
+                        help='デコーダーのスレッド数。0 なら OpenCV の既定値（既定: %(default)s）')
+    parser.add_argument('--ffmpeg-options', default=None,
+                        help="FFmpeg のキャプチャオプション（'key;value|key;value' 形式）")
+    parser.add_argument('--read-strategy', choices=CvFrameSource.STRATEGIES, default='grab',
+                        help='近距離のフレームの読み進め方（既定: %(default)s）')
+    parser.add_argument('--no-seek-model', action='store_true',
+                        help='シーク・読み進めのコストを計測せず、固定の距離で切り替える')
+    parser.add_argument('--snap-keyframes', action='store_true',
+                        help='優先度の低い画面（その他・試合中）では、近くのキーフレームを解析する')
+    parser.add_argument('--refine', action='store_true',
+                        help='全ての画面を粗い間隔で解析し、画面の切り替わりを二分探索する（-j とは併用できない）')
+    parser.add_argument('--prescan', action='store_true',
+                        help='動画全体を粗い間隔で走査し、画面が変化した区間とその前後だけを詳しく解析する'
+                             '（-j・--refine・--resume・--follow とは併用できない）')
+    parser.add_argument('--predict', action='store_true',
+                        help='画面ごとの継続時間・1フラッグあたりの時間を解析しながら学習し、'
+                             'しばらく状態が変わらないと予測できる間は解析の間隔を延ばす（-j とは併用できない）')
+    parser.add_argument('--prefetch', type=int, default=None,
+                        help='デコード用スレッドで先読みするフレーム数の上限。0 なら先読みしない'
+                             f'（既定: CPU が複数なら {C.PROC_SPD.PREFETCH_DEPTH}、1つなら 0）')
+    parser.add_argument('--roi-cache-mb', type=float, default=C.PROC_SPD.ROI_CACHE_BYTES / (1 << 20),
+                        help='解析したフレームの切り出した範囲と判定結果をメモリに残す上限（MB）（既定: %(default)s）')
+    parser.add_argument('--cache-dir', default=C.CACHE.DIR,
+                        help='判定結果の保存先ディレクトリ。同じ動画を再解析する際にデコードを省く（既定: %(default)s）')
+    parser.add_argument('--no-cache', action='store_true', help='判定結果を保存・使用しない')
+    parser.add_argument('--resume', action='store_true',
+                        help='前回キャンセル・中断した解析の途中経過があれば、その続きから解析する（-j とは併用できない）')
+    parser.add_argument('--checkpoint-interval', type=float, default=C.CHECKPOINT.INTERVAL,
+                        help='途中経過を --cache-dir に保存する間隔（動画時間の秒）（既定: %(default)s）')
+    parser.add_argument('--no-checkpoint', action='store_true',
+                        help='途中経過を保存しない')
+    parser.add_argument('--follow', action='store_true',
+                        help='録画中の動画ファイルを追従して解析し、試合が決着する度にタイムスタンプを出力する。'
+                             f'ファイルが {C.PROC_SPD.FOLLOW_TIMEOUT} 秒大きくならなければ終了する'
+                             '（-j・--refine・--resume とは併用できない）')
+    parser.add_argument('--events', default=None, metavar='PATH',
+                        help="検出したイベント（キャラクター選択画面の終了・試合開始・リマッチ・獲得フラッグ数・決着など）を"
+                             "解析中に JSON Lines で出力するファイル。'-' なら標準出力")
+    parser.add_argument('--resource-dir', default=None,
+                        help='matchtemplate、name_l、name_r があるディレクトリ（既定: カレントディレクトリ）')
+    parser.add_argument('-q', '--quiet', action='store_true', help='進捗を表示しない')
+
+    args = parser.parse_args(argv)
+
+    args.videos = expand_videos(args.videos)
+    if not args.videos and args.watch is None:
+        parser.error('動画ファイルか --watch を指定してください')
+    if args.watch is not None and not os.path.isdir(args.watch):
+        parser.error(f'--watch のフォルダがありません: {args.watch}')
+
+    if args.workers > 1:
+        # ワーカーごとにさらにプロセスを起こしたり、1つの出力先に書き込んだりはしない
+        if args.jobs > 1 or args.events is not None:
+            parser.error('--workers は -j/--jobs・--events と併用できません')
+        # 進捗表示は混ざるので表示しない
+        args.quiet = True
+        if args.decoder_threads == 0:
+            args.decoder_threads = get_worker_threads(args.workers)
+
+    if args.prefetch is None:
+        # CPU が1つだとデコードと解析が重ならず、先読みの分だけ遅くなる
+        args.prefetch = C.PROC_SPD.PREFETCH_DEPTH if get_worker_threads(args.workers) > 1 else 0
+
+    if args.refine and args.jobs > 1:
+        # 区間の結合は解析したフレームごとの状態で行うため、二分探索とは組み合わせられない
+        parser.error('--refine は -j/--jobs と併用できません')
+
+    if args.prescan and (args.jobs > 1 or args.refine or args.resume or args.follow):
+        # 変化の無い区間の判定結果は、動画全体を走査した結果なので、区間並列・途中からの解析には使えない
+        parser.error('--prescan は -j/--jobs・--refine・--resume・--follow と併用できません')
+
+    if args.predict and args.jobs > 1:
+        # 区間ごとに学習した結果で解析するフレームが変わり、区間の状態が合流しなくなる
+        parser.error('--predict は -j/--jobs と併用できません')
+
+    if args.resume and args.jobs > 1:
+        # 途中経過は逐次解析の状態遷移なので、区間並列解析には引き継げない
+        parser.error('--resume は -j/--jobs と併用できません')
+    if args.resume and args.no_checkpoint:
+        parser.error('--resume は --no-checkpoint と併用できません')
+
+    if args.backend == 'pipe':
+        if shutil.which('ffmpeg') is None:
+            parser.error('--backend pipe には ffmpeg が必要です（PATH に見つかりません）')
+        if args.follow:
+            # 開いた時点のフレーム数しか分からないため、書き込み中のファイルは読めない
+            parser.error('--backend pipe は --follow と併用できません')
+
+    if args.follow:
+        # 書き込み中のファイルは前から順に読むだけで、区間に分けたり前に戻ったりできない
+        if args.jobs > 1 or args.refine or args.resume or args.workers > 1 or args.watch is not None:
+            parser.error('--follow は -j/--jobs・--refine・--resume・--workers・--watch と併用できません')
+        # 識別文字列が変わり続けるため、判定結果・途中経過は保存しない
+        args.no_cache = True
+        args.no_checkpoint = True
+
+    # 複数ファイルを処理する場合、出力ファイルが上書きされないよう動画ファイル名を付ける
+    if len(args.videos) > 1 or args.watch is not None:
+        if '{stem}' not in args.timestamps_name:
+            args.timestamps_name = '{stem}_' + args.timestamps_name
+        if '{stem}' not in args.stats_name:
+            args.stats_name = '{stem}_' + args.stats_name
+
+    return args
+
+
+def get_source_args(args: argparse.Namespace) -> dict:
+    """コマンドライン引数から create_frame_source() の引数を取得する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        dict: create_frame_source() の引数
+    """
+    return {
+        'backend':        args.backend,
+        'threads':        args.decoder_threads,
+        'ffmpeg_options': args.ffmpeg_options,
+        'strategy':       args.read_strategy,
+        'calibrate':      not args.no_seek_model,
+        'follow':         args.follow,
+    }
+
+
+def get_runner_args(args: argparse.Namespace) -> dict:
+    """コマンドライン引数から AnalyzeRunner のその他の引数を取得する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        dict: AnalyzeRunner のその他の引数
+    """
+    return {
+        'snap_keyframes': args.snap_keyframes,
+        'refine':         args.refine,
+        'prefetch':       args.prefetch,
+        'prescan':        args.prescan,
+        'predict':        args.predict,
+    }
+
+
+def analyze_file(analyze: AnalyzeVideo, file_path: str, args: argparse.Namespace,
+                 events: EventSink = None) -> FileResult:
+    """動画ファイル1件を解析し、結果をファイルに出力する
+
+    Args:
+        analyze (AnalyzeVideo): 動画解析クラス
+        file_path (str): 動画ファイルのパス
+        args (argparse.Namespace): コマンドライン引数
+        events (EventSink): 検出したイベントの出力先（None なら出力しない）
+
+    Returns:
+        FileResult: 解析結果（ok は解析が完了すればTrue）
+    """
+    err = sys.stderr
+    print(f'処理対象ファイル: {file_path}', file=err)
+
+    # 動画ファイルかを判定
+    try:
+        result = analyze.file_open(file_path)
+    except Exception as e:
+        analyze.file_close()
+        print(f'例外が発生しました。: {e}', file=err)
+        return FileResult(file_path, message=f'例外が発生しました。: {e}')
+    if result is False:
+        analyze.file_close()
+        print('動画ファイルではありません。', file=err)
+        return FileResult(file_path, message='動画ファイルではありません。')
+
+    video_data, astats = init_analysis(analyze, file_path)
+
+    # 途中経過の保存（区間並列解析では保存しない）
+    checkpoint = None
+    if args.jobs <= 1 and not args.no_checkpoint:
+        checkpoint = AnalysisCheckpoint(args.cache_dir, file_path)
+        if args.resume:
+            if checkpoint.restore(video_data, astats):
+                print(f'途中経過から再開：{video_data.ts_format(video_data.frame_no)}', file=err)
+            else:
+                print('途中経過がないため、最初から解析します。', file=err)
+
+    if events is not None:
+        events.start_video(file_path, astats.fps, astats.totalframes)
+
+    print(f'処理開始：{astats.starttime.strftime("%Y-%m-%d %H:%M:%S")}', file=err)
+    if astats.totalframes > 0:
+        print(f'動画時間：  {astats.get_timeofvideo()} / {astats.fps}fps', file=err)
+    else:
+        print(f'動画時間：  書き込み中 / {astats.fps}fps', file=err)
+    if hasattr(analyze.source, 'get_seek_model') and analyze.source.get_seek_model():
+        print(f'シーク：    {analyze.source.get_seek_model()}', file=err)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_file = os.path.join(args.output_dir, format_output_name(args.timestamps_name, file_path, astats.starttime))
+
+    def on_match(result) -> None:
+        """試合が決着する度に、タイムスタンプを標準出力とファイルに出力する（--follow）
+        """
+        if args.events != '-':
+            # 標準出力がイベント出力でなければ、タイムスタンプの行も出力する
+            sys.stdout.writelines(video_data.timestamps_text[-2:])
+            sys.stdout.flush()
+        TimestampsOutput(output_file).write(video_data.timestamps_text)
+
+    try:
+        if args.jobs > 1:
+            analyze_parallel(analyze, file_path, video_data, astats, args.jobs, args.overlap,
+                             out=None if args.quiet else err,
+                             source_args=get_source_args(args), runner_args=get_runner_args(args),
+                             cache_dir=analyze.cache_dir)
+            if events is not None:
+                # 区間並列解析では、結合後の試合結果だけを出力する
+                for match_no, match in enumerate(video_data.matches, 1):
+                    events.emit_match(match, match_no)
+        else:
+            runner = AnalyzeRunner(analyze, video_data, astats,
+                                   out=None if args.quiet else err,
+                                   progress_interval=args.progress_interval,
+                                   checkpoint=checkpoint,
+                                   checkpoint_interval=args.checkpoint_interval,
+                                   on_match=on_match if args.follow else None,
+                                   events=events,
+                                   **get_runner_args(args))
+            runner.run()
+    except Exception as e:
+        # 一括解析の残りの動画ファイルは続けて解析する（結果は失敗として一覧に出す）
+        print(f'\n例外が発生しました。: {e}', file=err)
+        return FileResult(file_path, message=f'例外が発生しました。: {e}')
+    finally:
+        analyze.file_close()
+
+    if events is not None:
+        events.end_video(video_data.frame_no, len(video_data.matches), video_data.is_cancel)
+
+    if video_data.totalframes <= 0:
+        # 書き込み中の動画は、最後に解析したフレームまでを動画時間とする
+        video_data.totalframes = astats.totalframes = video_data.frame_no + 1
+
+    ts_text = video_data.ts_format(video_data.totalframes)
+    print(f'\n進捗:100.0%({ts_text}) 解析完了', file=err)
+
+    # タイムスタンプの出力
+    astats.endtime = datetime.now()
+    output = TimestampsOutput(output_file)
+    output.write(video_data.timestamps_text)
+    print(f'タイムスタンプをファイルに書き込みました。: {output_file}', file=err)
+
+    # 処理結果、統計情報の出力
+    statis_file = os.path.join(args.output_dir, format_output_name(args.stats_name, file_path, astats.starttime))
+    astats_result = astats.get_result()
+    if args.compare_stats is not None:
+        # 上書きする前に、前回の統計情報を読み込む
+        prev_file = args.compare_stats or astats.get_json_path(statis_file)
+        prev_stats = astats.load_json(prev_file)
+        if prev_stats is not None:
+            astats_result += '\n\n' + astats.get_comparison(prev_stats)
+        else:
+            print(f'比較する統計情報を読み込めませんでした。: {prev_file}', file=err)
+    astats.write_stats(astats_result, statis_file)
+    print(f'{astats_result}\n', file=err)
+
+    return FileResult(file_path, True,
+                      cnt_matches=len(video_data.matches),
+                      video_seconds=astats.totalframes / astats.fps if astats.fps > 0 else 0.0,
+                      elapsed=(astats.endtime - astats.starttime).total_seconds(),
+                      timestamps_file=output_file,
+                      stats_file=statis_file)
+
+
+def create_analyze(args: argparse.Namespace) -> AnalyzeVideo:
+    """コマンドライン引数から動画解析クラスを作る（一括解析のワーカーでも使う）
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        AnalyzeVideo: 動画解析クラス
+    """
+    cache_dir = None if args.no_cache else args.cache_dir
+    return AnalyzeVideo(create_frame_source(**get_source_args(args)), cache_dir=cache_dir,
+                        roi_cache_bytes=int(args.roi_cache_mb * (1 << 20)))
+
+
+def main(argv=None) -> int:
+    """メイン関数
+
+    Args:
+        argv (list[str]): コマンドライン引数。None なら sys.argv
+
+    Returns:
+        int: 終了コード（全て成功なら0）
+    """
+    args = parse_args(argv)
+
+    if args.resource_dir is not None:
+        # 画像はカレントディレクトリからの相対パスで読み込むため、
+        # 入出力のパスを絶対パスにしてからリソースのディレクトリに移動する
+        args.videos = [os.path.abspath(video) for video in args.videos]
+        if args.watch is not None:
+            args.watch = os.path.abspath(args.watch)
+        args.output_dir = os.path.abspath(args.output_dir)
+        args.cache_dir = os.path.abspath(args.cache_dir)
+        if args.compare_stats:
+            args.compare_stats = os.path.abspath(args.compare_stats)
+        if args.events is not None and args.events != '-':
+            args.events = os.path.abspath(args.events)
+        os.chdir(args.resource_dir)
+
+    events = EventSink(args.events) if args.events is not None else None
+    runner = BatchRunner(partial(create_analyze, args), partial(analyze_file, args=args, events=events), args.workers)
+    if args.workers <= 1:
+        print(get_startup_text(time.perf_counter() - START_TIME), file=sys.stderr)
+
+    # 複数の動画ファイルを解析した場合は、結果の一覧も出力する
+    summary_file = None
+    if len(args.videos) > 1 or args.watch is not None:
+        os.makedirs(args.output_dir, exist_ok=True)
+        summary_file = os.path.join(args.output_dir, format_output_name(args.summary_name, '', runner.starttime))
+
+    watcher = VideoWatcher(args.watch) if args.watch is not None else None
+    if watcher is not None:
+        # 指定した動画ファイルと同じものは、監視で見つけても解析しない
+        watcher.seen.update(os.path.abspath(video) for video in args.videos)
+        print(f'フォルダを監視しています（Ctrl+C で終了）: {args.watch}', file=sys.stderr)
+
+    try:
+        for file_path in args.videos:
+            runner.submit(file_path)
+
+        while watcher is not None or not runner.is_idle():
+            if watcher is not None:
+                for file_path in watcher.poll():
+                    print(f'解析待ちに追加: {file_path}', file=sys.stderr)
+                    runner.submit(file_path)
+
+            results = runner.collect(args.watch_interval if watcher is not None else None)
+            for result in results:
+                if args.workers > 1:
+                    status = '解析完了' if result.ok else result.message
+                    print(f'{os.path.basename(result.file_path)}: {status}', file=sys.stderr)
+            if results and summary_file is not None:
+                runner.write_summary(summary_file)
+    except KeyboardInterrupt:
+        runner.close(cancel=True)
+        print('\nキャンセルされました。', file=sys.stderr)
+        if args.jobs <= 1 and not args.no_checkpoint:
+            print('途中経過を保存しました。--resume で続きから解析できます。', file=sys.stderr)
+        if summary_file is not None and runner.results:
+            runner.write_summary(summary_file)
+        return 130
+    finally:
+        runner.close()
+        if events is not None:
+            events.close()
+
+    if summary_file is not None:
+        runner.write_summary(summary_file)
+        print(f'{runner.get_summary()}\n', file=sys.stderr)
+        print(f'結果の一覧をファイルに書き込みました。: {summary_file}', file=sys.stderr)
+
+    failed = sum(1 for result in runner.results if not result.ok)
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    # PyInstaller でビルドした exe から並列解析のプロセスを起動するために必要
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -9,11 +9,16 @@ class TimestampsOutput:
     """
 
 
-    def __init__(self):
+    def __init__(self, output_file: str = None):
         """コンストラクタ
+
+        Args:
+            output_file (str): 出力ファイルのパス。省略時はカレントディレクトリの（日付）timestamps.txt
         """
-        output_dir = datetime.date.today().strftime('%Y%m%d')
-        self.output_file = output_dir + C.OUTPUT_FILE
+        if output_file is None:
+            output_dir = datetime.date.today().strftime('%Y%m%d')
+            output_file = output_dir + C.OUTPUT_FILE
+        self.output_file = output_file
 
         # 出力ファイルが既に存在しているなら削除
         if os.path.exists(self.output_file):